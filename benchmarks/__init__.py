@@ -0,0 +1,5 @@
+"""Benchmarks for Flask-Simon
+
+Run them with ``python -m benchmarks.run``. See ``benchmarks/README.rst``
+for details.
+"""
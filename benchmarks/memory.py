@@ -0,0 +1,134 @@
+"""An in-memory stand-in for a PyMongo collection
+
+Only the parts of the collection and cursor APIs that Simon and
+Flask-Simon use to find and insert documents are supported, and queries
+can only match fields by equality. This is enough to measure the
+overhead of the extension without a running mongod.
+"""
+
+import copy
+
+from bson.objectid import ObjectId
+
+
+class MemoryCollection(object):
+    """Holds documents in a list.
+
+    With ``max_documents``, the oldest documents are dropped to make room
+    for new ones, the same as a capped collection.
+    """
+
+    def __init__(self, documents=None, max_documents=None):
+        self.documents = list(documents or ())
+        self.max_documents = max_documents
+
+    def find(self, spec=None, fields=None):
+        matches = [d for d in self.documents if _matches(d, spec or {})]
+        return MemoryCursor(matches, fields)
+
+    def find_one(self, spec=None, fields=None):
+        for document in self.find(spec, fields):
+            return document
+        return None
+
+    def insert(self, doc_or_docs, **kwargs):
+        doc_or_docs.setdefault('_id', ObjectId())
+        self.documents.append(copy.deepcopy(doc_or_docs))
+        if self.max_documents is not None:
+            del self.documents[:-self.max_documents]
+        return doc_or_docs['_id']
+
+    def update(self, spec, document, upsert=False, **kwargs):
+        for i, existing in enumerate(self.documents):
+            if _matches(existing, spec):
+                self.documents[i] = copy.deepcopy(document)
+                return
+        if upsert:
+            self.insert(dict(document, **spec))
+
+
+class MemoryCursor(object):
+    """Iterates over the documents matched by a query."""
+
+    def __init__(self, documents, fields=None):
+        self._documents = documents
+        self._fields = fields
+        self._skip = 0
+        self._limit = 0
+        self._position = 0
+
+    def batch_size(self, batch_size):
+        return self
+
+    def clone(self):
+        cursor = MemoryCursor(self._documents, self._fields)
+        cursor._skip = self._skip
+        cursor._limit = self._limit
+        return cursor
+
+    def count(self, with_limit_and_skip=False):
+        if with_limit_and_skip:
+            return len(self._window())
+        return len(self._documents)
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def skip(self, skip):
+        self._skip = skip
+        return self
+
+    def sort(self, key_or_list, direction=None):
+        if direction is not None:
+            key_or_list = [(key_or_list, direction)]
+        for key, direction in reversed(key_or_list):
+            self._documents = sorted(self._documents,
+                                     key=lambda d: d.get(key),
+                                     reverse=direction < 0)
+        return self
+
+    def next(self):
+        window = self._window()
+        if self._position >= len(window):
+            raise StopIteration
+        document = window[self._position]
+        self._position += 1
+        return self._project(document)
+
+    __next__ = next
+
+    def _project(self, document):
+        document = copy.deepcopy(document)
+        if self._fields:
+            keep = set(k for k, v in self._fields.items() if v)
+            if keep:
+                keep.add('_id')
+                document = dict((k, v) for k, v in document.items()
+                                if k in keep)
+            else:
+                for key in self._fields:
+                    document.pop(key, None)
+        return document
+
+    def _window(self):
+        end = self._skip + self._limit if self._limit else None
+        return self._documents[self._skip:end]
+
+    def __getitem__(self, index):
+        return self._project(self._window()[index])
+
+    def __iter__(self):
+        return self
+
+
+def _matches(document, spec):
+    """Checks whether a document has all of the values in a spec."""
+
+    for key, value in spec.items():
+        if isinstance(value, dict) and '$in' in value:
+            if document.get(key) not in value['$in']:
+                return False
+        elif document.get(key) != value:
+            return False
+    return True
@@ -0,0 +1,175 @@
+"""Runs the benchmarks and compares them with a baseline
+
+Usage::
+
+    python -m benchmarks.run [--save] [--compare] [--baseline PATH]
+                             [--threshold PERCENT] [--number N]
+                             [--repeat N] [NAME ...]
+
+Each benchmark is timed ``--repeat`` times running ``--number`` calls,
+and the best time per call is reported. With ``--save``, the results
+are stored as the baseline for the current Python version. With
+``--compare``, they are compared against it, and the exit status is 1 if
+any benchmark is slower by more than ``--threshold`` percent.
+"""
+
+import json
+import optparse
+import os
+import platform
+import sys
+import timeit
+
+import flask
+import pymongo
+import simon
+
+import flask_simon
+
+from .suite import BENCHMARKS
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'baselines')
+
+
+def compare(results, baseline, threshold):
+    """Compares results with a baseline.
+
+    :returns: tuple -- the lines of the report and the names of the
+              benchmarks that are slower.
+    """
+
+    lines = ['{0:<24} {1:>12} {2:>12} {3:>9}'.format(
+        'benchmark', 'baseline', 'current', 'change')]
+    slower = []
+    for name, current in results:
+        before = baseline['results'].get(name)
+        if before is None:
+            lines.append('{0:<24} {1:>12} {2:>12.2f} {3:>9}'.format(
+                name, '-', current, 'new'))
+            continue
+
+        change = (current - before) / before * 100
+        flag = ''
+        if change > threshold:
+            flag = ' slower'
+            slower.append(name)
+        elif change < -threshold:
+            flag = ' faster'
+        lines.append('{0:<24} {1:>12.2f} {2:>12.2f} {3:>+8.1f}%{4}'.format(
+            name, before, current, change, flag))
+    return lines, slower
+
+
+def default_baseline():
+    """Returns the path of the baseline for the current Python."""
+
+    name = '{0}-{1}.{2}.json'.format(platform.python_implementation(),
+                                     *sys.version_info[:2])
+    return os.path.join(BASELINES, name.lower())
+
+
+def run(names=None, number=1000, repeat=5):
+    """Runs the benchmarks.
+
+    :returns: list -- ``(name, microseconds per call)`` pairs.
+    """
+
+    results = []
+    for name, setup in BENCHMARKS:
+        if names and name not in names:
+            continue
+
+        func, teardown = setup()
+        try:
+            if hasattr(func, 'repeat'):
+                # The benchmark times a single call in each run itself.
+                calls = 1
+                timings = func.repeat(repeat)
+            else:
+                calls = number
+                timings = timeit.Timer(func).repeat(repeat, number)
+        finally:
+            if teardown is not None:
+                teardown()
+
+        results.append((name, min(timings) / calls * 1000000))
+    return results
+
+
+def versions():
+    """Returns the versions of everything being measured."""
+
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'flask': flask.__version__,
+        'flask_simon': flask_simon.__version__,
+        'pymongo': pymongo.version,
+        'simon': getattr(simon, '__version__', None),
+    }
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options] [NAME ...]')
+    parser.add_option('--number', type='int', default=1000,
+                      help='calls to time in each run [default: %default]')
+    parser.add_option('--repeat', type='int', default=5,
+                      help='runs for each benchmark [default: %default]')
+    parser.add_option('--baseline', default=default_baseline(),
+                      help='the baseline file [default: %default]')
+    parser.add_option('--save', action='store_true',
+                      help='store the results as the baseline')
+    parser.add_option('--compare', action='store_true',
+                      help='compare the results with the baseline')
+    parser.add_option('--threshold', type='float', default=10.0,
+                      help='the percentage slower that counts as a '
+                           'regression [default: %default]')
+    options, names = parser.parse_args(argv)
+
+    results = run(names, options.number, options.repeat)
+
+    status = 0
+    if options.compare and os.path.exists(options.baseline):
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        lines, slower = compare(results, baseline, options.threshold)
+        print('Compared with {0} (Flask-Simon {1}, Simon {2}, Flask {3}, '
+              'PyMongo {4}):'.format(os.path.basename(options.baseline),
+                                     baseline['versions']['flask_simon'],
+                                     baseline['versions']['simon'],
+                                     baseline['versions']['flask'],
+                                     baseline['versions']['pymongo']))
+        if 'note' in baseline:
+            print(baseline['note'])
+        current = versions()
+        changed = sorted(k for k, v in baseline['versions'].items()
+                         if current.get(k) != v)
+        if changed:
+            print('The baseline was measured with different versions of: '
+                  '{0}.'.format(', '.join(changed)))
+        if slower:
+            status = 1
+    else:
+        if options.compare:
+            print('There is no baseline at {0}.'.format(options.baseline))
+        lines = ['{0:<24} {1:>12}'.format('benchmark', 'usec/call')]
+        lines.extend('{0:<24} {1:>12.2f}'.format(name, usec)
+                     for name, usec in results)
+
+    print('\n'.join(lines))
+
+    if options.save:
+        baseline = {'versions': versions(), 'results': dict(results)}
+        if not os.path.isdir(os.path.dirname(options.baseline)):
+            os.makedirs(os.path.dirname(options.baseline))
+        with open(options.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Saved the baseline to {0}.'.format(options.baseline))
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
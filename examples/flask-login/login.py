@@ -1,7 +1,7 @@
 from flask import Flask, redirect, render_template, request, url_for
 from flask.ext.login import (AnonymousUser, LoginManager, UserMixin,
                              login_required, login_user, logout_user)
-from flask.ext.simon import Simon, Model
+from flask.ext.simon import Simon, Model, UserLoader
 
 app = Flask(__name__)
 app.secret_key = 'Keep this value secret'
@@ -37,16 +37,9 @@ class User(Model, UserMixin):
         return 'id' not in self
 
 
-@login_manager.user_loader
-def load_user(id):
-    """Loads the user for Flask-Login"""
-
-    try:
-        user = User.get(id=id)
-    except User.NoDocumentFound:
-        return None
-    else:
-        return user
+# Load the user for Flask-Login, keeping it in memory for a short time so
+# that every request doesn't query the database.
+login_manager.user_loader(UserLoader(User, app, fields=('username',)))
 
 
 @app.route('/')
@@ -1,30 +1,397 @@
 __version__ = '0.4.0'
 
+from contextlib import contextmanager
+import copy
+import datetime
+from functools import wraps
+import logging
+import math
+import os
+import sys
+import threading
+import types
+import weakref
+try:
+    from urllib.parse import unquote_plus
+except ImportError:
+    # Python 2
+    from urllib import unquote_plus
+
+from bson import BSON
 from bson.errors import InvalidId
 from bson.objectid import ObjectId
-from flask import abort
-from pymongo import uri_parser
-# The following line is for convenience.
-from simon import Model, connection, geo, query  # NOQA
-from simon.exceptions import MultipleDocumentsFound, NoDocumentFound
+from flask import (Response, abort, current_app, g, has_request_context,
+                   make_response, request, session)
+try:
+    from flask import after_this_request, has_app_context
+except ImportError:
+    # Flask 0.8
+    after_this_request = None
+    has_app_context = has_request_context
+from pymongo import ASCENDING, DESCENDING, uri_parser, version_tuple
+from pymongo.collection import Collection
+from pymongo.errors import InvalidURI
+try:
+    # PyMongo 2.4+
+    from pymongo import MongoClient, MongoReplicaSetClient
+except ImportError:
+    from pymongo import (Connection as MongoClient,
+                         ReplicaSetConnection as MongoReplicaSetClient)
+from simon import Model as SimonModel
+# The following line is for convenience. geo is loaded lazily below.
+from simon import connection, query  # NOQA
+from simon.exceptions import (ConnectionError, MultipleDocumentsFound,
+                              NoDocumentFound)
+from simon.meta import Meta as SimonMeta
+from simon.query import Q, QuerySet
+from simon.utils import get_nested_key, guarantee_object_id, map_fields
 from werkzeug.routing import BaseConverter
 
-__all__ = ('Simon', 'get_or_404', 'Model', 'connection', 'geo', 'query')
+from .cache import (CountCache, DocumentCache, IdentityMap, ResponseCache,
+                    ResultCache)
+# Importing the conditional module later would replace conditional()
+# with it, so it's imported along with the rest of the core.
+from .conditional import (is_not_modified, make_etag, not_modified_response,
+                          set_validators)
+from .read_preferences import (get_read_preference, make_read_preference,
+                               read_preference)
+
+__all__ = ('FlushError', 'InefficientQuery', 'MongoSessionInterface', 'Page',
+           'Simon', 'TenantRegistry', 'UserLoader', 'abort_if_not_modified',
+           'aggregate', 'cached', 'conditional', 'ensure_indexes',
+           'get_count', 'get_identity_map', 'get_index_report', 'get_many',
+           'get_many_or_404', 'get_or_404', 'get_query_metrics',
+           'get_unit_of_work', 'paginate', 'paginate_offset',
+           'read_preference', 'run_concurrently', 'stream_aggregate',
+           'stream_json', 'stream_ndjson', 'Model', 'connection', 'geo',
+           'query')
+
+logger = logging.getLogger('flask_simon')
+
+# These are only imported when they're first used so that importing
+# Flask-Simon doesn't pay for features an app may not use. The values
+# are the module and the name of the attribute within it, or None for
+# the module itself.
+_lazy_attributes = {
+    'FlushError': ('flask_simon.unit_of_work', 'FlushError'),
+    'InefficientQuery': ('flask_simon.query_plans', 'InefficientQuery'),
+    'MongoSessionInterface': ('flask_simon.sessions', 'MongoSessionInterface'),
+    'TenantRegistry': ('flask_simon.tenants', 'TenantRegistry'),
+    'UserLoader': ('flask_simon.login', 'UserLoader'),
+    'geo': ('simon.geo', None),
+    'get_query_metrics': ('flask_simon.monitoring', 'get_query_metrics'),
+    'run_concurrently': ('flask_simon.concurrency', 'run_concurrently'),
+}
+
+# Collections can estimate their counts from their metadata starting with
+# PyMongo 3.7.
+supports_estimated_count = hasattr(Collection, 'estimated_document_count')
+
+# Starting with PyMongo 3.0, aggregate() always returns a cursor.
+_aggregate_returns_cursor = version_tuple >= (3, 0)
+
+# Every state is tracked so that they can be fixed up after forking.
+_states = weakref.WeakSet()
+
+# The hex strings matched by the Object ID converters.
+_OBJECT_ID_PATTERN = '[0-9a-fA-F]{24}'
+
+# The settings that can be used to configure the connection pool and
+# the names of the MongoClient options they correspond to.
+_POOL_OPTIONS = (
+    ('MAX_POOL_SIZE', 'maxPoolSize'),
+    ('MIN_POOL_SIZE', 'minPoolSize'),
+    ('MAX_IDLE_TIME_MS', 'maxIdleTimeMS'),
+    ('WAIT_QUEUE_TIMEOUT_MS', 'waitQueueTimeoutMS'),
+    ('WAIT_QUEUE_MULTIPLE', 'waitQueueMultiple'),
+    ('CONNECT_TIMEOUT_MS', 'connectTimeoutMS'),
+    ('SOCKET_TIMEOUT_MS', 'socketTimeoutMS'),
+)
 
 
 class ObjectIDConverter(BaseConverter):
-    """Convert Object IDs for use in view routing URLs."""
+    """Convert Object IDs for use in view routing URLs.
+
+    Only 24 character hex strings are matched, so URLs containing
+    anything else won't match the route.
+
+    Object IDs that are requested over and over again can be kept so
+    that they don't need to be created each time by passing the number
+    to keep as ``memo``. When that many have been kept, they are all
+    thrown away and the memo starts over.
+
+    .. code-block:: python
+
+        @app.route('/entries/<objectid(memo=1000):id>')
+        def show_entry(id):
+            ...
+
+    .. versionchanged:: 0.4.0
+       Added ``regex`` and ``memo``
+    """
+
+    regex = _OBJECT_ID_PATTERN
+
+    def __init__(self, map, memo=0):
+        super(ObjectIDConverter, self).__init__(map)
+        self.memo_size = memo
+        self._memo = {}
 
     def to_python(self, value):
+        id = self._memo.get(value)
+        if id is not None:
+            return id
+
         try:
-            return ObjectId(value)
+            id = ObjectId(value)
         except (InvalidId, TypeError):
             abort(400)
 
+        if self.memo_size:
+            if len(self._memo) >= self.memo_size:
+                self._memo.clear()
+            self._memo[value] = id
+
+        return id
+
     def to_url(self, value):
         return str(value)
 
 
+class ObjectIDListConverter(BaseConverter):
+    """Convert comma separated lists of Object IDs for use in view
+    routing URLs.
+
+    The most Object IDs that will be matched can be set with ``max``,
+    which must be at least 1.
+
+    .. code-block:: python
+
+        @app.route('/entries/<objectids(max=100):ids>')
+        def show_entries(ids):
+            entries = get_many_or_404(Entry, ids)
+            ...
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, map, max=None):
+        super(ObjectIDListConverter, self).__init__(map)
+        if max is None:
+            repeat = '*'
+        elif max < 1:
+            raise ValueError('max must be at least 1.')
+        else:
+            repeat = '{{0,{0}}}'.format(max - 1)
+        self.regex = '{0}(?:,{0}){1}'.format(_OBJECT_ID_PATTERN, repeat)
+
+    def to_python(self, value):
+        try:
+            return [ObjectId(id) for id in value.split(',')]
+        except (InvalidId, TypeError, AttributeError):
+            abort(400)
+
+    def to_url(self, value):
+        return ','.join(str(id) for id in value)
+
+
+class _Meta(SimonMeta):
+    """The options of a :class:`flask_simon.Model`."""
+
+    @property
+    def db(self):
+        tenants = _get_tenants(self.database)
+        tenant = tenants.get_tenant() if tenants is not None else None
+        if tenant is None:
+            collection = SimonMeta.db.fget(self)
+        else:
+            # Simon keeps the collection for the rest of the process, so
+            # the tenant's collection has to be looked up every time.
+            collection = tenants.get_database(tenant)[self.collection]
+
+        # While a unit of work is active, the writes Simon makes through
+        # the collection need to be held until it's flushed.
+        work = get_unit_of_work(self.database)
+        if work is None:
+            return collection
+        return work.wrap(collection)
+
+
+class _ModelMetaClass(type(SimonModel)):
+    """Defines :class:`flask_simon.Model`."""
+
+    def __new__(cls, name, bases, attrs):
+        # Methods that call super() need __classcell__, but Simon's
+        # metaclass doesn't pass it along to type.__new__(). Python 3.8
+        # and greater refuse to create the class unless it's filled in.
+        classcell = attrs.pop('__classcell__', None)
+
+        new_class = super(_ModelMetaClass, cls).__new__(cls, name, bases,
+                                                        attrs)
+        new_class._meta.__class__ = _Meta
+
+        if classcell is not None and sys.version_info >= (3, 7):
+            classcell.cell_contents = new_class
+
+        return new_class
+
+
+def _with_metaclass(meta, base):
+    """Creates a base class with a metaclass on Python 2 and 3."""
+
+    class metaclass(meta):
+        def __new__(cls, name, this_bases, attrs):
+            return meta(name, (base,), attrs)
+
+    return type.__new__(metaclass, 'temporary_class', (), {})
+
+
+class Model(_with_metaclass(_ModelMetaClass, SimonModel)):
+    """A :class:`simon.Model` that is aware of Flask-Simon.
+
+    Models that inherit from this class will use the features enabled
+    through the configuration of :class:`Simon`. When the identity map
+    is enabled, :meth:`get` will return documents that have already
+    been loaded during the request rather than querying the database
+    again. When the document cache is enabled, documents will also be
+    kept across requests for the number of seconds specified by
+    ``cache_ttl`` on the model's ``Meta`` class. Saving or deleting a
+    document will remove it from both.
+
+    Reads will use the read preference set through
+    :class:`~flask_simon.read_preference`, or the one configured for the
+    database. Writes will be held by the request's unit of work when
+    ``UNIT_OF_WORK`` is enabled (see :meth:`get_unit_of_work`).
+
+    .. versionadded:: 0.4.0
+    """
+
+    @classmethod
+    def get(cls, q=None, *qs, **fields):
+        identity_map = get_identity_map(cls._meta.database)
+        cache, ttl = _get_document_cache(cls)
+        if (identity_map is None and cache is None) or qs:
+            # The deprecated qs argument changes q in place, so don't
+            # bother trying to use the caches with it.
+            return super(Model, cls).get(q, *qs, **fields)
+
+        spec = _build_spec(cls, q, fields)
+
+        if identity_map is not None:
+            document = identity_map.get(cls, spec)
+            if document is not None:
+                return document
+
+        document = None
+        if cache is not None:
+            document = cache.get(cls, spec)
+
+        if document is None:
+            document = super(Model, cls).get(q, **fields)
+            if cache is not None:
+                cache.add(cls, spec, document, ttl)
+
+        if identity_map is not None:
+            identity_map.add(cls, spec, document)
+
+        return document
+
+    def delete(self, **kwargs):
+        _get_connected_state(self._meta.database)
+
+        # delete() clears the document, so the _id must be captured
+        # first.
+        id = self._document.get('_id')
+        with _writing(self):
+            super(Model, self).delete(**kwargs)
+        _document_changed(self, id)
+
+    @classmethod
+    def _find(cls, q=None, find_one=False, **fields):
+        # This is the same as Simon's _find() except that it gets the
+        # collection from _get_collection() so that the read preference
+        # is applied. Every method that reads from the database goes
+        # through _find(), making it the place to connect lazily, too.
+        docs = _get_cursor(cls, q, fields)
+
+        if find_one:
+            return _find_one(cls, docs, q, fields)
+
+        result = QuerySet(docs, cls)
+        if cls._meta.sort:
+            # Apply the default sort for the model.
+            result = result.sort(*cls._meta.sort)
+
+        return result
+
+    def _update(self, fields, upsert=False, use_internal=False, **kwargs):
+        _get_connected_state(self._meta.database)
+
+        # Every method that writes to the database (e.g., save(),
+        # update(), and increment()) goes through _update(), making it
+        # the one place to catch all changes.
+        with _writing(self):
+            super(Model, self)._update(fields, upsert=upsert,
+                                       use_internal=use_internal, **kwargs)
+        _document_changed(self, self._document.get('_id'))
+
+
+class Page(object):
+    """A page of documents.
+
+    Pages are returned by :meth:`paginate` and :meth:`paginate_offset`.
+    The documents are available through ``items`` or by iterating over
+    the page.
+
+    For :meth:`paginate`, ``next`` and ``prev`` contain the ``_id`` of
+    the document to pass as ``after`` and ``before``, respectively, to
+    get the next and previous pages. For :meth:`paginate_offset`, they
+    contain the page numbers. They will be ``None`` if there is no such
+    page.
+
+    ``page``, ``total``, and ``pages`` are only available for pages
+    returned by :meth:`paginate_offset`. ``total`` and ``pages`` will be
+    ``None`` if the documents weren't counted.
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, items, per_page, next=None, prev=None, page=None,
+                 total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next = next
+        self.prev = prev
+        self.page = page
+        self.total = total
+
+    @property
+    def has_next(self):
+        """Whether or not there is a next page."""
+
+        return self.next is not None
+
+    @property
+    def has_prev(self):
+        """Whether or not there is a previous page."""
+
+        return self.prev is not None
+
+    @property
+    def pages(self):
+        """The total number of pages."""
+
+        if self.total is None:
+            return None
+        return int(math.ceil(self.total / float(self.per_page)))
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
 class Simon(object):
     """Automatically creates a connection for Simon models."""
 
@@ -46,88 +413,2080 @@ class Simon(object):
                       connection
         :type alias: str
 
+        .. versionchanged:: 0.4.0
+           Added support for configuring the connection pool, lazy
+           connections, read preferences, query metrics, the unit of
+           work, creating indexes, checking query plans, and watching
+           for changes
         .. versionchanged:: 0.2.0
            Added support for multiple databases
         .. versionadded:: 0.1.0
         """
 
+        from .monitoring import (PoolStats, _send_request_queries,
+                                 register_command_listener)
+
         if 'simon' not in app.extensions:
             app.extensions['simon'] = {}
 
         app.url_map.converters['objectid'] = ObjectIDConverter
+        app.url_map.converters['objectids'] = ObjectIDListConverter
 
         def prefixed(name):
             """Prepends the prefix to the key name."""
 
             return '{0}_{1}'.format(prefix, name)
 
-        # The URI key is accessed a few times, so be lazy and only
-        # generate the prefixed version once.
-        uri_key = prefixed('URI')
+        connect_key = prefixed('CONNECT')
+        app.config.setdefault(connect_key, True)
 
-        if uri_key in app.config:
-            parsed = uri_parser.parse_uri(app.config[uri_key])
-            if not parsed.get('database'):
-                message = '{0} does not contain a database name.'
-                message = message.format(uri_key)
-                raise ValueError(message)
+        settings = _get_connection_settings(app, prefix,
+                                            lazy=not app.config[connect_key])
+        host = settings['host']
+        name = settings['name']
+        username = settings['username']
+        password = settings['password']
+        replica_set = settings['replica_set']
+        pool_options = settings['pool_options']
 
-            host = app.config[uri_key]
+        identity_map_key = prefixed('IDENTITY_MAP')
+        cache_enabled_key = prefixed('CACHE_ENABLED')
+        cache_max_entries_key = prefixed('CACHE_MAX_ENTRIES')
+        cache_max_bytes_key = prefixed('CACHE_MAX_BYTES')
+        cache_ttl_key = prefixed('CACHE_TTL')
 
-            name = app.config[prefixed('DBNAME')] = parsed['database']
-            username = app.config[prefixed('USERNAME')] = parsed['username']
-            password = app.config[prefixed('PASSWORD')] = parsed['password']
+        app.config.setdefault(identity_map_key, False)
+        app.config.setdefault(cache_enabled_key, False)
+        app.config.setdefault(cache_max_entries_key, 1000)
+        app.config.setdefault(cache_max_bytes_key, 16 * 1024 * 1024)
+        app.config.setdefault(cache_ttl_key, None)
 
-            replica_set = parsed['options'].get('replicaset', None)
-            app.config[prefixed('REPLICA_SET')] = replica_set
-        else:
-            host_key = prefixed('HOST')
-            port_key = prefixed('PORT')
-            name_key = prefixed('DBNAME')
-            username_key = prefixed('USERNAME')
-            password_key = prefixed('PASSWORD')
-            replica_set_key = prefixed('REPLICA_SET')
-
-            app.config.setdefault(host_key, 'localhost')
-            app.config.setdefault(port_key, 27017)
-            app.config.setdefault(name_key, app.name)
-
-            app.config.setdefault(username_key, None)
-            app.config.setdefault(password_key, None)
-            app.config.setdefault(replica_set_key, None)
-
-            host = app.config[host_key]
-            port = app.config[port_key]
-            name = app.config[name_key]
-            username = app.config[username_key]
-            password = app.config[password_key]
-            replica_set = app.config[replica_set_key]
-
-            host = '{0}:{1}'.format(host, port)
+        read_preference_key = prefixed('READ_PREFERENCE')
+        max_staleness_key = prefixed('MAX_STALENESS_SECONDS')
+
+        query_metrics_key = prefixed('QUERY_METRICS')
+        slow_query_key = prefixed('SLOW_QUERY_MS')
+        repeated_query_key = prefixed('REPEATED_QUERY_THRESHOLD')
+
+        unit_of_work_key = prefixed('UNIT_OF_WORK')
+        unit_of_work_ordered_key = prefixed('UNIT_OF_WORK_ORDERED')
+
+        ensure_indexes_key = prefixed('ENSURE_INDEXES')
+
+        count_cache_key = prefixed('COUNT_CACHE_SIZE')
+        response_cache_key = prefixed('RESPONSE_CACHE_SIZE')
+        result_cache_key = prefixed('RESULT_CACHE_SIZE')
+        result_cache_bytes_key = prefixed('RESULT_CACHE_MAX_BYTES')
+        watch_changes_key = prefixed('WATCH_CHANGES')
+        watch_interval_key = prefixed('WATCH_INTERVAL')
+
+        query_plans_key = prefixed('CHECK_QUERY_PLANS')
+        query_plan_rate_key = prefixed('QUERY_PLAN_SAMPLE_RATE')
+        query_plan_ratio_key = prefixed('QUERY_PLAN_MAX_RATIO')
+
+        app.config.setdefault(read_preference_key, None)
+        app.config.setdefault(max_staleness_key, None)
+        app.config.setdefault(query_metrics_key, False)
+        app.config.setdefault(slow_query_key, None)
+        app.config.setdefault(repeated_query_key, None)
+        app.config.setdefault(unit_of_work_key, False)
+        app.config.setdefault(unit_of_work_ordered_key, True)
+        app.config.setdefault(ensure_indexes_key, False)
+        app.config.setdefault(count_cache_key, 1000)
+        app.config.setdefault(response_cache_key, 1000)
+        app.config.setdefault(result_cache_key, 100)
+        app.config.setdefault(result_cache_bytes_key, 16 * 1024 * 1024)
+        app.config.setdefault(watch_changes_key, False)
+        app.config.setdefault(watch_interval_key, 5)
+        app.config.setdefault(query_plans_key, False)
+        app.config.setdefault(query_plan_rate_key, 1.0)
+        app.config.setdefault(query_plan_ratio_key, 10)
+
+        # Simon stores the database under the alias, or the name of the
+        # database if there isn't one, and the first database to
+        # connect becomes the default. Do the same with the settings so
+        # that they can be found through a model's Meta.database. If the
+        # default is being initialized again, replace its settings.
+        state = _SimonState(alias or name)
+        state.name = name
+        state.identity_map = app.config[identity_map_key]
+        state.slow_query_ms = app.config[slow_query_key]
+        state.repeated_query_threshold = app.config[repeated_query_key]
+        state.monitored = bool(app.config[query_metrics_key] or
+                               state.slow_query_ms is not None or
+                               state.repeated_query_threshold is not None)
+        state.max_staleness = app.config[max_staleness_key]
+        if app.config[read_preference_key]:
+            state.read_preference = make_read_preference(
+                app.config[read_preference_key],
+                app.config[max_staleness_key])
+        state.pool_options = pool_options
+        state.pool_stats = PoolStats(pool_options)
+        if app.config[cache_enabled_key]:
+            state.document_cache = DocumentCache(
+                max_entries=app.config[cache_max_entries_key],
+                max_bytes=app.config[cache_max_bytes_key])
+            state.document_cache_ttl = app.config[cache_ttl_key]
+        state.count_cache = CountCache(
+            max_entries=app.config[count_cache_key])
+        state.response_cache = ResponseCache(
+            max_entries=app.config[response_cache_key])
+        state.result_cache = ResultCache(
+            max_entries=app.config[result_cache_key],
+            max_bytes=app.config[result_cache_bytes_key])
+        state.watch_interval = app.config[watch_interval_key]
+        state.unit_of_work = app.config[unit_of_work_key]
+        state.unit_of_work_ordered = app.config[unit_of_work_ordered_key]
+
+        check_query_plans = app.config[query_plans_key]
+        if check_query_plans is True:
+            check_query_plans = 'warn'
+        if check_query_plans not in (False, None, 'warn', 'raise'):
+            message = "{0} must be 'warn' or 'raise'.".format(query_plans_key)
+            raise ValueError(message)
+        state.check_query_plans = check_query_plans or None
+        state.query_plan_sample_rate = app.config[query_plan_rate_key]
+        state.query_plan_max_ratio = app.config[query_plan_ratio_key]
+
+        if state.unit_of_work:
+            from .unit_of_work import supports_bulk_write
+            if not supports_bulk_write:
+                message = 'The unit of work requires PyMongo 2.9 or newer.'
+                raise RuntimeError(message)
+            if _flush_units_of_work not in app.after_request_funcs.get(
+                    None, ()):
+                app.after_request(_flush_units_of_work)
+
+        if _store_cached_responses not in app.after_request_funcs.get(
+                None, ()):
+            app.after_request(_store_cached_responses)
+
+        if state.monitored:
+            # The listener has to be registered before the client is
+            # created.
+            register_command_listener()
+            if _send_request_queries not in app.teardown_request_funcs.get(
+                    None, ()):
+                app.teardown_request(_send_request_queries)
+
+        states = app.extensions['simon']
+        states[state.alias] = state
+        if 'default' not in states or states['default'].alias == state.alias:
+            states['default'] = state
+            state.default = True
+
+        if app.config[ensure_indexes_key]:
+            # Wait until the first request so that the models have been
+            # imported and the workers of a preforking server have
+            # forked.
+            _before_first_request(
+                app, lambda: _start_ensuring_indexes(app, state.alias))
+
+        if app.config[watch_changes_key]:
+            # Like the indexes, wait until after the workers of a
+            # preforking server have forked.
+            _before_first_request(app, state.start_watching)
+
+        if hasattr(app, 'cli'):
+            _register_commands(app)
+
+        if not app.config[connect_key]:
+            # Wait until the connection is needed. This allows the app to
+            # be created before a preforking server forks its workers.
+            state.lazy = True
+            state.uri = settings['uri']
+            state.config = app.config
+            state.prefix = prefix
+            state.settings = {
+                'host': host,
+                'name': name,
+                'alias': alias,
+                'username': username,
+                'password': password,
+                'replica_set': replica_set,
+            }
+            app.before_request(state.connect)
+            return
+
+        if pool_options:
+            # Simon only passes the host and replica set along when it
+            # creates a client, so create it here and hand it over.
+            host = _create_client(host, replica_set, pool_options,
+                                  state.pool_stats)
 
         connection.connect(host, name=name, alias=alias, username=username,
                            password=password, replica_set=replica_set)
 
+    def get_pool_stats(self, database='default'):
+        """Returns statistics about a database's connection pool.
 
-def get_or_404(model, *qs, **fields):
-    """Finds and returns a single document, or raises a 404 exception.
+        The statistics include the settings used to create the pool.
+        When Flask-Simon created the client (because pool settings were
+        provided or the connection is lazy) and PyMongo supports
+        connection pool events (3.9+), they will also include the number
+        of open connections and how many of them are in use, and
+        ``events`` will be ``True``.
+        See :meth:`flask_simon.monitoring.PoolStats.as_dict` for
+        details.
 
-    This method will find a single document within the specified
-    model. If the specified query matches zero or multiple documents,
-    a ``404 Not Found`` exception will be raised.
+        :param database: (optional) the alias of the database.
+        :type database: str
+        :returns: dict -- the statistics, or ``None`` if there is no
+                  such database.
+
+        .. versionadded:: 0.4.0
+        """
+
+        state = _get_state(database)
+        if state is None:
+            return None
+
+        return state.pool_stats.as_dict()
+
+
+class _SimonState(object):
+    """Remembers the settings of a database connection."""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.name = None
+        self.default = False
+
+        self.identity_map = False
+        self.read_preference = None
+        self.max_staleness = None
+        self.pool_options = {}
+        self.monitored = False
+        self.slow_query_ms = None
+        self.repeated_query_threshold = None
+        self.pool_stats = None
+
+        self.document_cache = None
+        self.document_cache_ttl = None
+        self.count_cache = CountCache()
+        self.response_cache = ResponseCache()
+        self.result_cache = ResultCache()
+
+        self.watch_interval = 5
+        self.watcher = None
+        self.watcher_pid = None
+
+        self.unit_of_work = False
+        self.unit_of_work_ordered = True
+
+        self.tenants = None
+        self.user_loaders = []
+
+        self.check_query_plans = None
+        self.query_plan_sample_rate = 1.0
+        self.query_plan_max_ratio = None
+
+        self.lazy = False
+        self.settings = None
+        self.uri = None
+        self.config = None
+        self.prefix = None
+        self.pid = None
+        self._lock = threading.Lock()
+
+        _states.add(self)
+
+    def connect(self):
+        """Connects to the database if this process hasn't already.
+
+        This is only used when the connection is lazy. The ID of the
+        process that made the connection is kept so that a new one can
+        be made after the process has been forked.
+        """
+
+        pid = os.getpid()
+        if self.pid == pid:
+            return
+
+        with self._lock:
+            if self.pid == pid:
+                return
+
+            from .monitoring import PoolStats
+
+            if self.uri is not None:
+                self._read_uri()
+
+            settings = self.settings.copy()
+
+            # Always create the client here. Simon would otherwise reuse
+            # the client it created for the parent process.
+            self.pool_stats = PoolStats(self.pool_options)
+            client = _create_client(settings.pop('host'),
+                                    settings['replica_set'],
+                                    self.pool_options, self.pool_stats)
+
+            connection.connect(client, **settings)
+
+            if self.default:
+                # Simon only sets the default database the first time it
+                # connects, so set it explicitly in case it belongs to
+                # the parent process.
+                settings['alias'] = 'default'
+                connection.connect(client, **settings)
+
+            _reset_models(self.aliases)
+            if self.tenants is not None:
+                self.tenants.clear()
+
+            self.pid = pid
+
+    def get_database(self):
+        """Returns the database after making sure that it's connected."""
+
+        if self.lazy:
+            self.connect()
+        return connection.get_database(self.alias)
+
+    def _read_uri(self):
+        """Reads the settings from the URI.
+
+        Parsing a ``mongodb+srv://`` URI looks up the hosts, so it's
+        put off until the first connection. The options in the URI
+        replace the settings, the same as when connecting right away.
+        """
+
+        options = _get_uri_options(uri_parser.parse_uri(self.uri))
+        _set_uri_settings(self.config, self.prefix, self.name, options)
+        self.settings['username'] = options['username']
+        self.settings['password'] = options['password']
+        self.settings['replica_set'] = options['replica_set']
+        self.pool_options = dict(self.pool_options, **options['pool_options'])
+        if options['max_staleness'] is not None:
+            self.max_staleness = options['max_staleness']
+        if options['read_preference'] is not None:
+            self.read_preference = make_read_preference(
+                options['read_preference'], self.max_staleness)
+        self.uri = None
+
+    def start_watching(self):
+        """Starts watching the database for changes made by other
+        processes so that the responses depending on them can be
+        removed from the response cache.
+
+        Threads don't survive forking, so a new watcher is started for
+        each process.
+        """
+
+        pid = os.getpid()
+        with self._lock:
+            if self.watcher_pid == pid:
+                return
+
+            from .changes import ChangeWatcher
+
+            cache = self.response_cache
+            self.watcher = ChangeWatcher(self.get_database, cache.invalidate,
+                                         cache.collections,
+                                         self.watch_interval)
+            self.watcher.start()
+            self.watcher_pid = pid
+
+    @property
+    def aliases(self):
+        """The aliases models can use to find the database."""
+
+        if self.default:
+            return [self.alias, 'default']
+        return [self.alias]
+
+
+def abort_if_not_modified(document, field=None):
+    """Answers a conditional request with ``304 Not Modified`` if the
+    client's copy of a document is up to date.
+
+    The document's ETag is built from its ``_id`` and ``field``, which
+    must change whenever the document is saved. If ``field`` is a
+    datetime, it's also used as the document's ``Last-Modified`` date.
+    Call this before rendering the template so that the work can be
+    skipped.
+
+    .. code-block:: python
+
+        @app.route('/entries/<objectid:id>')
+        def show_entry(id):
+            entry = abort_if_not_modified(get_or_404(Entry, id=id))
+            return render_template('show_entry.html', entry=entry)
+
+    If the client's copy is out of date, the ``ETag`` and
+    ``Last-Modified`` headers are added to the response (with Flask 0.9
+    or newer). A document without a value for ``field`` has neither, so
+    requests for it are always answered in full.
+
+    :param document: the document.
+    :type document: :class:`~simon.Model`
+    :param field: (optional) the name of the field holding the version
+                  of the document. Defaults to the ``version_field``
+                  option of the model's ``Meta`` class, or ``modified``
+                  when ``auto_timestamp`` is enabled.
+    :type field: str
+    :returns: :class:`~simon.Model` -- the document.
+    :raises: :class:`ValueError` if the model doesn't have a version.
+
+    .. versionadded:: 0.4.0
+    """
+
+    etag, last_modified = _get_validators(type(document), document, field)
+    if is_not_modified(etag, last_modified):
+        abort(not_modified_response(etag, last_modified))
+
+    if after_this_request is not None:
+        @after_this_request
+        def add_validators(response):
+            return set_validators(response, etag, last_modified)
+
+    return document
+
+
+def aggregate(model, pipeline, allow_disk_use=False, batch_size=None,
+              ttl=None):
+    """Runs an aggregation pipeline on a model's collection.
+
+    .. code-block:: python
+
+        totals = aggregate(Order, [
+            {'$match': {'status': 'shipped'}},
+            {'$group': {'_id': '$customer', 'total': {'$sum': '$amount'}}},
+        ], allow_disk_use=True, ttl=600)
+
+    The pipeline is sent as is, so it must use the names of the fields
+    as they are stored in the database. The results are read from a
+    cursor ``batch_size`` documents at a time.
+
+    Setting ``ttl`` will keep the results for that number of seconds,
+    under a hash of the pipeline, so that the pipeline only runs once in
+    that time. Saving or deleting one of the model's documents through
+    :class:`flask_simon.Model` expires its results, but changes to other
+    collections used by the pipeline (e.g., through ``$lookup``) don't.
 
     :param model: the model class.
     :type model: :class:`simon.Model`
-    :param \*qs: logical queries.
-    :type \*qs: :class:`simon.query.Q`
+    :param pipeline: the stages of the pipeline.
+    :type pipeline: list
+    :param allow_disk_use: (optional) whether or not stages can write to
+                           temporary files when they run out of memory.
+    :type allow_disk_use: bool
+    :param batch_size: (optional) the number of documents to read at a
+                       time.
+    :type batch_size: int
+    :param ttl: (optional) the number of seconds to keep the results.
+    :type ttl: int
+    :returns: iterable -- the resulting documents. With ``ttl``, they
+              are returned in a list.
+
+    .. versionadded:: 0.4.0
+    """
+
+    cache = None
+    if ttl:
+        state = _get_state(model._meta.database)
+        if (state is not None and state.tenants is None and
+                not _holds_writes(model)):
+            cache = state.result_cache
+            key = _hash_pipeline(pipeline)
+
+            results = cache.get(model, key)
+            if results is not None:
+                return copy.deepcopy(results)
+
+    cursor = _aggregate(model, pipeline, allow_disk_use, batch_size)
+    if cache is None:
+        return cursor
+
+    results = list(cursor)
+    cache.add(model, key, copy.deepcopy(results), ttl)
+    return results
+
+
+def cached(models, ttl=60, key=None):
+    """Decorates a view so that its responses are kept until documents
+    of the models change.
+
+    .. code-block:: python
+
+        @app.route('/')
+        @cached((Entry, Comment), ttl=300)
+        def show_entries():
+            ...
+
+    Responses to ``GET`` and ``HEAD`` requests are kept for each URL, or
+    for each URL and value returned by ``key``, for ``ttl`` seconds.
+    Saving or deleting a document of one of the models through
+    :class:`flask_simon.Model` removes the responses right away. Changes
+    made by other processes are only noticed when ``WATCH_CHANGES`` is
+    enabled. Only ``200 OK`` responses that aren't streamed, don't set
+    cookies, and don't vary by cookie are kept, and nothing is kept for
+    databases with tenants. Responses that read the session are only
+    kept when there's a ``key``.
+
+    :param models: the model classes the view loads documents from.
+    :type models: :class:`simon.Model`, list, or tuple
+    :param ttl: (optional) the number of seconds to keep a response.
+    :type ttl: int
+    :param key: (optional) a callable returning a value to keep separate
+                responses for, such as the ID of the current user.
+    :type key: callable
+    :returns: function -- the decorator.
+    :raises: :class:`ValueError` if the models use different databases.
+
+    .. versionadded:: 0.4.0
+    """
+
+    if not isinstance(models, (list, tuple)):
+        models = (models,)
+
+    databases = set(model._meta.database for model in models)
+    if len(databases) != 1:
+        raise ValueError('The models must use the same database.')
+    database = databases.pop()
+
+    collections = [model._meta.collection for model in models]
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            state = _get_state(database)
+            if (state is None or state.tenants is not None or
+                    request.method not in ('GET', 'HEAD')):
+                return f(*args, **kwargs)
+
+            cache = state.response_cache
+            cache_key = (request.url, key() if key is not None else None)
+
+            entry = cache.get(cache_key)
+            if entry is not None:
+                data, status, headers = entry
+                return current_app.response_class(data, status=status,
+                                                  headers=headers)
+
+            # The response is kept once the app is done with it so that
+            # the cookies and headers added after the view are known.
+            pending = getattr(g, 'simon_cached_responses', None)
+            if pending is None:
+                pending = g.simon_cached_responses = []
+            pending.append((cache, cache_key, collections, ttl,
+                            cache.generation, key is not None))
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def conditional(model, field=None, id_arg='id'):
+    """Decorates a view so that conditional requests for a document can
+    be answered without calling it.
+
+    Only the ``_id`` and the version of the document are loaded to check
+    whether the client's copy is up to date, in which case a
+    ``304 Not Modified`` response is sent. Otherwise the view is called
+    and the ``ETag`` and ``Last-Modified`` headers are added to its
+    response. See :meth:`abort_if_not_modified` for how they're built.
+    Documents without a version are never answered with a 304.
+
+    .. code-block:: python
+
+        @app.route('/entries/<objectid:id>')
+        @conditional(Entry)
+        def show_entry(id):
+            entry = get_or_404(Entry, id=id)
+            return render_template('show_entry.html', entry=entry)
+
+    If the document doesn't exist, a ``404 Not Found`` exception will be
+    raised.
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :param field: (optional) the name of the field holding the version
+                  of the document.
+    :type field: str
+    :param id_arg: (optional) the name of the view argument holding the
+                   ``_id`` of the document.
+    :type id_arg: str
+    :returns: function -- the decorator.
+    :raises: :class:`ValueError` if the model doesn't have a version.
+
+    .. versionadded:: 0.4.0
+    """
+
+    version_field = _map_field(model, field or _get_version_field(model))
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return f(*args, **kwargs)
+
+            query = {'id': kwargs[id_arg]}
+            cursor = _get_cursor(model, None, query, {version_field: 1})
+            try:
+                document = _find_one(model, cursor, None, query)
+            except (NoDocumentFound, MultipleDocumentsFound):
+                abort(404)
+
+            etag, last_modified = _get_validators(model, document, field)
+            if is_not_modified(etag, last_modified):
+                return not_modified_response(etag, last_modified)
+
+            response = make_response(f(*args, **kwargs))
+            return set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def ensure_indexes(database='default', background=True):
+    """Creates the indexes declared by the models using a database.
+
+    See :meth:`flask_simon.indexes.get_indexes` for how to declare
+    indexes. Indexes that already exist are left alone, so this is safe
+    to call any number of times. Setting ``MONGO_ENSURE_INDEXES`` will
+    call it in a background thread when the app handles its first
+    request.
+
+    :param database: (optional) the alias of the database.
+    :type database: str
+    :param background: (optional) whether or not MongoDB should build
+                       the indexes in the background.
+    :type background: bool
+    :returns: dict -- the names of the indexes, keyed by the names of the
+              models.
+    :raises: :class:`~simon.exceptions.ConnectionError`
+
+    .. versionadded:: 0.4.0
+    """
+
+    from .indexes import create_indexes
+
+    report = {}
+    for model in _get_indexed_models(database):
+        report[model.__name__] = create_indexes(model, background)
+    return report
+
+
+def get_count(model, q=None, ttl=None, estimate=True, background=False,
+              **fields):
+    """Counts the documents matching a query.
+
+    Counting every document in a collection is answered from the
+    collection's metadata when ``estimate`` is set, which is much faster
+    than a real count but may be slightly off, e.g., after an unclean
+    shutdown or while chunks are being migrated. Other queries are always
+    counted.
+
+    Setting ``ttl`` will keep the count for that number of seconds. Once
+    it has expired, ``background`` will return the old count while a new
+    one is counted in another thread so that the request doesn't have to
+    wait on it. Saving or deleting one of the model's documents expires
+    its counts.
+
+    .. code-block:: python
+
+        @app.route('/')
+        def show_entries():
+            entries = paginate_offset(Entry, count=False)
+            total = get_count(Entry, ttl=60, background=True)
+            return render_template('show_entries.html', entries=entries,
+                                   total=total)
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :param q: (optional) a logical query.
+    :type q: :class:`simon.query.Q`
+    :param ttl: (optional) the number of seconds to keep the count.
+    :type ttl: int
+    :param estimate: (optional) whether or not to estimate the count
+                     when there isn't a query.
+    :type estimate: bool
+    :param background: (optional) whether or not to refresh an expired
+                       count in the background.
+    :type background: bool
     :param \*\*fields: keyword arguments specifying the query.
     :type \*\*fields: kwargs
-    :returns: :class:`~simon.Model` -- an instance of a model.
+    :returns: int -- the number of documents.
 
-    .. versionadded: 0.1.0
+    .. versionadded:: 0.4.0
     """
 
-    try:
-        return model.get(*qs, **fields)
-    except (NoDocumentFound, MultipleDocumentsFound):
-        abort(404)
+    return _count(model, q, fields, ttl, estimate, background)
+
+
+def get_identity_map(database='default'):
+    """Returns the identity map for the current request.
+
+    The identity map is only available when the ``IDENTITY_MAP`` setting
+    has been enabled for the database. A new identity map is created for
+    each request.
+
+    :param database: (optional) the alias of the database.
+    :type database: str
+    :returns: :class:`~flask_simon.cache.IdentityMap` -- the identity
+              map, or ``None`` if it hasn't been enabled.
+
+    .. versionadded:: 0.4.0
+    """
+
+    state = _get_state(database)
+    if state is None or not state.identity_map:
+        return None
+
+    identity_maps = getattr(g, 'simon_identity_maps', None)
+    if identity_maps is None:
+        identity_maps = g.simon_identity_maps = {}
+
+    if state.alias not in identity_maps:
+        identity_maps[state.alias] = IdentityMap()
+    return identity_maps[state.alias]
+
+
+def get_index_report(database='default'):
+    """Compares the indexes declared by the models using a database
+    with those that exist.
+
+    See :meth:`flask_simon.indexes.compare_indexes` for the contents of
+    the report for each model.
+
+    :param database: (optional) the alias of the database.
+    :type database: str
+    :returns: dict -- the reports, keyed by the names of the models.
+    :raises: :class:`~simon.exceptions.ConnectionError`
+
+    .. versionadded:: 0.4.0
+    """
+
+    from .indexes import compare_indexes
+
+    report = {}
+    for model in _get_indexed_models(database):
+        report[model.__name__] = compare_indexes(model)
+    return report
+
+
+def get_many(model, ids):
+    """Finds and returns the documents with the given ``_id`` values.
+
+    All of the documents are loaded with a single ``$in`` query and
+    returned in the same order as ``ids``. Any ``_id`` that doesn't
+    match a document will be left out.
+
+    When ``model`` inherits from :class:`flask_simon.Model`, documents
+    that are already in the identity map or the document cache won't be
+    loaded again, and the documents that are loaded will be added to
+    them.
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :param ids: the ``_id`` values of the documents.
+    :type ids: iterable
+    :returns: list -- instances of the model.
+    :raises: :class:`TypeError`, :class:`~bson.errors.InvalidId`
+
+    .. versionadded:: 0.4.0
+    """
+
+    ids = list(ids)
+    if model._meta.typed_fields['_id'] == ObjectId:
+        ids = [guarantee_object_id(id) for id in ids]
+
+    identity_map = cache = ttl = None
+    if issubclass(model, Model):
+        identity_map = get_identity_map(model._meta.database)
+        cache, ttl = _get_document_cache(model)
+
+    documents = {}
+    missing = []
+    seen = set()
+    for id in ids:
+        if id in seen:
+            continue
+        seen.add(id)
+
+        document = None
+        if identity_map is not None:
+            document = identity_map.get(model, {'_id': id})
+        if document is None and cache is not None:
+            document = cache.get(model, {'_id': id})
+            if document is not None and identity_map is not None:
+                identity_map.add(model, {'_id': id}, document)
+
+        if document is None:
+            missing.append(id)
+        else:
+            documents[id] = document
+
+    if missing:
+        for raw in _get_cursor(model, None, {'_id__in': missing}):
+            document = model(**raw)
+            documents[raw['_id']] = document
+
+            if cache is not None:
+                cache.add(model, {'_id': raw['_id']}, document, ttl)
+            if identity_map is not None:
+                identity_map.add(model, {'_id': raw['_id']}, document)
+
+    return [documents[id] for id in ids if id in documents]
+
+
+def get_many_or_404(model, ids, allow_missing=False):
+    """Finds and returns the documents with the given ``_id`` values, or
+    raises a 404 exception.
+
+    This works the same as :meth:`get_many`, except that a ``404 Not
+    Found`` exception will be raised if any of the ``_id`` values
+    doesn't match a document, unless ``allow_missing`` is set. A ``404
+    Not Found`` exception will also be raised for any value that isn't a
+    valid ``_id``.
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :param ids: the ``_id`` values of the documents.
+    :type ids: iterable
+    :param allow_missing: (optional) whether or not to return the
+                          documents that were found when some are
+                          missing.
+    :type allow_missing: bool
+    :returns: list -- instances of the model.
+
+    .. versionadded:: 0.4.0
+    """
+
+    ids = list(ids)
+    if model._meta.typed_fields['_id'] == ObjectId:
+        try:
+            ids = [guarantee_object_id(id) for id in ids]
+        except (InvalidId, TypeError):
+            abort(404)
+
+    documents = get_many(model, ids)
+
+    if not allow_missing and len(documents) < len(ids):
+        abort(404)
+
+    return documents
+
+
+def get_unit_of_work(database='default'):
+    """Returns the unit of work for the current request.
+
+    The unit of work is only available during a request when the
+    ``UNIT_OF_WORK`` setting has been enabled for the database. A new
+    unit of work is created for each request and flushed at the end of
+    it. Call its :meth:`~flask_simon.unit_of_work.UnitOfWork.flush`
+    method to send the writes to the database sooner.
+
+    :param database: (optional) the alias of the database.
+    :type database: str
+    :returns: :class:`~flask_simon.unit_of_work.UnitOfWork` -- the unit
+              of work, or ``None`` if it hasn't been enabled.
+
+    .. versionadded:: 0.4.0
+    """
+
+    if not has_request_context():
+        return None
+
+    state = _get_state(database)
+    if state is None or not state.unit_of_work:
+        return None
+
+    units_of_work = getattr(g, 'simon_units_of_work', None)
+    if units_of_work is None:
+        units_of_work = g.simon_units_of_work = {}
+
+    if state.alias not in units_of_work:
+        from .unit_of_work import UnitOfWork
+        units_of_work[state.alias] = UnitOfWork(state.unit_of_work_ordered,
+                                                _discard_cached)
+    return units_of_work[state.alias]
+
+
+def get_or_404(model, *qs, **fields):
+    """Finds and returns a single document, or raises a 404 exception.
+
+    This method will find a single document within the specified
+    model. If the specified query matches zero or multiple documents,
+    a ``404 Not Found`` exception will be raised.
+
+    The fields that are loaded can be limited by passing the names of
+    the fields to include as ``fields`` or the names of the fields to
+    leave out as ``exclude``. When neither is passed, the ``fields`` and
+    ``exclude`` options on the model's ``Meta`` class will be used.
+    Documents loaded this way aren't complete and shouldn't be saved
+    with :meth:`~simon.Model.save`, which replaces the whole document.
+    They also bypass the identity map and the document cache.
+
+    .. code-block:: python
+
+        entry = get_or_404(Entry, id=id, exclude=('comments',))
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :param \*qs: logical queries.
+    :type \*qs: :class:`simon.query.Q`
+    :param \*\*fields: keyword arguments specifying the query.
+    :type \*\*fields: kwargs
+    :returns: :class:`~simon.Model` -- an instance of a model.
+
+    .. versionadded: 0.1.0
+
+    .. versionchanged:: 0.4.0
+       Added ``fields`` and ``exclude``
+    """
+
+    projection = None
+    if 'fields' in fields or 'exclude' in fields:
+        projection = _get_projection(model, fields.pop('fields', None),
+                                     fields.pop('exclude', None))
+    elif isinstance(model, type) and issubclass(model, SimonModel):
+        projection = _get_projection(model,
+                                     _get_meta_option(model, 'fields'),
+                                     _get_meta_option(model, 'exclude'))
+
+    try:
+        if projection is None:
+            return model.get(*qs, **fields)
+
+        q = None
+        if qs:
+            # Simon merges the filters of the deprecated qs argument
+            # into the first one's. Merge them into a new Q instead so
+            # that the caller's aren't changed.
+            q = Q()
+            for other in qs:
+                q._filter.update(other._filter)
+        cursor = _get_cursor(model, q, fields, projection)
+        return _find_one(model, cursor, q, fields)
+    except (NoDocumentFound, MultipleDocumentsFound):
+        abort(404)
+
+
+def paginate(model, q=None, per_page=20, after=None, before=None,
+             sort=None, **fields):
+    """Returns a page of documents using keyset pagination.
+
+    Rather than skipping over the documents on the earlier pages, which
+    gets slower the further into the results a page is, the query starts
+    from the document on the edge of the page. ``after`` and ``before``
+    take the ``_id`` of that document (e.g., ``page.next`` or
+    ``page.prev``), which can be used with the ``objectid`` converter.
+
+    .. code-block:: python
+
+        @app.route('/')
+        @app.route('/after/<objectid:after>')
+        def show_entries(after=None):
+            page = paginate(Entry, after=after)
+            return render_template('show_entries.html', page=page)
+
+    Documents are sorted by ``sort``, or the first field in the model's
+    ``Meta.sort``, and then by ``_id`` to keep the order stable. The
+    field should be indexed (together with ``_id`` if it isn't unique).
+    When sorting by a field other than ``_id``, the document on the edge
+    of the page will be loaded to find its value. If it can't be found,
+    a ``404 Not Found`` exception will be raised. Documents without the
+    field are sorted as though it were null.
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :param q: (optional) a logical query.
+    :type q: :class:`simon.query.Q`
+    :param per_page: (optional) the number of documents on each page.
+    :type per_page: int
+    :param after: (optional) the ``_id`` of the document to start after.
+    :type after: :class:`~bson.objectid.ObjectId`
+    :param before: (optional) the ``_id`` of the document to end before.
+    :type before: :class:`~bson.objectid.ObjectId`
+    :param sort: (optional) the name of the field to sort by. Prefix it
+                 with ``-`` to sort in descending order.
+    :type sort: str
+    :param \*\*fields: keyword arguments specifying the query.
+    :type \*\*fields: kwargs
+    :returns: :class:`~flask_simon.Page` -- the page.
+    :raises: :class:`ValueError`
+
+    .. versionadded:: 0.4.0
+    """
+
+    if after is not None and before is not None:
+        raise ValueError('after and before cannot be used together.')
+
+    if sort is None:
+        sort = model._meta.sort[0] if model._meta.sort else 'id'
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+
+    key = _map_field(model, field)
+    sorting = [sort]
+    if key != '_id':
+        sorting.append('-_id' if descending else '_id')
+    sorting = _sort_spec(model, sorting)
+
+    edge = after if after is not None else before
+    if edge is not None:
+        # Moving backward means looking in the opposite direction of
+        # the sort.
+        operator = '__gt' if (after is not None) != descending else '__lt'
+
+        if key == '_id':
+            keyset = Q(**{field + operator: edge})
+        else:
+            # Load the edge the same way as the page so that it's read
+            # from the same member of a replica set.
+            cursor = _get_cursor(model, None, {'id': edge}, {key: 1})
+            documents = list(cursor.limit(1))
+            if not documents:
+                abort(404)
+            try:
+                value = get_nested_key(documents[0], key)
+            except KeyError:
+                # Missing fields sort the same as null.
+                value = None
+
+            if value is None and operator == '__gt':
+                # Nothing compares greater than null, but everything
+                # else sorts after it.
+                keyset = Q(**{field + '__ne': None})
+            else:
+                keyset = Q(**{field + operator: value})
+            keyset = keyset | Q(**{field: value, '_id' + operator: edge})
+
+        if q is None:
+            q = keyset
+        else:
+            # Q's & would change q in place if it already has an $and.
+            combined = Q()
+            combined._filter = {'$and': [q._filter, keyset._filter]}
+            q = combined
+
+    if before is not None:
+        sorting = [(k, -direction) for k, direction in sorting]
+
+    cursor = model.find(q, **fields)._cursor
+    cursor.sort(sorting)
+    cursor.limit(per_page + 1)
+    items = [model(**document) for document in cursor]
+
+    more = len(items) > per_page
+    items = items[:per_page]
+
+    next = prev = None
+    if before is None:
+        if items and more:
+            next = items[-1]._document['_id']
+        if items and after is not None:
+            prev = items[0]._document['_id']
+    else:
+        items.reverse()
+        if items and more:
+            prev = items[0]._document['_id']
+        if items:
+            next = items[-1]._document['_id']
+
+    return Page(items, per_page, next=next, prev=prev)
+
+
+def paginate_offset(model, q=None, page=1, per_page=20, sort=None,
+                    count=True, count_ttl=None, **fields):
+    """Returns a page of documents using skip and limit.
+
+    Unlike :meth:`paginate`, pages can be requested by number. The
+    further into the results the page is, however, the longer the query
+    will take.
+
+    Counting the documents, which is needed for ``total`` and ``pages``,
+    can be skipped with ``count``. Setting ``count_ttl`` will keep the
+    count for that number of seconds.
+
+    If ``page`` is less than 1, or a page after the first doesn't
+    contain any documents, a ``404 Not Found`` exception will be raised.
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :param q: (optional) a logical query.
+    :type q: :class:`simon.query.Q`
+    :param page: (optional) the number of the page.
+    :type page: int
+    :param per_page: (optional) the number of documents on each page.
+    :type per_page: int
+    :param sort: (optional) the names of the fields to sort by.
+                 Defaults to the model's ``Meta.sort``.
+    :type sort: str, list, or tuple
+    :param count: (optional) whether or not to count the documents.
+    :type count: bool
+    :param count_ttl: (optional) the number of seconds to keep the count.
+    :type count_ttl: int
+    :param \*\*fields: keyword arguments specifying the query.
+    :type \*\*fields: kwargs
+    :returns: :class:`~flask_simon.Page` -- the page.
+
+    .. versionadded:: 0.4.0
+    """
+
+    if page < 1:
+        abort(404)
+
+    if sort is None:
+        sort = model._meta.sort
+    elif not isinstance(sort, (list, tuple)):
+        sort = (sort,)
+
+    cursor = model.find(q, **fields)._cursor
+    if sort:
+        cursor.sort(_sort_spec(model, sort))
+    cursor.skip((page - 1) * per_page)
+    cursor.limit(per_page + 1)
+    items = [model(**document) for document in cursor]
+
+    if not items and page > 1:
+        abort(404)
+
+    total = None
+    if count:
+        total = _count(model, q, fields, count_ttl)
+
+    next = page + 1 if len(items) > per_page else None
+    prev = page - 1 if page > 1 else None
+
+    return Page(items[:per_page], per_page, next=next, prev=prev, page=page,
+                total=total)
+
+
+def stream_aggregate(model, pipeline, ndjson=False, batch_size=100,
+                     allow_disk_use=False, ttl=None):
+    """Returns a response that streams the results of an aggregation
+    pipeline.
+
+    The results are written as a JSON array, or as newline-delimited JSON
+    with ``ndjson``, ``batch_size`` documents at a time. See
+    :meth:`aggregate` for the other arguments and
+    :meth:`stream_json` for how the documents are written.
+
+    .. code-block:: python
+
+        @app.route('/reports/totals')
+        def totals():
+            return stream_aggregate(Order, TOTALS_PIPELINE, ttl=600)
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :param pipeline: the stages of the pipeline.
+    :type pipeline: list
+    :param ndjson: (optional) whether or not to write newline-delimited
+                   JSON.
+    :type ndjson: bool
+    :returns: :class:`~flask.Response` -- the response.
+
+    .. versionadded:: 0.4.0
+    """
+
+    from .streaming import iter_json, iter_ndjson
+
+    documents = aggregate(model, pipeline, allow_disk_use, batch_size, ttl)
+    if ndjson:
+        return Response(iter_ndjson(documents, batch_size),
+                        mimetype='application/x-ndjson')
+    return Response(iter_json(documents, batch_size),
+                    mimetype='application/json')
+
+
+def stream_json(model, q=None, batch_size=100, sort=None, fields=None,
+                exclude=None, **query):
+    """Returns a response that streams documents as a JSON array.
+
+    Documents are read from the cursor and written to the response
+    ``batch_size`` at a time, so the memory used by the response stays
+    the same no matter how many documents match the query.
+
+    .. code-block:: python
+
+        @app.route('/export')
+        def export():
+            return stream_json(Entry, fields=('title', 'created'))
+
+    The documents are written as they are stored in the database. Object
+    IDs are written as strings and dates and times in ISO 8601 format.
+    ``fields`` and ``exclude`` limit the fields that are loaded from the
+    database.
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :param q: (optional) a logical query.
+    :type q: :class:`simon.query.Q`
+    :param batch_size: (optional) the number of documents to load and
+                       write at a time.
+    :type batch_size: int
+    :param sort: (optional) the names of the fields to sort by.
+                 Defaults to the model's ``Meta.sort``.
+    :type sort: str, list, or tuple
+    :param fields: (optional) the names of the fields to include.
+    :type fields: list or tuple
+    :param exclude: (optional) the names of the fields to exclude.
+    :type exclude: list or tuple
+    :param \*\*query: keyword arguments specifying the query.
+    :type \*\*query: kwargs
+    :returns: :class:`~flask.Response` -- the response.
+
+    .. versionadded:: 0.4.0
+    """
+
+    from .streaming import iter_json
+
+    cursor = _get_stream_cursor(model, q, batch_size, sort, fields, exclude,
+                                query)
+    return Response(iter_json(cursor, batch_size),
+                    mimetype='application/json')
+
+
+def stream_ndjson(model, q=None, batch_size=100, sort=None, fields=None,
+                  exclude=None, **query):
+    """Returns a response that streams documents as newline-delimited
+    JSON.
+
+    Each document is written on its own line. See :meth:`stream_json`
+    for the arguments.
+
+    :returns: :class:`~flask.Response` -- the response.
+
+    .. versionadded:: 0.4.0
+    """
+
+    from .streaming import iter_ndjson
+
+    cursor = _get_stream_cursor(model, q, batch_size, sort, fields, exclude,
+                                query)
+    return Response(iter_ndjson(cursor, batch_size),
+                    mimetype='application/x-ndjson')
+
+
+def _after_fork():
+    """Replaces the locks that may have been held when forking."""
+
+    for state in _states:
+        state._lock = threading.Lock()
+
+
+def _aggregate(model, pipeline, allow_disk_use, batch_size):
+    """Returns a cursor for the results of an aggregation pipeline."""
+
+    _get_connected_state(model._meta.database)
+    collection = _get_collection(model)
+
+    options = {}
+    if allow_disk_use:
+        options['allowDiskUse'] = True
+
+    if _aggregate_returns_cursor:
+        if batch_size:
+            options['batchSize'] = batch_size
+        return collection.aggregate(pipeline, **options)
+
+    # PyMongo 2.6+ only returns a cursor when it's asked for one.
+    cursor = {}
+    if batch_size:
+        cursor['batchSize'] = batch_size
+    return collection.aggregate(pipeline, cursor=cursor, **options)
+
+
+def _before_first_request(app, f):
+    """Calls a function before the first request handled by an app."""
+
+    if hasattr(app, 'before_first_request'):
+        app.before_first_request(f)
+        return
+
+    # Flask 2.3 removed before_first_request().
+    lock = threading.Lock()
+    called = []
+
+    def before_request():
+        if called:
+            return
+        with lock:
+            if not called:
+                called.append(True)
+                f()
+
+    app.before_request(before_request)
+
+
+def _build_spec(model, q, fields):
+    """Builds the document spec that Simon will use for a query."""
+
+    fields = fields.copy()
+    if isinstance(q, Q):
+        fields.update(q._filter)
+
+    spec = map_fields(model._meta.field_map, fields, flatten_keys=True,
+                      with_operators=True)
+
+    if '_id' in spec and model._meta.typed_fields['_id'] == ObjectId:
+        spec['_id'] = guarantee_object_id(spec['_id'])
+
+    return spec
+
+
+def _check_query_plan(model, spec, cursor):
+    """Returns the cursor, wrapped so that its plan is flagged when it's
+    first read if it's inefficient and the plans of queries are being
+    checked.
+    """
+
+    state = _get_state(model._meta.database)
+    if state is None or state.check_query_plans is None:
+        return cursor
+
+    # Queries without a spec are meant to load the whole collection.
+    if not spec:
+        return cursor
+
+    rate = state.query_plan_sample_rate
+    if rate < 1:
+        import random
+        if random.random() >= rate:
+            return cursor
+
+    from .query_plans import (InefficientQuery, _CheckedCursor,
+                              check_query_plan, inefficient_query)
+
+    # The cursor may be read after the app context is gone, such as
+    # when a response is streamed.
+    app = current_app._get_current_object()
+
+    def check(cursor):
+        report = check_query_plan(model, spec, cursor,
+                                  state.query_plan_max_ratio)
+        if report is None:
+            return
+
+        message = 'Inefficient query on {0} ({1}): {2} at {3}'.format(
+            report['model'], report['reason'], report['shape'],
+            report['call_site'])
+        if state.check_query_plans == 'raise':
+            raise InefficientQuery(message, report)
+
+        logger.warning(message)
+        inefficient_query.send(app, report=report)
+
+    return _CheckedCursor(cursor, check)
+
+
+def _count(model, q, fields, ttl=None, estimate=False, background=False):
+    """Counts the documents matching a query.
+
+    When ``ttl`` is provided, the count will be kept in the count cache.
+    With ``background``, an expired count is returned while a new one is
+    counted in another thread.
+    """
+
+    spec = _build_spec(model, q, fields)
+
+    def counter():
+        if estimate and not spec:
+            return _estimate_count(model)
+        return model.find(q, **fields).count()
+
+    cache = None
+    if ttl:
+        state = _get_state(model._meta.database)
+        if (state is not None and state.tenants is None and
+                not _holds_writes(model)):
+            cache = state.count_cache
+
+    if cache is None:
+        return counter()
+
+    total, expired = cache.peek(model, spec)
+    if not expired:
+        return total
+
+    if total is not None and background and has_app_context():
+        if cache.start_refresh(model, spec):
+            _start_counting(current_app._get_current_object(), cache, model,
+                            spec, counter, ttl)
+        return total
+
+    total = counter()
+    cache.add(model, spec, total, ttl)
+    return total
+
+
+def _create_client(host, replica_set, options, pool_stats):
+    """Creates a client using the connection pool options."""
+
+    from .monitoring import supports_pool_events
+
+    options = options.copy()
+    if supports_pool_events:
+        options['event_listeners'] = [pool_stats]
+        pool_stats.listening = True
+
+    if replica_set:
+        return MongoReplicaSetClient(host, replicaSet=replica_set, **options)
+    return MongoClient(host, **options)
+
+
+def _discard_cached(document, id):
+    """Discards what the caches shared across requests hold for a
+    document.
+    """
+
+    cache, ttl = _get_document_cache(document.__class__)
+    if cache is not None:
+        cache.invalidate(document.__class__, id)
+
+    state = _get_state(document._meta.database)
+    if state is not None:
+        state.count_cache.invalidate(document.__class__)
+        state.response_cache.invalidate(document._meta.collection)
+        state.result_cache.invalidate(document.__class__)
+        for loader in state.user_loaders:
+            loader.invalidate(document.__class__, id)
+
+
+def _document_changed(document, id):
+    """Discards anything that has been cached for a document."""
+
+    identity_map = get_identity_map(document._meta.database)
+    if identity_map is not None:
+        identity_map.invalidate(document.__class__)
+
+    # Other requests could put the old document back into the shared
+    # caches until the unit of work makes the writes, so wait for it.
+    work = get_unit_of_work(document._meta.database)
+    if work is None:
+        _discard_cached(document, id)
+    else:
+        work.changed(document, id)
+
+
+def _estimate_count(model):
+    """Counts all of a collection's documents using its metadata."""
+
+    _get_connected_state(model._meta.database)
+    collection = _get_collection(model)
+    if supports_estimated_count:
+        return collection.estimated_document_count()
+    return collection.count()
+
+
+def _find_one(model, cursor, q, fields):
+    """Returns the only document matched by a cursor.
+
+    This raises the same exceptions as :meth:`simon.Model.get`.
+    """
+
+    # Simon counts the documents and then loads the first one, which
+    # takes two round trips. Loading up to two takes one.
+    documents = list(cursor.limit(2))
+    if not documents:
+        message = "'{0}' matching query does not exist."
+        raise model.NoDocumentFound(message.format(model.__name__))
+    if len(documents) > 1:
+        message = ("The query returned more than one '{0}'. It "
+                   "returned {1}! The document spec was: {2}.")
+        message = message.format(model.__name__, cursor.count(),
+                                 _build_spec(model, q, fields))
+        raise model.MultipleDocumentsFound(message)
+
+    return model(**documents[0])
+
+
+def _flush_units_of_work(response):
+    """Flushes the units of work at the end of a request."""
+
+    # Flask 1.1 and greater also call this with the error response when
+    # the view raises an exception. The writes are thrown away then, the
+    # same as they are with older versions.
+    if response.status_code >= 500:
+        return response
+
+    units_of_work = getattr(g, 'simon_units_of_work', None)
+    for work in (units_of_work or {}).values():
+        work.flush()
+    return response
+
+
+def _get_collection(model):
+    """Returns a model's collection with the current read preference.
+
+    The read preference set through :class:`read_preference` takes
+    precedence over the one configured for the database.
+    """
+
+    collection = model._meta.db
+
+    preference = get_read_preference()
+    if preference is None:
+        state = _get_state(model._meta.database)
+        if state is not None:
+            preference = state.read_preference
+
+    if preference is None:
+        return collection
+    return collection.with_options(read_preference=preference)
+
+
+def _get_connected_state(database='default'):
+    """Returns the settings of a database after making sure that it's
+    connected.
+    """
+
+    state = _get_state(database)
+    if state is not None and state.lazy:
+        state.connect()
+    return state
+
+
+def _get_connection_settings(app, prefix, lazy=False):
+    """Reads the settings needed to connect from the app's config.
+
+    Settings that are missing are filled in with their defaults, and
+    those found in the URI are copied to their own keys. When ``lazy``
+    is ``True``, only the database name is read from the URI. The rest
+    of it is parsed, and copied to the keys, when connecting, and
+    ``uri`` is set to it.
+    """
+
+    def prefixed(name):
+        """Prepends the prefix to the key name."""
+
+        return '{0}_{1}'.format(prefix, name)
+
+    # The URI key is accessed a few times, so be lazy and only
+    # generate the prefixed version once.
+    uri_key = prefixed('URI')
+    uri = None
+
+    if uri_key in app.config:
+        host = app.config[uri_key]
+        if lazy:
+            uri = host
+            name = _get_uri_database(uri)
+        else:
+            parsed = uri_parser.parse_uri(host)
+            name = parsed.get('database')
+
+        if not name:
+            message = '{0} does not contain a database name.'
+            message = message.format(uri_key)
+            raise ValueError(message)
+
+        if lazy:
+            # The rest of the settings are copied from the URI once it's
+            # been parsed.
+            app.config[prefixed('DBNAME')] = name
+            username = password = replica_set = auth_source = None
+        else:
+            options = _get_uri_options(parsed)
+            _set_uri_settings(app.config, prefix, name, options)
+
+            username = options['username']
+            password = options['password']
+            replica_set = options['replica_set']
+            auth_source = options['auth_source']
+    else:
+        host_key = prefixed('HOST')
+        port_key = prefixed('PORT')
+        name_key = prefixed('DBNAME')
+        username_key = prefixed('USERNAME')
+        password_key = prefixed('PASSWORD')
+        replica_set_key = prefixed('REPLICA_SET')
+
+        app.config.setdefault(host_key, 'localhost')
+        app.config.setdefault(port_key, 27017)
+        app.config.setdefault(name_key, app.name)
+
+        app.config.setdefault(username_key, None)
+        app.config.setdefault(password_key, None)
+        app.config.setdefault(replica_set_key, None)
+
+        host = app.config[host_key]
+        port = app.config[port_key]
+        name = app.config[name_key]
+        username = app.config[username_key]
+        password = app.config[password_key]
+        replica_set = app.config[replica_set_key]
+        auth_source = None
+
+        host = '{0}:{1}'.format(host, port)
+
+    pool_options = {}
+    for key, option in _POOL_OPTIONS:
+        app.config.setdefault(prefixed(key), None)
+        if app.config[prefixed(key)] is not None:
+            pool_options[option] = app.config[prefixed(key)]
+
+    return {
+        'host': host,
+        'name': name,
+        'username': username,
+        'password': password,
+        'replica_set': replica_set,
+        'auth_source': auth_source,
+        'pool_options': pool_options,
+        'uri': uri,
+    }
+
+
+def _get_cursor(model, q, fields, projection=None):
+    """Returns a PyMongo cursor for a query."""
+
+    _get_connected_state(model._meta.database)
+
+    spec = _build_spec(model, q, fields)
+    if projection is None:
+        cursor = _get_collection(model).find(spec)
+    else:
+        cursor = _get_collection(model).find(spec, projection)
+
+    return _check_query_plan(model, spec, cursor)
+
+
+def _get_document_cache(model):
+    """Returns the document cache and time to live for a model.
+
+    The cache will be ``None`` if it hasn't been enabled or if the model
+    doesn't have a time to live.
+    """
+
+    state = _get_state(model._meta.database)
+    if state is None or state.document_cache is None:
+        return None, None
+
+    # The cache is shared by every request, so it can't be used when
+    # requests can use different databases. It also still holds the old
+    # documents of a model whose writes are being held.
+    if state.tenants is not None or _holds_writes(model):
+        return None, None
+
+    ttl = _get_meta_option(model, 'cache_ttl', state.document_cache_ttl)
+    if not ttl:
+        return None, None
+
+    return state.document_cache, ttl
+
+
+def _get_indexed_models(database):
+    """Returns the models using a database that declare indexes."""
+
+    state = _get_connected_state(database)
+    if state is None:
+        raise ConnectionError("There is no connection for database '{0}'. "
+                              "Use `Simon` to connect to "
+                              "it.".format(database))
+
+    from .indexes import get_indexes
+
+    return [m for m in _get_models(state.aliases) if get_indexes(m)]
+
+
+def _get_meta_option(model, name, default=None):
+    """Returns an option from the model's ``Meta`` class.
+
+    Simon only keeps the options it knows about, so any used by
+    Flask-Simon need to be read from the original class.
+    """
+
+    return getattr(getattr(model, 'Meta', None), name, default)
+
+
+def _get_models(aliases):
+    """Returns the models using any of the databases."""
+
+    seen = set()
+    models = SimonModel.__subclasses__()
+    while models:
+        model = models.pop()
+        models.extend(model.__subclasses__())
+
+        if model not in seen and model._meta.database in aliases:
+            seen.add(model)
+            yield model
+
+
+def _get_projection(model, fields=None, exclude=None):
+    """Builds the projection for the names of fields."""
+
+    if not fields and not exclude:
+        return None
+
+    projection = {}
+    for field in fields or ():
+        projection[_map_field(model, field)] = 1
+    for field in exclude or ():
+        projection[_map_field(model, field)] = 0
+    return projection
+
+
+def _get_state(database='default'):
+    """Returns the settings of a database for the current app."""
+
+    if not has_app_context():
+        return None
+
+    return current_app.extensions.get('simon', {}).get(database)
+
+
+def _get_stream_cursor(model, q, batch_size, sort, fields, exclude, query):
+    """Returns the cursor for :meth:`stream_json` and
+    :meth:`stream_ndjson`.
+    """
+
+    projection = _get_projection(model, fields, exclude)
+    cursor = _get_cursor(model, q, query, projection)
+
+    if sort is None:
+        sort = model._meta.sort
+    elif not isinstance(sort, (list, tuple)):
+        sort = (sort,)
+    if sort:
+        cursor.sort(_sort_spec(model, sort))
+
+    cursor.batch_size(batch_size)
+    return cursor
+
+
+def _get_tenants(database):
+    """Returns the tenant registry for a database, if it has one."""
+
+    state = _get_state(database)
+    if state is None:
+        return None
+    return state.tenants
+
+
+def _get_uri_database(uri):
+    """Returns the name of the database in a URI without parsing the
+    rest of it.
+    """
+
+    for scheme in ('mongodb://', 'mongodb+srv://'):
+        if uri.startswith(scheme):
+            break
+    else:
+        raise InvalidURI("Invalid URI scheme: URI must begin with "
+                         "'mongodb://' or 'mongodb+srv://'")
+
+    # This is how PyMongo finds the database: it follows the first
+    # slash after the hosts and comes before the options.
+    path = uri[len(scheme):].partition('/')[2]
+    database = unquote_plus(path.partition('?')[0])
+    return database.split('.', 1)[0]
+
+
+def _get_uri_options(parsed):
+    """Returns the settings found in a parsed URI."""
+
+    options = parsed['options']
+
+    # PyMongo lowercases the names of the options and converts
+    # timeouts from milliseconds to seconds.
+    pool_options = {}
+    for key, option in _POOL_OPTIONS:
+        if option.lower() in options:
+            value = options[option.lower()]
+            if option.endswith('MS') and value is not None:
+                value = int(round(value * 1000))
+            pool_options[option] = value
+
+    return {
+        'username': parsed['username'],
+        'password': parsed['password'],
+        'replica_set': options.get('replicaset', None),
+        'auth_source': options.get('authsource', None),
+        'read_preference': options.get('readpreference', None),
+        'max_staleness': options.get('maxstalenessseconds', None),
+        'pool_options': pool_options,
+    }
+
+
+def _get_validators(model, document, field=None):
+    """Returns the ETag and last modified date of a document, or
+    ``None`` for both if the document doesn't have a version.
+    """
+
+    field = _map_field(model, field or _get_version_field(model))
+    try:
+        version = get_nested_key(document._document, field)
+    except KeyError:
+        version = None
+
+    if version is None:
+        # Without a version, every copy of the document would share the
+        # same ETag and stale copies would be answered with a 304.
+        return None, None
+
+    last_modified = None
+    if isinstance(version, datetime.datetime):
+        last_modified = version
+
+    return make_etag(document._document.get('_id'), version), last_modified
+
+
+def _get_version_field(model):
+    """Returns the name of the field holding a model's version."""
+
+    field = _get_meta_option(model, 'version_field')
+    if field is None and model._meta.auto_timestamp:
+        field = 'modified'
+    if field is None:
+        message = ("'{0}' doesn't have a version. Set version_field on its "
+                   "Meta class.".format(model.__name__))
+        raise ValueError(message)
+    return field
+
+
+def _hash_pipeline(pipeline):
+    """Returns a hash of an aggregation pipeline.
+
+    The pipeline is encoded as BSON rather than frozen because the order
+    of the keys in some stages, such as ``$sort``, matters.
+    """
+
+    import hashlib
+
+    return hashlib.sha1(BSON.encode({'pipeline': pipeline})).hexdigest()
+
+
+def _holds_writes(model):
+    """Returns whether or not the unit of work is holding writes made by
+    a model's documents.
+    """
+
+    work = get_unit_of_work(model._meta.database)
+    return work is not None and work.holds(model)
+
+
+def _load_attribute(name):
+    """Imports an attribute listed in ``_lazy_attributes`` and keeps it
+    in the module so that this is only called once for it.
+    """
+
+    if name not in _lazy_attributes:
+        message = "module '{0}' has no attribute '{1}'".format(__name__,
+                                                               name)
+        raise AttributeError(message)
+
+    module_name, attribute = _lazy_attributes[name]
+    value = __import__(module_name, fromlist=['__name__'])
+    if attribute is not None:
+        value = getattr(value, attribute)
+
+    globals()[name] = value
+    return value
+
+
+def _map_field(model, field):
+    """Returns the name of the field in the database."""
+
+    return list(map_fields(model._meta.field_map, {field: 1},
+                           flatten_keys=True))[0]
+
+
+def _register_commands(app):
+    """Adds the ``simon`` commands to the app's command line interface.
+
+    The command line interface was added in Flask 0.11.
+    """
+
+    if 'simon' in app.cli.commands:
+        return
+
+    import click
+    from flask.cli import AppGroup
+
+    group = AppGroup('simon', help='Manage the MongoDB databases.')
+
+    @group.command('ensure-indexes')
+    @click.option('--database', default='default',
+                  help='The alias of the database.')
+    @click.option('--dry-run', is_flag=True,
+                  help='Report the missing and extra indexes without '
+                       'creating any.')
+    def ensure_indexes_command(database, dry_run):
+        """Create the indexes declared by the models."""
+
+        if not dry_run:
+            for name, indexes in sorted(ensure_indexes(database).items()):
+                click.echo('{0}: {1}'.format(name, ', '.join(indexes)))
+            return
+
+        for name, report in sorted(get_index_report(database).items()):
+            click.echo('{0}: {1} missing, {2} extra'.format(
+                name, len(report['missing']), len(report['extra'])))
+            for keys in report['missing']:
+                click.echo('  missing: {0}'.format(', '.join(
+                    '{0} {1}'.format(*key) for key in keys)))
+            for index in report['extra']:
+                click.echo('  extra: {0}'.format(index))
+
+    app.cli.add_command(group)
+
+
+def _reset_models(aliases):
+    """Makes models using the databases load their collections again."""
+
+    for model in _get_models(aliases):
+        # Simon keeps the collection the first time it's used.
+        model._meta._db = None
+
+
+def _session_used():
+    """Returns whether the current request read or modified the
+    session.
+    """
+
+    accessed = getattr(session, 'accessed', None)
+    if accessed is None:
+        # Flask before 1.0 doesn't record reads, so assume that a
+        # session that was sent is used.
+        return session.modified or bool(session)
+    return accessed or session.modified
+
+
+def _set_uri_settings(config, prefix, name, options):
+    """Copies the settings found in a URI to their own keys."""
+
+    def prefixed(name):
+        """Prepends the prefix to the key name."""
+
+        return '{0}_{1}'.format(prefix, name)
+
+    config[prefixed('DBNAME')] = name
+    config[prefixed('USERNAME')] = options['username']
+    config[prefixed('PASSWORD')] = options['password']
+    config[prefixed('REPLICA_SET')] = options['replica_set']
+
+    if options['read_preference'] is not None:
+        config[prefixed('READ_PREFERENCE')] = options['read_preference']
+    if options['max_staleness'] is not None:
+        config[prefixed('MAX_STALENESS_SECONDS')] = options['max_staleness']
+
+    for key, option in _POOL_OPTIONS:
+        if option in options['pool_options']:
+            config[prefixed(key)] = options['pool_options'][option]
+
+
+def _sort_spec(model, fields):
+    """Builds the sort specification for the names of fields."""
+
+    sorting = []
+    for field in fields:
+        if field.startswith('-'):
+            sorting.append((_map_field(model, field[1:]), DESCENDING))
+        else:
+            sorting.append((_map_field(model, field), ASCENDING))
+    return sorting
+
+
+def _start_counting(app, cache, model, spec, counter, ttl):
+    """Refreshes a count in the count cache in a background thread."""
+
+    def refresh():
+        try:
+            cache.add(model, spec, counter(), ttl)
+        finally:
+            cache.stop_refresh(model, spec)
+
+    message = "Couldn't count the documents of '{0}'.".format(
+        model.__name__)
+    return _start_thread(app, refresh, message)
+
+
+def _start_ensuring_indexes(app, database):
+    """Creates the indexes for a database in a background thread."""
+
+    message = "Couldn't create the indexes for database '{0}'.".format(
+        database)
+    return _start_thread(app, lambda: ensure_indexes(database), message)
+
+
+def _start_thread(app, target, message):
+    """Calls a function with an app context in a daemon thread.
+
+    Any exception raised by the function is logged with ``message``.
+    """
+
+    # Flask 0.8 doesn't have app contexts.
+    context = getattr(app, 'app_context', app.test_request_context)
+
+    def work():
+        with context():
+            try:
+                target()
+            except Exception:
+                logger.exception(message)
+
+    thread = threading.Thread(target=work)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def _store_cached_responses(response):
+    """Keeps the response to a request for the views decorated with
+    :func:`cached`.
+
+    This runs after the view but before the session is saved, so a
+    response that depends on the session is recognized by the session
+    having been used rather than by its cookie.
+    """
+
+    pending = getattr(g, 'simon_cached_responses', None)
+    if not pending:
+        return response
+    g.simon_cached_responses = []
+
+    # A response for one client mustn't be sent to the others.
+    vary = set(value.strip().lower()
+               for value in response.headers.get('Vary', '').split(','))
+    if (response.status_code != 200 or response.is_streamed or
+            'Set-Cookie' in response.headers or 'cookie' in vary or
+            '*' in vary or session.modified):
+        return response
+
+    used = _session_used()
+    entry = (response.data, response.status, list(response.headers))
+    for cache, key, collections, ttl, generation, keyed in pending:
+        # The responses of views with a key are kept separately for
+        # each value of it, so they're allowed to read the session,
+        # e.g., to find the current user.
+        if keyed or not used:
+            cache.add(key, collections, entry, ttl, generation)
+    return response
+
+
+@contextmanager
+def _writing(document):
+    """Marks the writes made within the block as being made by
+    ``document``.
+    """
+
+    work = get_unit_of_work(document._meta.database)
+    if work is None:
+        yield
+    else:
+        with work.writing(document):
+            yield
+
+
+if hasattr(os, 'register_at_fork'):
+    # Python 3.7+
+    os.register_at_fork(after_in_child=_after_fork)
+
+if sys.version_info >= (3, 7):
+    __getattr__ = _load_attribute
+elif sys.version_info >= (3, 5):
+    # Modules can't define __getattr__() until Python 3.7, but their
+    # class can be replaced with one that does starting with 3.5.
+    class _LazyModule(types.ModuleType):
+        def __getattr__(self, name):
+            return _load_attribute(name)
+
+    sys.modules[__name__].__class__ = _LazyModule
+else:
+    for _name in _lazy_attributes:
+        _load_attribute(_name)
+    del _name
@@ -0,0 +1,302 @@
+"""Asynchronous access to the database through Motor
+
+This module requires Python 3.5 or newer and Motor. Unlike the rest of
+Flask-Simon's modules, it isn't imported by :mod:`flask_simon` and must
+be imported directly.
+"""
+
+import asyncio
+from collections import deque
+import threading
+
+from flask import abort, current_app
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+from simon.exceptions import ConnectionError
+
+from . import (ObjectIDConverter, ObjectIDListConverter, _build_spec,
+               _get_connection_settings, _get_meta_option, _get_projection,
+               _sort_spec)
+from .read_preferences import make_read_preference
+
+__all__ = ('AsyncQuerySet', 'AsyncSimon', 'find_async', 'get_or_404_async')
+
+
+class AsyncQuerySet(object):
+    """The documents matching a query, loaded asynchronously.
+
+    Query sets are returned by :meth:`find_async`. The documents can be
+    loaded with ``async for`` or :meth:`to_list`. Either way, only
+    ``batch_size`` documents are loaded at a time.
+
+    .. code-block:: python
+
+        async for entry in find_async(Entry, published=True):
+            ...
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, model, collection, spec, cursor, batch_size=100):
+        self._model = model
+        self._collection = collection
+        self._spec = spec
+        self._cursor = cursor
+        self._batch_size = batch_size
+
+        self._buffer = deque()
+        self._exhausted = False
+
+    async def count(self):
+        """Returns the number of documents matching the query.
+
+        :returns: int -- the number of documents.
+        """
+
+        return await self._collection.count_documents(self._spec)
+
+    async def to_list(self, length=None):
+        """Loads the documents into a list.
+
+        :param length: (optional) the maximum number of documents to
+                       load. Defaults to all of them.
+        :type length: int
+        :returns: list -- instances of the model.
+        """
+
+        documents = await self._cursor.to_list(length=length)
+        return [self._model(**document) for document in documents]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._buffer:
+            if not self._exhausted:
+                documents = await self._cursor.to_list(
+                    length=self._batch_size)
+                self._buffer.extend(documents)
+                self._exhausted = not documents
+            if not self._buffer:
+                raise StopAsyncIteration
+
+        return self._model(**self._buffer.popleft())
+
+
+class AsyncSimon(object):
+    """Connects a Flask app to MongoDB through Motor.
+
+    It's configured with the same settings as :class:`flask_simon.Simon`
+    (``MONGO_URI`` or ``MONGO_HOST`` and friends, the connection pool
+    settings, and ``MONGO_READ_PREFERENCE``) and both can be used with
+    the same app.
+
+    .. code-block:: python
+
+        from flask_simon import Simon
+        from flask_simon.aio import AsyncSimon, get_or_404_async
+
+        app = Flask(__name__)
+        Simon(app)
+        AsyncSimon(app)
+
+        @app.route('/entries/<objectid:id>')
+        async def show_entry(id):
+            entry = await get_or_404_async(Entry, id=id)
+            return render_template('show_entry.html', entry=entry)
+
+    Motor clients can't be shared between event loops, so a client is
+    created for each event loop the first time it's used and closed once
+    the event loop has been closed. Documents loaded through this module
+    don't use the identity map or the document cache.
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, app=None, prefix='MONGO', alias=None):
+        if app is not None:
+            self.init_app(app, prefix, alias)
+
+    def init_app(self, app, prefix='MONGO', alias=None):
+        """Initializes the extension for an app.
+
+        See :meth:`flask_simon.Simon.init_app` for the arguments.
+
+        :raises: :class:`RuntimeError` if Motor isn't installed.
+        """
+
+        if AsyncIOMotorClient is None:
+            raise RuntimeError('AsyncSimon requires Motor.')
+
+        if 'simon_async' not in app.extensions:
+            app.extensions['simon_async'] = {}
+
+        app.url_map.converters['objectid'] = ObjectIDConverter
+        app.url_map.converters['objectids'] = ObjectIDListConverter
+
+        settings = _get_connection_settings(app, prefix)
+
+        read_preference = app.config.get(
+            '{0}_READ_PREFERENCE'.format(prefix))
+        if read_preference:
+            read_preference = make_read_preference(
+                read_preference,
+                app.config.get('{0}_MAX_STALENESS_SECONDS'.format(prefix)))
+
+        state = _AsyncState(alias or settings['name'], settings,
+                            read_preference or None)
+
+        states = app.extensions['simon_async']
+        states[state.alias] = state
+        if 'default' not in states or states['default'].alias == state.alias:
+            states['default'] = state
+
+    def get_client(self, database='default'):
+        """Returns the Motor client for the current event loop.
+
+        :param database: (optional) the alias of the database.
+        :type database: str
+        :returns: :class:`~motor.motor_asyncio.AsyncIOMotorClient` --
+                  the client.
+        :raises: :class:`~simon.exceptions.ConnectionError`
+        """
+
+        return _get_state(database).get_client()
+
+
+class _AsyncState(object):
+    """Remembers the settings of a database connection."""
+
+    def __init__(self, alias, settings, read_preference=None):
+        self.alias = alias
+        self.name = settings['name']
+        self.read_preference = read_preference
+
+        self.host = settings['host']
+        self.options = dict(settings['pool_options'])
+        if settings['replica_set']:
+            self.options['replicaSet'] = settings['replica_set']
+        if settings['username']:
+            self.options['username'] = settings['username']
+            self.options['password'] = settings['password']
+            # Simon authenticates against the app's database, but
+            # PyMongo would use admin for credentials passed on their own.
+            if not settings['auth_source']:
+                self.options.setdefault('authSource', self.name)
+
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get_client(self):
+        loop = asyncio.get_event_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                self._close_clients()
+                client = self._clients[loop] = AsyncIOMotorClient(
+                    self.host, io_loop=loop, **self.options)
+        return client
+
+    def get_collection(self, model):
+        collection = self.get_client()[self.name][model._meta.collection]
+        if self.read_preference is not None:
+            collection = collection.with_options(
+                read_preference=self.read_preference)
+        return collection
+
+    def _close_clients(self):
+        """Closes the clients of the event loops that have been closed."""
+
+        # Each client holds on to its event loop, so the loops would
+        # never be garbage collected.
+        for loop in list(self._clients):
+            if loop.is_closed():
+                self._clients.pop(loop).close()
+
+
+def find_async(model, q=None, sort=None, batch_size=100, **fields):
+    """Finds the documents matching a query.
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :param q: (optional) a logical query.
+    :type q: :class:`simon.query.Q`
+    :param sort: (optional) the names of the fields to sort by.
+                 Defaults to the model's ``Meta.sort``.
+    :type sort: str, list, or tuple
+    :param batch_size: (optional) the number of documents to load at a
+                       time.
+    :type batch_size: int
+    :param \\*\\*fields: keyword arguments specifying the query.
+    :type \\*\\*fields: kwargs
+    :returns: :class:`AsyncQuerySet` -- the documents.
+    :raises: :class:`~simon.exceptions.ConnectionError`
+
+    .. versionadded:: 0.4.0
+    """
+
+    collection = _get_state(model._meta.database).get_collection(model)
+    spec = _build_spec(model, q, fields)
+
+    cursor = collection.find(spec)
+    if sort is None:
+        sort = model._meta.sort
+    elif not isinstance(sort, (list, tuple)):
+        sort = (sort,)
+    if sort:
+        cursor.sort(_sort_spec(model, sort))
+    cursor.batch_size(batch_size)
+
+    return AsyncQuerySet(model, collection, spec, cursor, batch_size)
+
+
+async def get_or_404_async(model, q=None, **fields):
+    """Finds and returns a single document, or raises a 404 exception.
+
+    This is the asynchronous version of :meth:`flask_simon.get_or_404`,
+    including its ``fields`` and ``exclude`` arguments.
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :param q: (optional) a logical query.
+    :type q: :class:`simon.query.Q`
+    :param \\*\\*fields: keyword arguments specifying the query.
+    :type \\*\\*fields: kwargs
+    :returns: :class:`~simon.Model` -- an instance of a model.
+    :raises: :class:`~simon.exceptions.ConnectionError`
+
+    .. versionadded:: 0.4.0
+    """
+
+    if 'fields' in fields or 'exclude' in fields:
+        projection = _get_projection(model, fields.pop('fields', None),
+                                     fields.pop('exclude', None))
+    else:
+        projection = _get_projection(model,
+                                     _get_meta_option(model, 'fields'),
+                                     _get_meta_option(model, 'exclude'))
+
+    collection = _get_state(model._meta.database).get_collection(model)
+    spec = _build_spec(model, q, fields)
+
+    # Loading a second document is enough to know that the query matched
+    # more than one.
+    cursor = collection.find(spec, projection).limit(2)
+    documents = await cursor.to_list(length=2)
+    if len(documents) != 1:
+        abort(404)
+
+    return model(**documents[0])
+
+
+def _get_state(database='default'):
+    """Returns the settings for a database."""
+
+    state = current_app.extensions.get('simon_async', {}).get(database)
+    if state is None:
+        raise ConnectionError("There is no connection for database '{0}'. "
+                              "Use `AsyncSimon` to connect to "
+                              "it.".format(database))
+    return state
@@ -0,0 +1,621 @@
+"""Caching of documents loaded through Simon models and of the responses
+built from them
+"""
+
+from collections import OrderedDict
+import copy
+import threading
+import time
+
+from bson import BSON
+
+__all__ = ('CountCache', 'DocumentCache', 'IdentityMap', 'ResponseCache',
+           'ResultCache')
+
+
+def freeze(value):
+    """Return a hashable version of a query.
+
+    ``dict`` instances are converted to sorted tuples of their items
+    and ``list`` instances are converted to tuples so that two queries
+    that look the same will also produce the same key.
+
+    :param value: the query or query value.
+    :returns: a hashable version of ``value``.
+
+    .. versionadded:: 0.4.0
+    """
+
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def _is_id_query(query):
+    """Check whether a frozen query only matches on ``_id``."""
+
+    return len(query) == 1 and query[0][0] == '_id'
+
+
+class CountCache(object):
+    """Holds the number of documents matching queries.
+
+    Counts are stored the same way as documents are stored by
+    :class:`DocumentCache` and are kept until their time to live
+    expires. Expired counts can still be read through :meth:`peek` so
+    that they can be used while they're being refreshed, but only for as
+    long again as their time to live. After that they're removed the
+    next time they're read unless they're being refreshed. When the
+    cache holds more than ``max_entries`` counts, the least recently
+    used counts will be removed.
+
+    :param max_entries: (optional) the maximum number of entries.
+    :type max_entries: int
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+
+        # Only used by ResultCache. Counts are added with a size of 0.
+        self.size = 0
+
+        self._counts = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def add(self, model, query, count, ttl):
+        """Adds a count to the cache.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        :param query: the query that was counted.
+        :type query: dict
+        :param count: the number of documents.
+        :type count: int
+        :param ttl: the number of seconds to keep the count.
+        :type ttl: int
+        """
+
+        self._add((model, freeze(query)), count, ttl)
+
+    def clear(self):
+        """Removes all counts from the cache."""
+
+        with self._lock:
+            self._counts.clear()
+            self._refreshing.clear()
+            self.size = 0
+
+    def get(self, model, query):
+        """Returns a count from the cache.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        :param query: the query that was counted.
+        :type query: dict
+        :returns: int -- the number of documents, or ``None`` if it
+                  isn't in the cache.
+        """
+
+        key = (model, freeze(query))
+
+        with self._lock:
+            entry = self._counts.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    self._release(entry)
+                return None
+
+            # Put the entry back at the end to mark it as the most
+            # recently used.
+            self._counts[key] = entry
+        return entry[1]
+
+    def invalidate(self, model):
+        """Expires all of a model's counts.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        """
+
+        with self._lock:
+            for key in [k for k in self._counts if k[0] is model]:
+                self._counts[key] = (0,) + self._counts[key][1:]
+
+    def peek(self, model, query):
+        """Returns a count from the cache, even if it has expired.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        :param query: the query that was counted.
+        :type query: dict
+        :returns: tuple -- the number of documents, or ``None`` if it
+                  isn't in the cache, and whether or not it has expired.
+        """
+
+        key = (model, freeze(query))
+        now = time.time()
+
+        with self._lock:
+            entry = self._counts.pop(key, None)
+            if entry is None:
+                return None, True
+            if entry[2] < now and key not in self._refreshing:
+                # The count is too old to be used while it's refreshed.
+                self._release(entry)
+                return None, True
+
+            self._counts[key] = entry
+        return entry[1], entry[0] < now
+
+    def start_refresh(self, model, query):
+        """Marks a count as being refreshed.
+
+        The mark is removed when the count is added again or by
+        :meth:`stop_refresh`.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        :param query: the query that was counted.
+        :type query: dict
+        :returns: bool -- ``False`` if the count is already being
+                  refreshed.
+        """
+
+        key = (model, freeze(query))
+
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def stop_refresh(self, model, query):
+        """Removes the mark added by :meth:`start_refresh`.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        :param query: the query that was counted.
+        :type query: dict
+        """
+
+        with self._lock:
+            self._refreshing.discard((model, freeze(query)))
+
+    def _add(self, key, value, ttl, size=0):
+        expires = time.time() + ttl
+
+        with self._lock:
+            entry = self._counts.pop(key, None)
+            if entry is not None:
+                self._release(entry)
+
+            self._counts[key] = (expires, value, expires + ttl, size)
+            self._refreshing.discard(key)
+            self.size += size
+
+            self._evict()
+
+    def _evict(self):
+        """Removes the least recently used counts."""
+
+        while (self.max_entries is not None and
+               len(self._counts) > self.max_entries):
+            self._release(self._counts.popitem(last=False)[1])
+
+    def _release(self, entry):
+        self.size -= entry[3]
+
+    def __len__(self):
+        return len(self._counts)
+
+
+class DocumentCache(object):
+    """Holds documents across requests.
+
+    Documents are kept until their time to live expires or they are
+    pushed out by newer documents. When the cache holds more than
+    ``max_entries`` documents, or the documents take up more than
+    ``max_bytes`` (as measured by the size of their BSON encoding), the
+    least recently used documents will be removed.
+
+    The raw documents are stored in the cache and each lookup returns a
+    new instance of the model so that changes made to an instance in one
+    request can't leak into another.
+
+    Documents are stored the same way as with :class:`IdentityMap`.
+
+    :param max_entries: (optional) the maximum number of entries.
+    :type max_entries: int
+    :param max_bytes: (optional) the maximum size of all documents.
+    :type max_bytes: int
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+        # The number of entries holding each raw document, keyed by id().
+        self._shares = {}
+
+    def add(self, model, query, document, ttl):
+        """Adds a document to the cache.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        :param query: the query used to load the document.
+        :type query: dict
+        :param document: the document.
+        :type document: :class:`simon.Model`
+        :param ttl: the number of seconds to keep the document.
+        :type ttl: int
+        """
+
+        raw = copy.deepcopy(document._document)
+        size = len(BSON.encode(raw))
+        if self.max_bytes is not None and size > self.max_bytes:
+            # The document would push everything else out.
+            return
+
+        keys = [(model, freeze(query))]
+        document_id = raw.get('_id')
+        if document_id is not None:
+            key = (model, freeze({'_id': document_id}))
+            if key not in keys:
+                keys.append(key)
+
+        entry = (time.time() + ttl, size, document_id, raw)
+
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+                self._documents[key] = entry
+
+            # Both entries hold the same raw document, so its size is
+            # only counted once.
+            self._shares[id(raw)] = len(keys)
+            self.size += size
+
+            self._evict()
+
+    def clear(self):
+        """Removes all documents from the cache."""
+
+        with self._lock:
+            self._documents.clear()
+            self._shares.clear()
+            self.size = 0
+
+    def get(self, model, query):
+        """Returns a document from the cache.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        :param query: the query used to load the document.
+        :type query: dict
+        :returns: :class:`~simon.Model` -- a new instance of the
+                  document, or ``None`` if it isn't in the cache.
+        """
+
+        key = (model, freeze(query))
+
+        with self._lock:
+            entry = self._documents.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    self._release(entry)
+                self.misses += 1
+                return None
+
+            # Put the entry back at the end to mark it as the most
+            # recently used.
+            self._documents[key] = entry
+            self.hits += 1
+
+        return model(**copy.deepcopy(entry[3]))
+
+    def invalidate(self, model, id=None):
+        """Removes a model's documents from the cache.
+
+        When ``id`` is provided, only the entries for that document will
+        be removed along with the entries loaded through any query other
+        than one for a single ``_id``, as the change may affect which
+        document those queries match.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        :param id: (optional) the ``_id`` of the document that changed.
+        """
+
+        with self._lock:
+            for key, entry in list(self._documents.items()):
+                if key[0] is not model:
+                    continue
+                if id is not None and entry[2] != id and _is_id_query(key[1]):
+                    continue
+                self._remove(key)
+
+    def _evict(self):
+        """Removes the least recently used documents."""
+
+        while self._documents and (
+                (self.max_entries is not None and
+                 len(self._documents) > self.max_entries) or
+                (self.max_bytes is not None and self.size > self.max_bytes)):
+            self._release(self._documents.popitem(last=False)[1])
+
+    def _release(self, entry):
+        """Stops counting a document's size once the last entry holding
+        it has been removed.
+        """
+
+        key = id(entry[3])
+        shares = self._shares.pop(key) - 1
+        if shares:
+            self._shares[key] = shares
+        else:
+            self.size -= entry[1]
+
+    def _remove(self, key):
+        entry = self._documents.pop(key, None)
+        if entry is not None:
+            self._release(entry)
+
+    def __len__(self):
+        return len(self._documents)
+
+
+class IdentityMap(object):
+    """Holds the documents loaded during a single request.
+
+    Documents are stored by the query that was used to load them as
+    well as by their ``_id`` so that looking a document up by its
+    ``_id`` after loading it with some other query doesn't require
+    another trip to the database.
+
+    The number of lookups that were served from the map are available
+    through ``hits``. The number that weren't are available through
+    ``misses``.
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+        self._documents = {}
+
+    def add(self, model, query, document):
+        """Adds a document to the map.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        :param query: the query used to load the document.
+        :type query: dict
+        :param document: the document.
+        :type document: :class:`simon.Model`
+        """
+
+        self._documents[(model, freeze(query))] = document
+
+        id = document._document.get('_id')
+        if id is not None:
+            self._documents[(model, freeze({'_id': id}))] = document
+
+    def clear(self):
+        """Removes all documents from the map."""
+
+        self._documents.clear()
+
+    def get(self, model, query):
+        """Returns a document from the map.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        :param query: the query used to load the document.
+        :type query: dict
+        :returns: :class:`~simon.Model` -- the document, or ``None``
+                  if it isn't in the map.
+        """
+
+        try:
+            document = self._documents[(model, freeze(query))]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return document
+
+    def invalidate(self, model):
+        """Removes all of a model's documents from the map.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        """
+
+        for key in [k for k in self._documents if k[0] is model]:
+            del self._documents[key]
+
+    def __len__(self):
+        return len(self._documents)
+
+
+class ResponseCache(object):
+    """Holds responses until the collections they were built from change.
+
+    Responses are stored under a key along with the names of the
+    collections they depend on. Invalidating a collection removes every
+    response that depends on it. Responses are also removed once their
+    time to live expires, and the least recently used ones are removed
+    once there are more than ``max_entries``.
+
+    To keep a response that was built while one of its collections was
+    changing from being stored, :attr:`generation` should be read before
+    building the response and passed to :meth:`add`.
+
+    :param max_entries: (optional) the maximum number of responses.
+    :type max_entries: int
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+
+        #: The number of times the cache has been invalidated.
+        self.generation = 0
+
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, key, collections, response, ttl, generation=None):
+        """Adds a response to the cache.
+
+        :param key: the key to store the response under.
+        :param collections: the names of the collections the response
+                            depends on.
+        :type collections: list
+        :param response: the response.
+        :param ttl: the number of seconds to keep the response.
+        :type ttl: int
+        :param generation: (optional) the :attr:`generation` from before
+                           the response was built. The response won't be
+                           stored if the cache has been invalidated
+                           since.
+        :type generation: int
+        """
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            self._responses.pop(key, None)
+            self._responses[key] = (time.time() + ttl,
+                                    frozenset(collections), response)
+
+            while (self.max_entries is not None and
+                   len(self._responses) > self.max_entries):
+                self._responses.popitem(last=False)
+
+    def clear(self):
+        """Removes all responses from the cache."""
+
+        with self._lock:
+            self._responses.clear()
+
+    def collections(self):
+        """Returns the names of the collections the responses depend on.
+
+        :returns: set -- the names.
+        """
+
+        with self._lock:
+            names = set()
+            for entry in self._responses.values():
+                names.update(entry[1])
+            return names
+
+    def get(self, key):
+        """Returns a response from the cache.
+
+        :param key: the key the response was stored under.
+        :returns: the response, or ``None`` if it isn't in the cache.
+        """
+
+        with self._lock:
+            entry = self._responses.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                return None
+
+            # Put the entry back at the end to mark it as the most
+            # recently used.
+            self._responses[key] = entry
+            return entry[2]
+
+    def invalidate(self, collection=None):
+        """Removes the responses that depend on a collection.
+
+        :param collection: (optional) the name of the collection. All
+                           responses are removed if it isn't provided.
+        :type collection: str
+        """
+
+        with self._lock:
+            self.generation += 1
+
+            if collection is None:
+                self._responses.clear()
+                return
+
+            for key, entry in list(self._responses.items()):
+                if collection in entry[1]:
+                    del self._responses[key]
+
+    def __len__(self):
+        return len(self._responses)
+
+
+class ResultCache(CountCache):
+    """Holds the results of aggregation pipelines.
+
+    Results are stored under the model and a hash of the pipeline, and
+    are kept and expired the same way as counts are by
+    :class:`CountCache`. When the cache holds more than ``max_entries``
+    results, or the results take up more than ``max_bytes`` (as measured
+    by the size of their BSON encoding), the least recently used results
+    will be removed. The cache doesn't copy the results, so they
+    shouldn't be changed after they've been added.
+
+    :param max_entries: (optional) the maximum number of entries.
+    :type max_entries: int
+    :param max_bytes: (optional) the maximum size of all results.
+    :type max_bytes: int
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        super(ResultCache, self).__init__(max_entries)
+        self.max_bytes = max_bytes
+
+    def add(self, model, query, results, ttl):
+        """Adds results to the cache.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        :param query: the hash of the pipeline.
+        :type query: str
+        :param results: the resulting documents.
+        :type results: list
+        :param ttl: the number of seconds to keep the results.
+        :type ttl: int
+        """
+
+        size = len(BSON.encode({'results': results}))
+        if self.max_bytes is not None and size > self.max_bytes:
+            # The results would push everything else out.
+            return
+
+        self._add((model, freeze(query)), results, ttl, size)
+
+    def _evict(self):
+        """Removes the least recently used results."""
+
+        super(ResultCache, self)._evict()
+        while (self.max_bytes is not None and self._counts and
+               self.size > self.max_bytes):
+            self._release(self._counts.popitem(last=False)[1])
@@ -0,0 +1,132 @@
+"""Watching the database for changes made by other processes"""
+
+import logging
+import threading
+
+try:
+    from pymongo.change_stream import ChangeStream
+except ImportError:
+    # Change streams were added in PyMongo 3.6.
+    ChangeStream = None
+from pymongo.errors import OperationFailure
+
+__all__ = ('ChangeWatcher', 'supports_change_streams')
+
+logger = logging.getLogger('flask_simon')
+
+# Whole databases can be watched starting with PyMongo 3.7, and
+# try_next() was added in 3.8.
+supports_change_streams = (ChangeStream is not None and
+                           hasattr(ChangeStream, 'try_next'))
+
+
+class ChangeWatcher(object):
+    """Calls a function with the name of each collection that changes.
+
+    A change stream on the database is used when possible. Standalone
+    servers don't support change streams, so when one can't be opened,
+    or with older versions of PyMongo, the hashes of the collections
+    returned by ``get_collections`` are compared every ``interval``
+    seconds instead. Computing the hashes reads every document in the
+    collections, so polling is best suited to small collections.
+
+    ``callback`` is called with ``None`` when any collection may have
+    changed without being reported, such as when a change stream is
+    opened.
+
+    :param get_database: a callable that returns the database.
+    :type get_database: callable
+    :param callback: the callable to call with the name of each
+                     collection that changes.
+    :type callback: callable
+    :param get_collections: a callable that returns the names of the
+                            collections to compare when polling.
+    :type get_collections: callable
+    :param interval: (optional) the number of seconds between polls, and
+                     to wait before trying again after an error.
+    :type interval: int
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, get_database, callback, get_collections, interval=5):
+        self.get_database = get_database
+        self.callback = callback
+        self.get_collections = get_collections
+        self.interval = interval
+
+        self.streaming = supports_change_streams
+
+        self._hashes = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts watching in a daemon thread."""
+
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops watching."""
+
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(self.interval + 1)
+
+    def poll(self):
+        """Compares the hashes of the collections with the last ones."""
+
+        names = sorted(self.get_collections())
+        if not names:
+            return
+
+        database = self.get_database()
+        hashes = database.command('dbHash', collections=names)['collections']
+
+        for name in names:
+            # Collections seen for the first time are reported because
+            # anything cached before then can't be trusted.
+            hash = hashes.get(name)
+            if name not in self._hashes or self._hashes[name] != hash:
+                self.callback(name)
+            self._hashes[name] = hash
+
+    def watch(self):
+        """Reports changes from a change stream until it's closed or the
+        watcher is stopped.
+        """
+
+        try:
+            stream = self.get_database().watch(max_await_time_ms=1000)
+        except OperationFailure:
+            logger.info("Change streams aren't supported. Polling for "
+                        "changes every {0} seconds.".format(self.interval))
+            self.streaming = False
+            return
+
+        with stream:
+            # Changes made before the stream was opened weren't seen.
+            self.callback(None)
+
+            while not self._stopped.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    self.callback(change.get('ns', {}).get('coll'))
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                if self.streaming:
+                    self.watch()
+                    if not self.streaming:
+                        continue
+                else:
+                    self.poll()
+            except Exception:
+                logger.exception("Couldn't watch the database for changes.")
+            self._stopped.wait(self.interval)
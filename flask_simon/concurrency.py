@@ -0,0 +1,126 @@
+"""Running independent queries at the same time"""
+
+import threading
+
+try:
+    # Flask 2.2 and greater keep the contexts in context variables, which
+    # can be copied into each thread.
+    from contextvars import copy_context
+    from flask.globals import app_ctx  # NOQA
+except ImportError:
+    copy_context = None
+    try:
+        from flask import _app_ctx_stack
+    except ImportError:
+        # Flask 0.8
+        _app_ctx_stack = None
+    from flask import _request_ctx_stack
+
+from .read_preferences import _local, get_read_preference
+
+__all__ = ('run_concurrently',)
+
+
+def run_concurrently(queries, max_workers=4):
+    """Runs queries at the same time and returns their results.
+
+    ``queries`` maps names to callables that take no arguments. Each
+    callable is run on one of up to ``max_workers`` threads, and the
+    return values are collected into a ``dict`` using the same names.
+    The time taken is close to that of the slowest query rather than the
+    total of all of them.
+
+    .. code-block:: python
+
+        @app.route('/dashboard')
+        def dashboard():
+            results = run_concurrently({
+                'user': lambda: get_or_404(User, id=session['user_id']),
+                'entries': lambda: list(Entry.find(published=True)[:10]),
+                'drafts': Entry.find(published=False).count,
+            })
+            return render_template('dashboard.html', **results)
+
+    The current app and request contexts and the read preference set
+    through :class:`~flask_simon.read_preference` are made available to
+    each thread, so ``g``, ``request``, the identity map, and the rest of
+    Flask-Simon work the same way they do in the view. The threads share
+    the connection pool, so ``max_workers`` should be less than
+    ``MONGO_MAX_POOL_SIZE``.
+
+    If any of the queries raises an exception, the exception raised by
+    the first one to fail will be raised once all of them have finished.
+
+    :param queries: the queries to run.
+    :type queries: dict
+    :param max_workers: (optional) the maximum number of threads.
+    :type max_workers: int
+    :returns: dict -- the results.
+
+    .. versionadded:: 0.4.0
+    """
+
+    if max_workers < 1:
+        raise ValueError('max_workers must be at least 1.')
+
+    # The contexts are pushed onto each worker's stacks directly rather
+    # than through push() so that they aren't torn down by the workers.
+    contexts = []
+    if copy_context is None:
+        if _app_ctx_stack is not None and _app_ctx_stack.top is not None:
+            contexts.append((_app_ctx_stack, _app_ctx_stack.top))
+        if _request_ctx_stack.top is not None:
+            contexts.append((_request_ctx_stack, _request_ctx_stack.top))
+
+    # The read preference is kept separately for each thread.
+    preference = get_read_preference()
+
+    pending = iter(list(queries.items()))
+    results = {}
+    errors = []
+    lock = threading.Lock()
+
+    def work():
+        for stack, ctx in contexts:
+            stack.push(ctx)
+        if preference is not None:
+            _local.stack = [preference]
+        try:
+            while True:
+                with lock:
+                    try:
+                        name, query = next(pending)
+                    except StopIteration:
+                        return
+
+                try:
+                    result = query()
+                except Exception as e:
+                    with lock:
+                        errors.append(e)
+                else:
+                    with lock:
+                        results[name] = result
+        finally:
+            for stack, ctx in reversed(contexts):
+                stack.pop()
+
+    workers = []
+    for _ in range(min(max_workers, len(queries))):
+        if copy_context is None:
+            worker = threading.Thread(target=work)
+        else:
+            # A context can only be entered by one thread at a time.
+            worker = threading.Thread(target=copy_context().run,
+                                      args=(work,))
+        workers.append(worker)
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    if errors:
+        raise errors[0]
+
+    return results
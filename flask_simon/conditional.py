@@ -0,0 +1,109 @@
+"""Answering conditional requests without sending the document again"""
+
+import datetime
+import hashlib
+
+from flask import Response, request
+
+__all__ = ('is_not_modified', 'make_etag', 'not_modified_response',
+           'set_validators')
+
+
+def is_not_modified(etag=None, last_modified=None):
+    """Checks whether the client's copy of the current request's
+    resource is up to date.
+
+    ``If-None-Match`` is checked against ``etag`` when it was sent.
+    Otherwise ``If-Modified-Since`` is checked against
+    ``last_modified``. Only ``GET`` and ``HEAD`` requests can be answered
+    this way.
+
+    :param etag: (optional) the ETag of the resource.
+    :type etag: str
+    :param last_modified: (optional) when the resource was last
+                          modified, in UTC.
+    :type last_modified: :class:`~datetime.datetime`
+    :returns: bool -- ``True`` if the client's copy is up to date.
+
+    .. versionadded:: 0.4.0
+    """
+
+    if request.method not in ('GET', 'HEAD'):
+        return False
+
+    if request.if_none_match:
+        return etag is not None and request.if_none_match.contains_weak(etag)
+
+    since = request.if_modified_since
+    if since is None or last_modified is None:
+        return False
+
+    # HTTP dates don't include fractions of a second.
+    return _naive(last_modified).replace(microsecond=0) <= _naive(since)
+
+
+def make_etag(id, version):
+    """Builds an ETag from the ``_id`` and the version of a document.
+
+    :param id: the ``_id`` of the document.
+    :param version: the value of the field that changes whenever the
+                    document is saved.
+    :returns: str -- the ETag.
+
+    .. versionadded:: 0.4.0
+    """
+
+    if isinstance(version, (datetime.datetime, datetime.date)):
+        version = version.isoformat()
+
+    value = '{0}:{1}'.format(id, version)
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
+def not_modified_response(etag=None, last_modified=None):
+    """Returns a ``304 Not Modified`` response.
+
+    :param etag: (optional) the ETag of the resource.
+    :type etag: str
+    :param last_modified: (optional) when the resource was last
+                          modified.
+    :type last_modified: :class:`~datetime.datetime`
+    :returns: :class:`~flask.Response` -- the response.
+
+    .. versionadded:: 0.4.0
+    """
+
+    return set_validators(Response(status=304), etag, last_modified)
+
+
+def set_validators(response, etag=None, last_modified=None):
+    """Adds the ``ETag`` and ``Last-Modified`` headers to a response.
+
+    The ETag is weak because it identifies the version of the document
+    rather than the bytes of the response.
+
+    :param response: the response.
+    :type response: :class:`~flask.Response`
+    :param etag: (optional) the ETag of the resource.
+    :type etag: str
+    :param last_modified: (optional) when the resource was last
+                          modified.
+    :type last_modified: :class:`~datetime.datetime`
+    :returns: :class:`~flask.Response` -- the response.
+
+    .. versionadded:: 0.4.0
+    """
+
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+
+def _naive(value):
+    """Converts an aware datetime to a naive one in UTC."""
+
+    if value.tzinfo is None:
+        return value
+    return (value - value.utcoffset()).replace(tzinfo=None)
@@ -0,0 +1,170 @@
+"""Declaring the indexes used by models"""
+
+from pymongo import ASCENDING, DESCENDING
+from simon.utils import map_fields
+
+try:
+    string_types = basestring
+except NameError:
+    # Python 3
+    string_types = str
+
+__all__ = ('compare_indexes', 'create_indexes', 'get_indexes')
+
+
+def compare_indexes(model):
+    """Compares the indexes declared by a model with those that exist.
+
+    ``missing`` contains the keys of the declared indexes that don't
+    exist. ``extra`` contains the names of the indexes that exist but
+    aren't declared. The index on ``_id`` is never included.
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :returns: dict -- the ``missing`` and ``extra`` indexes.
+
+    .. versionadded:: 0.4.0
+    """
+
+    existing = {}
+    for name, info in model._meta.db.index_information().items():
+        if name != '_id_':
+            existing[name] = _normalize(info['key'], info.get('weights'))
+
+    declared = [_normalize(keys) for keys, options in get_indexes(model)]
+
+    return {
+        'missing': [keys for keys in declared
+                    if keys not in existing.values()],
+        'extra': sorted(name for name, keys in existing.items()
+                        if keys not in declared),
+    }
+
+
+def create_indexes(model, background=True):
+    """Creates the indexes declared by a model.
+
+    Indexes that already exist are left alone, so this is safe to call
+    any number of times.
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :param background: (optional) whether or not MongoDB should build
+                       the indexes in the background. This can be
+                       overridden for each index.
+    :type background: bool
+    :returns: list -- the names of the indexes.
+
+    .. versionadded:: 0.4.0
+    """
+
+    names = []
+    for keys, options in get_indexes(model):
+        options.setdefault('background', background)
+        names.append(model._meta.db.create_index(keys, **options))
+    return names
+
+
+def get_indexes(model):
+    """Returns the indexes declared by a model.
+
+    Indexes are declared through the ``indexes`` option of the model's
+    ``Meta`` class. Each index can be the name of a field, a list of
+    names for a compound index, or a ``dict`` containing the ``fields``
+    along with any options supported by
+    :meth:`~pymongo.collection.Collection.create_index` (e.g.,
+    ``unique``). Prefix a name with ``-`` to index it in descending
+    order, or use a ``(name, type)`` pair for other types of indexes
+    (e.g., ``('location', '2dsphere')``).
+
+    .. code-block:: python
+
+        class User(Model):
+            class Meta:
+                indexes = [
+                    {'fields': 'username', 'unique': True},
+                    ('-created', 'status'),
+                ]
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :returns: list -- ``(keys, options)`` pairs for each index, using
+              the names of the fields in the database.
+
+    .. versionadded:: 0.4.0
+    """
+
+    declared = getattr(getattr(model, 'Meta', None), 'indexes', None) or ()
+
+    indexes = []
+    for index in declared:
+        if isinstance(index, dict):
+            options = dict(index)
+            fields = options.pop('fields')
+        else:
+            options = {}
+            fields = index
+        if isinstance(fields, string_types) or _is_typed(fields):
+            fields = [fields]
+
+        keys = []
+        for field in fields:
+            if _is_typed(field):
+                field, direction = field
+            elif field.startswith('-'):
+                field, direction = field[1:], DESCENDING
+            else:
+                direction = ASCENDING
+
+            mapped = map_fields(model._meta.field_map, {field: direction},
+                                flatten_keys=True)
+            keys.extend(mapped.items())
+
+        indexes.append((keys, options))
+    return indexes
+
+
+def _is_typed(field):
+    """Checks for a ``(name, type)`` pair such as
+    ``('location', '2dsphere')``.
+    """
+
+    return (isinstance(field, tuple) and len(field) == 2 and
+            field[1] in _INDEX_TYPES)
+
+
+def _normalize(keys, weights=None):
+    """Makes the keys reported by MongoDB match the declared keys.
+
+    MongoDB reports the fields of a text index through ``weights`` and
+    replaces them in the keys with ``_fts`` and ``_ftsx``. Those are
+    turned back into the fields, and the fields of text indexes are
+    sorted, since their order doesn't matter.
+    """
+
+    normalized = []
+    text = None
+    for k, v in keys:
+        if k == '_ftsx':
+            continue
+        if k == '_fts':
+            fields = weights or {}
+        elif v == 'text':
+            fields = [k]
+        else:
+            normalized.append((k, int(v) if isinstance(v, float) else v))
+            continue
+
+        if text is None:
+            text = len(normalized)
+        normalized[text:text] = [(field, 'text') for field in fields]
+
+    if text is not None:
+        count = sum(1 for k, v in normalized if v == 'text')
+        normalized[text:text + count] = sorted(
+            normalized[text:text + count])
+    return normalized
+
+
+# The types of indexes other than ascending and descending.
+_INDEX_TYPES = frozenset(('2d', '2dsphere', 'geoHaystack', 'hashed', 'text'))
@@ -0,0 +1,132 @@
+"""Loading users for Flask-Login
+
+Flask-Login calls its user loader on every request made by a logged in
+user. :class:`UserLoader` keeps that from costing a query each time.
+This module isn't imported until :class:`UserLoader` is first used
+through :mod:`flask_simon`.
+"""
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from simon.exceptions import NoDocumentFound
+
+from . import _find_one, _get_cursor, _get_projection, _get_tenants
+from .cache import DocumentCache
+
+__all__ = ('UserLoader',)
+
+
+class UserLoader(object):
+    """A Flask-Login user loader that keeps users in memory.
+
+    .. code-block:: python
+
+        login_manager = LoginManager(app)
+        login_manager.user_loader(UserLoader(User, app,
+                                             fields=('username', 'email')))
+
+    The ID stored in the session is converted to an
+    :class:`~bson.objectid.ObjectId` before querying, and IDs that can't
+    be converted are treated as unknown users. When ``fields`` or
+    ``exclude`` are provided, only those fields are loaded, so they
+    should include everything the app needs from the current user.
+
+    Each user is kept for ``ttl`` seconds. Saving or deleting a user
+    through :class:`flask_simon.Model` removes it right away, but only
+    from the memory of the process that made the change. Other processes
+    will keep using their copy until it expires, so the time to live
+    should be kept short. Users aren't kept at all when the model's
+    database has a :class:`~flask_simon.TenantRegistry`, as the same
+    ``_id`` can belong to different users in different tenants.
+
+    :param model: the user model class.
+    :type model: :class:`flask_simon.Model`
+    :param app: (optional) the Flask application.
+    :type app: :class:`flask.Flask`
+    :param fields: (optional) the names of the fields to load.
+    :type fields: list
+    :param exclude: (optional) the names of the fields not to load.
+    :type exclude: list
+    :param ttl: (optional) the number of seconds to keep each user.
+    :type ttl: int
+    :param max_users: (optional) the most users to keep.
+    :type max_users: int
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, model, app=None, fields=None, exclude=None, ttl=30,
+                 max_users=1000):
+        self.model = model
+        self.fields = fields
+        self.exclude = exclude
+        self.ttl = ttl
+
+        self.cache = DocumentCache(max_entries=max_users)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Adds the loader to the model's database so that it hears
+        about changes to users.
+
+        :param app: the Flask application.
+        :type app: :class:`flask.Flask`
+        :raises: :class:`RuntimeError` if :class:`flask_simon.Simon`
+                 hasn't been initialized for the model's database.
+        """
+
+        database = self.model._meta.database
+        state = app.extensions.get('simon', {}).get(database)
+        if state is None:
+            message = ("Simon must be initialized for database '{0}' before "
+                       "its user loaders.".format(database))
+            raise RuntimeError(message)
+
+        state.user_loaders.append(self)
+
+    def invalidate(self, model, id=None):
+        """Removes users from memory.
+
+        :param model: the model class of the document that changed.
+        :type model: :class:`simon.Model`
+        :param id: (optional) the ``_id`` of the user that changed.
+        """
+
+        if model is self.model:
+            self.cache.invalidate(model, id)
+
+    def __call__(self, id):
+        # ObjectId() would make up a new ID rather than fail.
+        if not id:
+            return None
+
+        try:
+            id = ObjectId(id)
+        except (InvalidId, TypeError):
+            return None
+
+        query = {'_id': id}
+
+        # The users are shared by every request, so they can't be kept
+        # when requests can use different databases.
+        cache = None
+        if self.ttl and _get_tenants(self.model._meta.database) is None:
+            cache = self.cache
+
+        if cache is not None:
+            user = cache.get(self.model, query)
+            if user is not None:
+                return user
+
+        projection = _get_projection(self.model, self.fields, self.exclude)
+        cursor = _get_cursor(self.model, None, query, projection)
+        try:
+            user = _find_one(self.model, cursor, None, query)
+        except NoDocumentFound:
+            return None
+
+        if cache is not None:
+            cache.add(self.model, query, user, self.ttl)
+        return user
@@ -0,0 +1,359 @@
+"""Monitoring of the database connections"""
+
+import logging
+import threading
+
+from flask import current_app, g, has_request_context
+try:
+    from flask import has_app_context
+except ImportError:
+    # Flask 0.8
+    has_app_context = has_request_context
+from flask.signals import Namespace
+try:
+    from pymongo import monitoring
+except ImportError:
+    # The monitoring module was added in PyMongo 3.1.
+    monitoring = None
+
+__all__ = ('CommandListener', 'PoolStats', 'QueryMetrics',
+           'get_query_metrics', 'query_executed', 'register_command_listener',
+           'repeated_queries', 'request_queries', 'slow_query')
+
+try:
+    string_types = basestring
+except NameError:
+    # Python 3
+    string_types = str
+
+logger = logging.getLogger('flask_simon')
+
+_signals = Namespace()
+
+#: Sent after each database command. It receives the ``query`` as a
+#: ``dict`` (see :meth:`QueryMetrics.add`).
+query_executed = _signals.signal('query-executed')
+
+#: Sent after each database command that took longer than
+#: ``MONGO_SLOW_QUERY_MS``. It receives the ``query``.
+slow_query = _signals.signal('slow-query')
+
+#: Sent the first time a collection has been queried more than
+#: ``MONGO_REPEATED_QUERY_THRESHOLD`` times during a request. It receives
+#: the name of the ``collection`` and the number of times (``count``).
+repeated_queries = _signals.signal('repeated-queries')
+
+#: Sent at the end of each request that made any database commands. It
+#: receives the request's :class:`QueryMetrics` as ``metrics``.
+request_queries = _signals.signal('request-queries')
+
+# The listener is registered with PyMongo the first time it's needed.
+_command_listener = None
+
+# Commands that are part of managing connections rather than working
+# with documents.
+_IGNORED_COMMANDS = frozenset((
+    'authenticate', 'endSessions', 'getnonce', 'hello', 'isMaster',
+    'ismaster', 'ping', 'saslContinue', 'saslStart',
+))
+
+# Commands that count as queries when looking for a collection that is
+# queried over and over again during a request.
+_QUERY_COMMANDS = frozenset(('aggregate', 'count', 'distinct', 'find'))
+
+# Connection pool events were added in PyMongo 3.9. Older versions will
+# still be able to report the settings of the pool.
+supports_pool_events = hasattr(monitoring, 'ConnectionPoolListener')
+
+
+class CommandListener(getattr(monitoring, 'CommandListener', object)):
+    """Records the commands sent to the database during a request.
+
+    A single instance of this class is registered with PyMongo by
+    :class:`Simon` when ``MONGO_QUERY_METRICS``, ``MONGO_SLOW_QUERY_MS``,
+    or ``MONGO_REPEATED_QUERY_THRESHOLD`` is set. PyMongo sends events
+    for commands from the thread that made them, so commands are matched
+    up with the current app context.
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        if event.command_name in _IGNORED_COMMANDS:
+            return
+
+        if not has_app_context():
+            return
+
+        app = current_app._get_current_object()
+        state = _get_state(app, event.database_name)
+        if state is None:
+            return
+
+        collection = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            collection = event.command.get('collection')
+        if not isinstance(collection, string_types):
+            collection = None
+
+        query = {
+            'command': event.command_name,
+            'database': event.database_name,
+            'collection': collection,
+        }
+        self._pending[event.request_id] = (g._get_current_object(), app,
+                                           state, query)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed=False):
+        pending = self._pending.pop(event.request_id, None)
+        if pending is None:
+            return
+
+        context, app, state, query = pending
+        if not has_app_context() or g._get_current_object() is not context:
+            # The context ended before the command did.
+            return
+
+        query['duration'] = event.duration_micros / 1000.0
+        query['failed'] = failed
+
+        metrics = get_query_metrics(create=True)
+        count = metrics.add(query)
+
+        query_executed.send(app, query=query)
+
+        if (state.slow_query_ms is not None and
+                query['duration'] > state.slow_query_ms):
+            logger.warning('Slow query (%.1f ms): %s on %s.%s',
+                           query['duration'], query['command'],
+                           query['database'], query['collection'])
+            slow_query.send(app, query=query)
+
+        threshold = state.repeated_query_threshold
+        if (threshold is not None and query['command'] in _QUERY_COMMANDS and
+                count == threshold + 1):
+            logger.warning('%s.%s has been queried %d times during this '
+                           'request. This may be an N+1 query.',
+                           query['database'], query['collection'], count)
+            repeated_queries.send(app, collection=query['collection'],
+                                  count=count)
+
+
+class PoolStats(getattr(monitoring, 'ConnectionPoolListener', object)):
+    """Keeps track of the connections in a connection pool.
+
+    When supported by PyMongo, an instance of this class is registered
+    as an event listener with the client created by :class:`Simon`.
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, options=None):
+        self.options = options or {}
+
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.check_out_failures = 0
+        self.wait_queue_timeouts = 0
+
+        # Whether or not the instance was registered with a client.
+        self.listening = False
+
+        self._lock = threading.Lock()
+
+    def as_dict(self):
+        """Returns the statistics as a ``dict``.
+
+        The settings used to create the pool are included along with the
+        number of ``open``, ``in_use``, and ``available`` connections.
+        ``max_in_use`` contains the highest number of connections that
+        have been in use at the same time. ``check_out_failures`` and
+        ``wait_queue_timeouts`` contain the number of times a connection
+        couldn't be checked out of the pool. The counts are only kept
+        when ``events`` is ``True``.
+
+        :returns: dict -- the statistics.
+        """
+
+        with self._lock:
+            stats = dict(self.options)
+            stats['events'] = self.listening
+            stats['open'] = self.created - self.closed
+            stats['in_use'] = self.checked_out
+            stats['available'] = stats['open'] - self.checked_out
+            stats['max_in_use'] = self.max_checked_out
+            stats['check_out_failures'] = self.check_out_failures
+            stats['wait_queue_timeouts'] = self.wait_queue_timeouts
+        return stats
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out,
+                                       self.checked_out)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.check_out_failures += 1
+            if event.reason == 'timeout':
+                self.wait_queue_timeouts += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+
+class QueryMetrics(object):
+    """The database commands made during a request.
+
+    ``count`` contains the number of commands and ``total_time`` the
+    number of milliseconds spent on them. ``slowest`` contains the
+    slowest command. ``collections`` maps the names of the collections
+    to the number of queries made against them.
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest = None
+        self.collections = {}
+
+    def add(self, query):
+        """Adds a command to the metrics.
+
+        ``query`` contains the name of the ``command``, the ``database``
+        and ``collection`` it was sent to, its ``duration`` in
+        milliseconds, and whether or not it ``failed``.
+
+        :param query: the command.
+        :type query: dict
+        :returns: int -- the number of queries that have been made
+                  against the collection.
+        """
+
+        self.count += 1
+        self.total_time += query['duration']
+
+        slowest = self.slowest
+        if slowest is None or query['duration'] > slowest['duration']:
+            self.slowest = query
+
+        if query['command'] not in _QUERY_COMMANDS:
+            return self.collections.get(query['collection'], 0)
+
+        count = self.collections.get(query['collection'], 0) + 1
+        self.collections[query['collection']] = count
+        return count
+
+    def as_dict(self):
+        """Returns the metrics as a ``dict``."""
+
+        return {
+            'count': self.count,
+            'total_time': self.total_time,
+            'slowest': self.slowest,
+            'collections': dict(self.collections),
+        }
+
+
+def get_query_metrics(create=False):
+    """Returns the metrics of the current request.
+
+    :param create: (optional) whether or not to create the metrics if
+                   no commands have been recorded yet.
+    :type create: bool
+    :returns: :class:`QueryMetrics` -- the metrics, or ``None`` if there
+              aren't any.
+
+    .. versionadded:: 0.4.0
+    """
+
+    if not has_app_context():
+        return None
+
+    metrics = getattr(g, 'simon_metrics', None)
+    if metrics is None and create:
+        metrics = g.simon_metrics = QueryMetrics()
+    return metrics
+
+
+def register_command_listener():
+    """Registers a :class:`CommandListener` with PyMongo.
+
+    The listener will only be registered once. PyMongo only sends events
+    to the listeners that were registered before the client was created.
+
+    :raises: :class:`RuntimeError`
+
+    .. versionadded:: 0.4.0
+    """
+
+    global _command_listener
+
+    if monitoring is None:
+        raise RuntimeError('Query metrics require PyMongo 3.1 or newer.')
+
+    if _command_listener is None:
+        _command_listener = CommandListener()
+        monitoring.register(_command_listener)
+
+
+def _send_request_queries(exception=None):
+    """Sends :data:`request_queries` at the end of a request."""
+
+    metrics = get_query_metrics()
+    if metrics is not None:
+        request_queries.send(current_app._get_current_object(),
+                             metrics=metrics)
+
+
+def _get_state(app, database):
+    """Returns the settings for a database being monitored.
+
+    The databases of a database's tenants are monitored along with it.
+    """
+
+    for state in app.extensions.get('simon', {}).values():
+        if not state.monitored:
+            continue
+        if state.name == database:
+            return state
+        if state.tenants is not None and state.tenants.has_database(database):
+            return state
+    return None
@@ -0,0 +1,219 @@
+"""Checking the plans MongoDB uses for queries"""
+
+import os
+import traceback
+
+from flask.signals import Namespace
+import pymongo
+import simon
+
+__all__ = ('InefficientQuery', 'check_query_plan', 'inefficient_query',
+           'query_shape')
+
+_signals = Namespace()
+
+#: Sent when the plan for a query is flagged by
+#: ``MONGO_CHECK_QUERY_PLANS``. It receives the ``report`` (see
+#: :meth:`check_query_plan`).
+inefficient_query = _signals.signal('inefficient-query')
+
+# Frames from these packages are skipped when looking for the code that
+# made a query.
+_INTERNAL_PATHS = tuple(
+    os.path.dirname(os.path.abspath(module.__file__)) + os.sep
+    for module in (pymongo, simon))
+_INTERNAL_PATHS += (os.path.dirname(os.path.abspath(__file__)) + os.sep,)
+
+
+class InefficientQuery(Exception):
+    """Raised when ``MONGO_CHECK_QUERY_PLANS`` is set to ``'raise'`` and
+    the plan for a query is flagged.
+
+    ``report`` contains the details of the query (see
+    :meth:`check_query_plan`).
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, message, report):
+        super(InefficientQuery, self).__init__(message)
+        self.report = report
+
+
+def check_query_plan(model, spec, cursor, max_ratio=None):
+    """Explains a query and checks whether its plan is inefficient.
+
+    A plan is inefficient if it scans the whole collection or if the
+    number of documents it examines is more than ``max_ratio`` times the
+    number it returns. If it is, a report is returned containing:
+
+    - ``model``: the name of the model
+    - ``collection``: the name of the collection
+    - ``shape``: the query with its values replaced by ``'?'`` (see
+      :meth:`query_shape`)
+    - ``reason``: why the query was flagged
+    - ``stage``: the first stage of the plan
+    - ``examined``: the number of documents examined
+    - ``returned``: the number of documents returned
+    - ``call_site``: the file, line, and function that made the query
+
+    ``cursor`` isn't iterated, so it can still be used afterward.
+
+    :param model: the model class.
+    :type model: :class:`simon.Model`
+    :param spec: the query.
+    :type spec: dict
+    :param cursor: the cursor for the query.
+    :type cursor: :class:`~pymongo.cursor.Cursor`
+    :param max_ratio: (optional) the most documents that can be examined
+                      for each one returned.
+    :type max_ratio: int
+    :returns: dict -- the report, or ``None`` if the plan is fine.
+
+    .. versionadded:: 0.4.0
+    """
+
+    # explain() works on a copy of the cursor.
+    stages, examined, returned = _read_plan(cursor.explain())
+
+    if 'COLLSCAN' in stages:
+        reason = 'collection scan'
+    elif (max_ratio is not None and
+            examined > max(returned, 1) * max_ratio):
+        reason = 'examined {0} documents to return {1}'.format(
+            examined, returned)
+    else:
+        return None
+
+    return {
+        'model': model.__name__,
+        'collection': model._meta.collection,
+        'shape': query_shape(spec),
+        'reason': reason,
+        'stage': stages[0] if stages else None,
+        'examined': examined,
+        'returned': returned,
+        'call_site': _get_call_site(),
+    }
+
+
+def query_shape(spec):
+    """Returns the shape of a query.
+
+    Queries with the same shape differ only in their values, so they are
+    able to use the same indexes.
+
+    .. code-block:: python
+
+        >>> query_shape({'a': 1, 'b': {'$gt': 2}})
+        {'a': '?', 'b': {'$gt': '?'}}
+
+    :param spec: the query.
+    :type spec: dict
+    :returns: dict -- the shape.
+
+    .. versionadded:: 0.4.0
+    """
+
+    if isinstance(spec, dict):
+        shape = {}
+        for key, value in spec.items():
+            if key in ('$and', '$or', '$nor'):
+                shape[key] = [query_shape(v) for v in value]
+            elif isinstance(value, dict):
+                shape[key] = query_shape(value)
+            else:
+                shape[key] = '?'
+        return shape
+    return '?'
+
+
+class _CheckedCursor(object):
+    """Wraps a cursor so that its query plan is checked when it's first
+    read rather than when it's created.
+
+    By then the sort, limit, and skip have been added to the cursor, so
+    the plan that's explained is the one used for the query. Everything
+    other than reading is passed through to the cursor.
+    """
+
+    def __init__(self, cursor, check):
+        self._cursor = cursor
+        self._check = check
+        self._checked = False
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def method(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            # Methods like sort() return the cursor so that they can be
+            # chained. The wrapper is returned instead.
+            return self if result is self._cursor else result
+        return method
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            self._check_plan()
+        result = self._cursor[index]
+        return self if result is self._cursor else result
+
+    def __iter__(self):
+        self._check_plan()
+        return iter(self._cursor)
+
+    def clone(self):
+        return _CheckedCursor(self._cursor.clone(), self._check)
+
+    def next(self):
+        self._check_plan()
+        return next(self._cursor)
+    __next__ = next
+
+    def _check_plan(self):
+        if not self._checked:
+            self._checked = True
+            self._check(self._cursor)
+
+
+def _get_call_site():
+    """Returns the location of the code that made a query."""
+
+    for filename, lineno, name, line in reversed(traceback.extract_stack()):
+        if not os.path.abspath(filename).startswith(_INTERNAL_PATHS):
+            return '{0}:{1} in {2}'.format(filename, lineno, name)
+    return None
+
+
+def _read_plan(explanation):
+    """Returns the stages of the winning plan and the numbers of
+    documents examined and returned.
+    """
+
+    if 'queryPlanner' not in explanation:
+        # MongoDB 2.x
+        cursor = explanation.get('cursor', '')
+        stages = ['COLLSCAN' if cursor.startswith('BasicCursor') else cursor]
+        return (stages, explanation.get('nscannedObjects', 0),
+                explanation.get('n', 0))
+
+    stages = []
+    plan = explanation['queryPlanner'].get('winningPlan', {})
+    while plan:
+        stages.append(plan.get('stage'))
+        if 'inputStage' in plan:
+            plan = plan['inputStage']
+        else:
+            # A plan with several inputs, such as $or, is flagged if any
+            # of them scans the collection.
+            inputs = plan.get('inputStages') or [{}]
+            for other in inputs[1:]:
+                stages.extend(_read_plan({
+                    'queryPlanner': {'winningPlan': other}})[0])
+            plan = inputs[0]
+
+    stats = explanation.get('executionStats', {})
+    return (stages, stats.get('totalDocsExamined', 0),
+            stats.get('nReturned', 0))
@@ -0,0 +1,136 @@
+"""Routing reads to the members of a replica set"""
+
+from functools import wraps
+import threading
+
+try:
+    from pymongo.read_preferences import (Nearest, Primary, PrimaryPreferred,
+                                          Secondary, SecondaryPreferred)
+except ImportError:
+    # The read preference classes were added in PyMongo 3.0.
+    Primary = None
+
+__all__ = ('get_read_preference', 'make_read_preference', 'read_preference')
+
+_local = threading.local()
+
+
+def get_read_preference():
+    """Returns the read preference set by :class:`read_preference`.
+
+    :returns: the read preference, or ``None`` if one hasn't been set.
+
+    .. versionadded:: 0.4.0
+    """
+
+    stack = getattr(_local, 'stack', None)
+    if not stack:
+        return None
+    return stack[-1]
+
+
+def make_read_preference(mode, max_staleness=None, tag_sets=None):
+    """Returns a PyMongo read preference.
+
+    ``mode`` can be any of the modes supported by MongoDB (``primary``,
+    ``primaryPreferred``, ``secondary``, ``secondaryPreferred``, and
+    ``nearest``). Case and underscores are ignored, so
+    ``secondary_preferred`` works as well. The number used by PyMongo
+    for the mode can also be used.
+
+    :param mode: the name of the mode.
+    :type mode: str or int
+    :param max_staleness: (optional) the maximum number of seconds a
+                          secondary can fall behind the primary.
+    :type max_staleness: int
+    :param tag_sets: (optional) the tags of the members to read from.
+    :type tag_sets: list
+    :returns: the read preference.
+    :raises: :class:`ValueError`, :class:`RuntimeError` if PyMongo
+             doesn't support the arguments.
+
+    .. versionadded:: 0.4.0
+    """
+
+    if Primary is None:
+        raise RuntimeError('Read preferences require PyMongo 3.0 or newer.')
+
+    modes = {
+        'primary': Primary,
+        'primarypreferred': PrimaryPreferred,
+        'secondary': Secondary,
+        'secondarypreferred': SecondaryPreferred,
+        'nearest': Nearest,
+    }
+
+    if isinstance(mode, int):
+        # Older versions of PyMongo's URI parser return the mode as its
+        # position in this list.
+        names = ('primary', 'primaryPreferred', 'secondary',
+                 'secondaryPreferred', 'nearest')
+        mode = names[mode] if 0 <= mode < len(names) else str(mode)
+
+    try:
+        cls = modes[mode.replace('_', '').lower()]
+    except KeyError:
+        raise ValueError("'{0}' is not a valid read preference.".format(mode))
+
+    if cls is Primary:
+        if max_staleness is not None or tag_sets:
+            message = ('max_staleness and tag_sets cannot be used with the '
+                       'primary read preference.')
+            raise ValueError(message)
+        return Primary()
+
+    kwargs = {}
+    if max_staleness is not None:
+        kwargs['max_staleness'] = max_staleness
+    if tag_sets:
+        kwargs['tag_sets'] = tag_sets
+
+    try:
+        return cls(**kwargs)
+    except TypeError:
+        if 'max_staleness' not in kwargs:
+            raise
+        raise RuntimeError('max_staleness requires PyMongo 3.4 or newer.')
+
+
+class read_preference(object):
+    """Routes the reads made through :class:`flask_simon.Model`.
+
+    This can be used as either a context manager or a decorator. Any
+    reads made while it's active will use the read preference instead of
+    the one configured through ``MONGO_READ_PREFERENCE``. Writes will
+    always go to the primary.
+
+    .. code-block:: python
+
+        @app.route('/entries')
+        @read_preference('secondaryPreferred', max_staleness=120)
+        def list_entries():
+            return render_template('entries.html', entries=Entry.all())
+
+    See :meth:`make_read_preference` for the arguments.
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, mode, max_staleness=None, tag_sets=None):
+        self.preference = make_read_preference(mode, max_staleness, tag_sets)
+
+    def __call__(self, f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            with self:
+                return f(*args, **kwargs)
+        return decorated
+
+    def __enter__(self):
+        if getattr(_local, 'stack', None) is None:
+            _local.stack = []
+        _local.stack.append(self.preference)
+        return self.preference
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.stack.pop()
@@ -0,0 +1,294 @@
+"""Storing sessions in the database instead of in cookies"""
+
+import binascii
+import copy
+import datetime
+import os
+import re
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+try:
+    from flask.sessions import session_json_serializer
+except ImportError:
+    # Flask 0.8 and 0.9
+    session_json_serializer = None
+from pymongo.collection import Collection
+from simon import connection
+from werkzeug.datastructures import CallbackDict
+
+__all__ = ('MongoSession', 'MongoSessionInterface')
+
+# The CRUD API was added in PyMongo 2.9.
+_supports_crud_api = hasattr(Collection, 'replace_one')
+
+_SID_PATTERN = re.compile('^[0-9a-f]{40}$')
+
+
+class MongoSession(CallbackDict, SessionMixin):
+    """A session stored in the database.
+
+    :param initial: (optional) the values stored in the session.
+    :type initial: dict
+    :param sid: (optional) the ID of the session.
+    :type sid: str
+    :param new: (optional) whether or not the session was just created.
+    :type new: bool
+    :param expiration: (optional) when the stored session expires, in
+                       UTC.
+    :type expiration: :class:`~datetime.datetime`
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, initial=None, sid=None, new=False, expiration=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expiration = expiration
+        self.modified = False
+        self.accessed = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super(MongoSession, self).__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super(MongoSession, self).get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super(MongoSession, self).setdefault(key, default)
+
+
+class MongoSessionInterface(SessionInterface):
+    """Stores sessions in a collection instead of in the cookie.
+
+    .. code-block:: python
+
+        app = Flask(__name__)
+        Simon(app)
+        app.session_interface = MongoSessionInterface()
+
+    The cookie only holds the ID of the session. Sessions are stored the
+    first time something is added to them and are only written again
+    when they're modified, or when they're halfway to expiring so that
+    sessions in use don't expire. The ``PERMANENT_SESSION_LIFETIME``
+    setting controls how long sessions are kept, and a TTL index removes
+    them from the collection once they've expired.
+
+    Setting ``cache_ttl`` keeps the sessions this process reads and
+    writes in memory for that number of seconds. Changes made by other
+    processes won't be seen until then, so it should be kept short when
+    the app runs in more than one process.
+
+    :param collection: (optional) the name of the collection.
+    :type collection: str
+    :param database: (optional) the alias of the database.
+    :type database: str
+    :param cache_ttl: (optional) the number of seconds to keep sessions
+                      in memory.
+    :type cache_ttl: int
+    :param cache_size: (optional) the most sessions to keep in memory.
+    :type cache_size: int
+
+    .. versionadded:: 0.4.0
+    """
+
+    session_class = MongoSession
+
+    def __init__(self, collection='sessions', database='default',
+                 cache_ttl=None, cache_size=1000):
+        self.collection = collection
+        self.database = database
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+
+        self._cache = {}
+        self._indexed = False
+        self._lock = threading.Lock()
+
+    def get_collection(self, app):
+        """Returns the collection the sessions are stored in.
+
+        :param app: the Flask application.
+        :type app: :class:`flask.Flask`
+        :returns: :class:`~pymongo.collection.Collection` -- the
+                  collection.
+        :raises: :class:`RuntimeError` if :class:`flask_simon.Simon`
+                 hasn't been initialized for the database.
+        """
+
+        state = app.extensions.get('simon', {}).get(self.database)
+        if state is None:
+            message = ("Simon must be initialized for database '{0}' before "
+                       "its sessions.".format(self.database))
+            raise RuntimeError(message)
+
+        if state.lazy:
+            state.connect()
+
+        collection = connection.get_database(state.alias)[self.collection]
+        if not self._indexed:
+            collection.create_index('expiration', expireAfterSeconds=0)
+            self._indexed = True
+        return collection
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+        if sid and _SID_PATTERN.match(sid):
+            document = self._load(app, sid)
+            if document is not None:
+                return self.session_class(_loads(document['data']), sid=sid,
+                                          expiration=document['expiration'])
+
+        # Unknown IDs are never reused so that a session can't be fixed
+        # by the client.
+        return self.session_class(sid=_generate_sid(), new=True)
+
+    def save_session(self, app, session, response):
+        name = app.config['SESSION_COOKIE_NAME']
+        options = {
+            'domain': self.get_cookie_domain(app),
+            'path': self.get_cookie_path(app),
+            'httponly': self.get_cookie_httponly(app),
+            'secure': self.get_cookie_secure(app),
+        }
+        # SESSION_COOKIE_SAMESITE was added in Flask 1.0.
+        get_cookie_samesite = getattr(self, 'get_cookie_samesite', None)
+        if get_cookie_samesite is not None:
+            options['samesite'] = get_cookie_samesite(app)
+
+        # The response depends on the cookie whenever the session is used.
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified and not session.new:
+                _delete(self.get_collection(app), session.sid)
+                self._forget(session.sid)
+                # This is what delete_cookie() does, but it only takes
+                # secure and samesite since Werkzeug 2.0.
+                response.set_cookie(name, expires=0, max_age=0, **options)
+                response.vary.add('Cookie')
+            return
+
+        now = datetime.datetime.utcnow()
+        lifetime = app.permanent_session_lifetime
+        expiration = now + lifetime
+
+        if session.modified or session.new:
+            document = {
+                '_id': session.sid,
+                'data': _dumps(dict(session)),
+                'expiration': expiration,
+            }
+            _replace(self.get_collection(app), document)
+            self._remember(document)
+        elif session.expiration - now < lifetime // 2:
+            _update(self.get_collection(app), session.sid,
+                    {'$set': {'expiration': expiration}})
+            self._touch(session.sid, expiration)
+        else:
+            return
+
+        response.set_cookie(name, session.sid,
+                            expires=self.get_expiration_time(app, session),
+                            **options)
+        response.vary.add('Cookie')
+
+    def _forget(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    def _load(self, app, sid):
+        now = datetime.datetime.utcnow()
+
+        if self.cache_ttl:
+            with self._lock:
+                entry = self._cache.get(sid)
+            if entry is not None and entry[0] > time.time():
+                document = entry[1]
+                if document['expiration'] > now:
+                    return document
+
+        # The TTL monitor only runs once a minute, so expired sessions
+        # may still be in the collection.
+        document = self.get_collection(app).find_one(
+            {'_id': sid, 'expiration': {'$gt': now}})
+        if document is not None:
+            self._remember(document)
+        return document
+
+    def _remember(self, document):
+        if not self.cache_ttl:
+            return
+
+        with self._lock:
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[document['_id']] = (time.time() + self.cache_ttl,
+                                            document)
+
+    def _touch(self, sid, expiration):
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is not None:
+                document = dict(entry[1], expiration=expiration)
+                self._cache[sid] = (entry[0], document)
+
+
+def _delete(collection, sid):
+    """Deletes a session."""
+
+    if _supports_crud_api:
+        collection.delete_one({'_id': sid})
+    else:
+        collection.remove({'_id': sid})
+
+
+def _dumps(data):
+    """Serializes a session's values."""
+
+    if session_json_serializer is None:
+        return copy.deepcopy(data)
+    return session_json_serializer.dumps(data)
+
+
+def _generate_sid():
+    """Returns a new, random session ID."""
+
+    return binascii.hexlify(os.urandom(20)).decode('ascii')
+
+
+def _loads(data):
+    """Deserializes a session's values."""
+
+    if session_json_serializer is None:
+        return copy.deepcopy(data)
+    return session_json_serializer.loads(data)
+
+
+def _replace(collection, document):
+    """Inserts or replaces a document."""
+
+    if _supports_crud_api:
+        collection.replace_one({'_id': document['_id']}, document,
+                               upsert=True)
+    else:
+        collection.update({'_id': document['_id']}, document, upsert=True)
+
+
+def _update(collection, sid, update):
+    """Updates a session."""
+
+    if _supports_crud_api:
+        collection.update_one({'_id': sid}, update)
+    else:
+        collection.update({'_id': sid}, update)
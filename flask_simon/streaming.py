@@ -0,0 +1,95 @@
+"""Streaming documents as JSON"""
+
+import datetime
+import json
+
+from bson.objectid import ObjectId
+
+__all__ = ('JSONEncoder', 'iter_json', 'iter_ndjson')
+
+
+class JSONEncoder(json.JSONEncoder):
+    """Encodes documents loaded from MongoDB.
+
+    Object IDs are encoded as their hex strings and dates and times are
+    encoded in ISO 8601 format.
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, **kwargs):
+        # The output is meant to be sent over the wire, so there's no
+        # need for the spaces after the separators.
+        kwargs.setdefault('separators', (',', ':'))
+        super(JSONEncoder, self).__init__(**kwargs)
+
+    def default(self, o):
+        if isinstance(o, ObjectId):
+            return str(o)
+        if isinstance(o, (datetime.datetime, datetime.date)):
+            return o.isoformat()
+        return super(JSONEncoder, self).default(o)
+
+
+def iter_json(documents, batch_size=100, encoder=None):
+    """Encodes documents as a JSON array, one batch at a time.
+
+    Only ``batch_size`` documents are held in memory at once, so this
+    can be used to send any number of documents without building the
+    whole array first.
+
+    :param documents: the documents.
+    :type documents: iterable of dict
+    :param batch_size: (optional) the number of documents to encode
+                       into each chunk.
+    :type batch_size: int
+    :param encoder: (optional) the encoder to use. Defaults to a
+                    :class:`JSONEncoder`.
+    :type encoder: :class:`json.JSONEncoder`
+    :returns: generator -- chunks of the array.
+
+    .. versionadded:: 0.4.0
+    """
+
+    yield '['
+
+    first = True
+    for chunk in _iter_batches(documents, batch_size, encoder):
+        if first:
+            first = False
+            yield ','.join(chunk)
+        else:
+            yield ',' + ','.join(chunk)
+
+    yield ']'
+
+
+def iter_ndjson(documents, batch_size=100, encoder=None):
+    """Encodes documents as newline-delimited JSON, one batch at a time.
+
+    Each document is written on its own line. See :meth:`iter_json` for
+    the arguments.
+
+    :returns: generator -- chunks of lines.
+
+    .. versionadded:: 0.4.0
+    """
+
+    for chunk in _iter_batches(documents, batch_size, encoder):
+        yield '\n'.join(chunk) + '\n'
+
+
+def _iter_batches(documents, batch_size, encoder):
+    """Encodes documents into lists of at most ``batch_size`` strings."""
+
+    encode = (encoder or JSONEncoder()).encode
+
+    batch = []
+    for document in documents:
+        batch.append(encode(document))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
@@ -0,0 +1,326 @@
+"""Serving many tenant databases through one connection"""
+
+from collections import OrderedDict
+import re
+import threading
+import time
+
+from flask import abort, current_app, g, has_request_context, request
+from simon import connection
+
+__all__ = ('TenantRegistry', 'from_header', 'from_subdomain',
+           'from_view_arg')
+
+
+class TenantRegistry(object):
+    """Maps tenants to databases on the same connection.
+
+    The tenant for each request is found by calling ``resolver``, and
+    :class:`flask_simon.Model` classes using the database will read from
+    and write to the tenant's database for the rest of the request.
+    Requests without a tenant use the database configured through
+    :class:`flask_simon.Simon`.
+
+    .. code-block:: python
+
+        app = Flask(__name__)
+        Simon(app)
+        TenantRegistry(app, resolver=from_subdomain(),
+                       database_name='tenant_{0}')
+
+    Every tenant shares the client created for the database, so there is
+    only one connection pool no matter how many tenants there are. The
+    handles to the tenants' databases are created the first time they're
+    needed and are thrown away after going unused for ``idle_timeout``
+    seconds, or when there are more than ``max_databases`` of them.
+
+    Keys come from the request, so with ``database_name`` any key that
+    doesn't match ``key_pattern`` is aborted with a 404 rather than being
+    formatted into the name of a database.
+
+    :param app: (optional) the Flask application.
+    :type app: :class:`flask.Flask`
+    :param resolver: (optional) a callable that returns the key of the
+                     current request's tenant, or ``None``.
+    :type resolver: callable
+    :param database_name: (optional) the name of a tenant's database,
+                          formatted with the tenant's key. It must add
+                          something to the key, such as a prefix.
+    :type database_name: str
+    :param databases: (optional) the names of the tenants' databases,
+                      keyed by the tenants' keys. When provided, requests
+                      for other tenants are aborted with a 404.
+    :type databases: dict
+    :param key_pattern: (optional) the regular expression the whole key
+                        must match to be used with ``database_name``.
+    :type key_pattern: str
+    :param idle_timeout: (optional) the number of seconds to keep a
+                         handle that isn't being used.
+    :type idle_timeout: int
+    :param max_databases: (optional) the most handles to keep.
+    :type max_databases: int
+    :param database: (optional) the alias of the database.
+    :type database: str
+    :raises: :class:`ValueError` if neither ``database_name`` nor
+             ``databases`` is provided, or if ``database_name`` is only
+             the key.
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, app=None, resolver=None, database_name=None,
+                 databases=None, key_pattern=r'[a-z0-9_-]{1,32}',
+                 idle_timeout=600, max_databases=None, database='default'):
+        if databases is None:
+            if database_name is None:
+                raise ValueError('database_name or databases is required.')
+            if not database_name.format(''):
+                message = ("database_name must add to the tenant's key, "
+                           "such as 'tenant_{0}'.")
+                raise ValueError(message)
+
+        self.resolver = resolver
+        self.database_name = database_name
+        self.databases = databases
+        self.key_pattern = re.compile(r'(?:{0})\Z'.format(key_pattern))
+        self.idle_timeout = idle_timeout
+        self.max_databases = max_databases
+
+        self.alias = None
+        self._handles = OrderedDict()
+        self._names = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app, database)
+
+    def init_app(self, app, database='default'):
+        """Adds the registry to a database.
+
+        :param app: the Flask application.
+        :type app: :class:`flask.Flask`
+        :param database: (optional) the alias of the database.
+        :type database: str
+        :raises: :class:`RuntimeError` if :class:`flask_simon.Simon`
+                 hasn't been initialized for the database.
+        """
+
+        state = app.extensions.get('simon', {}).get(database)
+        if state is None:
+            message = ("Simon must be initialized for database '{0}' before "
+                       "its tenants.".format(database))
+            raise RuntimeError(message)
+
+        self.alias = state.alias
+        state.tenants = self
+
+    def clear(self):
+        """Throws away all of the database handles."""
+
+        with self._lock:
+            self._handles.clear()
+            self._names.clear()
+
+    def get_database(self, tenant):
+        """Returns the database for a tenant.
+
+        :param tenant: the key of the tenant.
+        :type tenant: str
+        :returns: :class:`~pymongo.database.Database` -- the database.
+        """
+
+        now = time.time()
+        with self._lock:
+            handle = self._handles.pop(tenant, None)
+            if handle is None:
+                name = self.get_database_name(tenant)
+                database = self._get_client()[name]
+                self._names[name] = self._names.get(name, 0) + 1
+            else:
+                database, name = handle[0], handle[2]
+
+            # The handles are kept in the order they were last used so
+            # that the idle ones are always at the front.
+            self._handles[tenant] = (database, now, name)
+            self._evict(now)
+
+        return database
+
+    def get_database_name(self, tenant):
+        """Returns the name of the database for a tenant.
+
+        :param tenant: the key of the tenant.
+        :type tenant: str
+        :returns: str -- the name.
+        """
+
+        if self.databases is None:
+            key = '{0}'.format(tenant)
+            if not self.key_pattern.match(key):
+                abort(404)
+            return self.database_name.format(key)
+
+        name = self.databases.get(tenant)
+        if name is None:
+            abort(404)
+        return name
+
+    def get_tenant(self):
+        """Returns the key of the current tenant.
+
+        The tenant set through :meth:`use` takes precedence. Otherwise
+        ``resolver`` is called once for each request.
+
+        :returns: str -- the key, or ``None`` if there isn't a tenant.
+        """
+
+        tenants = getattr(self._local, 'tenants', None)
+        if tenants:
+            return tenants[-1]
+
+        if self.resolver is None or not has_request_context():
+            return None
+
+        resolved = getattr(g, 'simon_tenants', None)
+        if resolved is None:
+            resolved = g.simon_tenants = {}
+        if self not in resolved:
+            resolved[self] = self.resolver()
+        return resolved[self]
+
+    def has_database(self, name):
+        """Returns whether a database belongs to one of the tenants with
+        a handle.
+
+        :param name: the name of the database.
+        :type name: str
+        :returns: bool
+        """
+
+        return name in self._names
+
+    def use(self, tenant):
+        """Uses a tenant's database within the block.
+
+        This is meant for work done outside of requests, such as
+        commands and background jobs.
+
+        .. code-block:: python
+
+            for tenant in tenants.databases:
+                with tenants.use(tenant):
+                    ensure_indexes()
+
+        :param tenant: the key of the tenant.
+        :type tenant: str
+        """
+
+        return _Using(self, tenant)
+
+    def _evict(self, now):
+        if self.idle_timeout is not None:
+            expired = now - self.idle_timeout
+            while self._handles:
+                tenant = next(iter(self._handles))
+                if self._handles[tenant][1] > expired:
+                    break
+                self._forget(self._handles.pop(tenant))
+
+        if self.max_databases is not None:
+            while len(self._handles) > self.max_databases:
+                self._forget(self._handles.popitem(last=False)[1])
+
+    def _forget(self, handle):
+        name = handle[2]
+        self._names[name] -= 1
+        if not self._names[name]:
+            del self._names[name]
+
+    def _get_client(self):
+        database = connection.get_database(self.alias)
+        if getattr(type(database), 'client', None) is None:
+            # PyMongo 2.x
+            return database.connection
+        return database.client
+
+    def __len__(self):
+        return len(self._handles)
+
+
+class _Using(object):
+    """Sets the tenant for the current thread."""
+
+    def __init__(self, registry, tenant):
+        self.registry = registry
+        self.tenant = tenant
+
+    def __enter__(self):
+        local = self.registry._local
+        if getattr(local, 'tenants', None) is None:
+            local.tenants = []
+        local.tenants.append(self.tenant)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.registry._local.tenants.pop()
+
+
+def from_header(name):
+    """Returns a resolver that uses the value of a request header.
+
+    :param name: the name of the header.
+    :type name: str
+    :returns: callable -- the resolver.
+
+    .. versionadded:: 0.4.0
+    """
+
+    return lambda: request.headers.get(name) or None
+
+
+def from_subdomain(domain=None):
+    """Returns a resolver that uses the subdomain of the request's host.
+
+    :param domain: (optional) the domain the subdomains belong to.
+                   Defaults to the ``SERVER_NAME`` setting, or to
+                   everything after the first label of the host if it
+                   isn't set.
+    :type domain: str
+    :returns: callable -- the resolver.
+
+    .. versionadded:: 0.4.0
+    """
+
+    def resolve():
+        host = request.host.split(':')[0].lower()
+        suffix = domain or current_app.config.get('SERVER_NAME')
+        if suffix:
+            suffix = '.' + suffix.split(':')[0].lower()
+            if not host.endswith(suffix):
+                return None
+            return host[:-len(suffix)] or None
+
+        if host.count('.') < 2:
+            return None
+        return host.split('.', 1)[0]
+
+    return resolve
+
+
+def from_view_arg(name='tenant'):
+    """Returns a resolver that uses a variable from the URL rule.
+
+    .. code-block:: python
+
+        @app.route('/<tenant>/entries')
+        def show_entries(tenant):
+            ...
+
+    :param name: (optional) the name of the variable.
+    :type name: str
+    :returns: callable -- the resolver.
+
+    .. versionadded:: 0.4.0
+    """
+
+    return lambda: (request.view_args or {}).get(name)
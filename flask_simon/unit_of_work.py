@@ -0,0 +1,280 @@
+"""Batching the writes made during a request"""
+
+import threading
+
+from bson.objectid import ObjectId
+try:
+    from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateOne
+    from pymongo.errors import BulkWriteError
+except ImportError:
+    # The bulk write API was added in PyMongo 2.9.
+    InsertOne = None
+
+__all__ = ('FlushError', 'UnitOfWork', 'supports_bulk_write')
+
+supports_bulk_write = InsertOne is not None
+
+
+class FlushError(Exception):
+    """Raised when writes fail while flushing a :class:`UnitOfWork`.
+
+    ``errors`` contains a ``(document, error)`` pair for each write that
+    failed, where ``document`` is the instance of the model that made
+    the write and ``error`` is the error reported by MongoDB. ``details``
+    contains the full results of the batches that failed.
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, message, errors, details=None):
+        super(FlushError, self).__init__(message)
+        self.errors = errors
+        self.details = details or []
+
+
+class UnitOfWork(object):
+    """Holds the writes made through models until they are flushed.
+
+    Writes are sent to the database with a single ``bulk_write`` for
+    each run of writes to the same collection, in the order they were
+    made. With ``ordered`` set, the first write that fails stops the
+    rest of the writes from being made.
+
+    Writes that change the instance based on the result (atomic updates
+    such as :meth:`~simon.Model.increment`) and any reads made through a
+    collection will flush the writes that are being held first, so that
+    they always see the documents as they would be without the unit of
+    work. So will writes with a write concern other than the
+    acknowledged one Simon uses by default (e.g., ``w=0`` or ``w=2``),
+    which are then made right away with their write concern.
+
+    Documents that changed are reported through :meth:`changed`, and
+    ``on_change`` is called for each of them once their writes have been
+    made. Documents whose writes were never sent to the database because
+    an earlier write failed aren't passed to ``on_change``.
+
+    :param ordered: (optional) whether or not the writes must be made
+                    in order.
+    :type ordered: bool
+    :param on_change: (optional) a callable to call with each document
+                      that changed and its ``_id``.
+    :type on_change: callable
+
+    .. versionadded:: 0.4.0
+    """
+
+    def __init__(self, ordered=True, on_change=None):
+        self.ordered = ordered
+        self.on_change = on_change
+
+        self._changes = []
+        self._operations = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def changed(self, document, id=None):
+        """Records that a document changed.
+
+        When writes are being held, ``on_change`` will be called once
+        they've been made. Otherwise it's called right away.
+
+        :param document: the instance of the model.
+        :type document: :class:`simon.Model`
+        :param id: (optional) the ``_id`` of the document.
+        """
+
+        with self._lock:
+            if self._operations:
+                # The document's writes are the last ones being held.
+                self._changes.append((len(self._operations), document, id))
+                return
+
+        if self.on_change is not None:
+            self.on_change(document, id)
+
+    def flush(self):
+        """Sends the writes to the database.
+
+        :raises: :class:`FlushError`
+        """
+
+        with self._lock:
+            operations, self._operations = self._operations, []
+            changes, self._changes = self._changes, []
+
+        errors = []
+        details = []
+
+        # The number of writes that were sent before the first one that
+        # stopped the rest from being made.
+        made = len(operations)
+
+        start = 0
+        while start < len(operations):
+            collection = operations[start][0]
+            end = start + 1
+            while end < len(operations) and operations[end][0] == collection:
+                end += 1
+            batch = operations[start:end]
+
+            try:
+                collection.bulk_write([o[1] for o in batch],
+                                      ordered=self.ordered)
+            except BulkWriteError as e:
+                details.append(e.details)
+                write_errors = e.details.get('writeErrors', ())
+                for error in write_errors:
+                    errors.append((batch[error['index']][2], error))
+                if self.ordered:
+                    if write_errors:
+                        made = start + write_errors[0]['index']
+                    else:
+                        made = start
+                    break
+
+            start = end
+
+        if self.on_change is not None:
+            for position, document, id in changes:
+                if position <= made:
+                    self.on_change(document, id)
+
+        if details:
+            message = '{0} write(s) failed while flushing.'.format(
+                len(errors))
+            raise FlushError(message, errors, details)
+
+    def holds(self, model):
+        """Returns whether or not writes made by a model's documents are
+        being held.
+
+        :param model: the model class.
+        :type model: :class:`simon.Model`
+        :returns: bool -- whether or not there are writes being held.
+        """
+
+        with self._lock:
+            return any(change[1].__class__ is model
+                       for change in self._changes)
+
+    def wrap(self, collection):
+        """Returns a version of a collection that holds its writes.
+
+        :param collection: the collection.
+        :type collection: :class:`~pymongo.collection.Collection`
+        :returns: the collection.
+        """
+
+        return _BufferedCollection(self, collection)
+
+    def writing(self, document):
+        """Marks the writes made within the block as being made by
+        ``document``.
+
+        :param document: the instance of the model.
+        :type document: :class:`simon.Model`
+        """
+
+        return _Writing(self, document)
+
+    def _add(self, collection, operation):
+        document = getattr(self._local, 'document', None)
+        with self._lock:
+            self._operations.append((collection, operation, document))
+
+    def __len__(self):
+        return len(self._operations)
+
+
+class _BufferedCollection(object):
+    """Holds the writes Simon makes through a collection."""
+
+    def __init__(self, work, collection):
+        self._work = work
+        self._collection = collection
+
+    def insert(self, doc_or_docs, **kwargs):
+        if not isinstance(doc_or_docs, dict) or not _can_hold(kwargs):
+            return self._flushed().insert(doc_or_docs, **kwargs)
+
+        # Simon expects to get the _id back right away, so generate it
+        # the same way PyMongo does.
+        if '_id' not in doc_or_docs:
+            doc_or_docs['_id'] = ObjectId()
+
+        self._work._add(self._collection, InsertOne(doc_or_docs))
+        return doc_or_docs['_id']
+
+    def remove(self, spec_or_id=None, multi=True, **kwargs):
+        if not _can_hold(kwargs):
+            return self._flushed().remove(spec_or_id, multi=multi, **kwargs)
+
+        if not isinstance(spec_or_id, dict):
+            spec_or_id = {'_id': spec_or_id}
+
+        if multi and not _is_single_id(spec_or_id):
+            operation = DeleteMany(spec_or_id)
+        else:
+            operation = DeleteOne(spec_or_id)
+        self._work._add(self._collection, operation)
+
+    def update(self, spec, document, upsert=False, multi=False, **kwargs):
+        if multi or not _can_hold(kwargs):
+            return self._flushed().update(spec, document, upsert=upsert,
+                                          multi=multi, **kwargs)
+
+        if any(k.startswith('$') for k in document):
+            operation = UpdateOne(spec, document, upsert=upsert)
+        else:
+            operation = ReplaceOne(spec, document, upsert=upsert)
+        self._work._add(self._collection, operation)
+
+    def _flushed(self):
+        self._work.flush()
+        return self._collection
+
+    def __getattr__(self, name):
+        # Everything else goes straight to the collection once the
+        # writes have been made.
+        return getattr(self._flushed(), name)
+
+
+def _can_hold(options):
+    """Returns whether a write can be held with the write concern in its
+    options.
+
+    The batches are sent with the collection's write concern, which is
+    acknowledged, so only acknowledged writes (``w=1`` or ``safe=True``,
+    which Simon passes by default) can be added to them.
+    """
+
+    w = options.get('w')
+    if w is not None:
+        return w == 1
+    safe = options.get('safe')
+    return safe is None or bool(safe)
+
+
+def _is_single_id(spec):
+    """Returns whether a spec matches a single document by its ``_id``."""
+
+    if set(spec) != set(['_id']):
+        return False
+    value = spec['_id']
+    return not (isinstance(value, dict) and
+                any(k.startswith('$') for k in value))
+
+
+class _Writing(object):
+    """Associates writes with the document that made them."""
+
+    def __init__(self, work, document):
+        self.work = work
+        self.document = document
+
+    def __enter__(self):
+        self.previous = getattr(self.work._local, 'document', None)
+        self.work._local.document = self.document
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.work._local.document = self.previous
@@ -14,7 +14,7 @@ setup(
     package_data={'': ['LICENSE', 'README.rst']},
     include_package_data=True,
     install_requires=['flask>=0.8', 'pymongo>=2.1', 'simon>=0.7'],
-    tests_require=['coverage', 'mock', 'nose'],
+    tests_require=['blinker', 'coverage', 'mock', 'nose'],
     license=open('LICENSE').read(),
     classifiers=[
         'Development Status :: 3 - Alpha',
@@ -0,0 +1,458 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from bson import BSON
+from bson.objectid import ObjectId
+from flask_simon.cache import (CountCache, DocumentCache, IdentityMap,
+                               ResponseCache, ResultCache, freeze)
+import mock
+
+
+class Document(object):
+    def __init__(self, **fields):
+        self._document = fields
+
+
+class TestCountCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = CountCache()
+        self.model = Document
+
+    def test_add(self):
+        """Test the `add()` method."""
+
+        self.cache.add(self.model, {'a': 1}, 5, 60)
+
+        self.assertEqual(self.cache.get(self.model, {'a': 1}), 5)
+        self.assertIsNone(self.cache.get(self.model, {'a': 2}))
+
+    def test_clear(self):
+        """Test the `clear()` method."""
+
+        self.cache.add(self.model, {'a': 1}, 5, 60)
+        self.cache.clear()
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_get_expired(self):
+        """Test that `get()` doesn't return expired counts."""
+
+        with mock.patch('time.time') as time:
+            time.return_value = 100
+            self.cache.add(self.model, {'a': 1}, 5, 60)
+
+            time.return_value = 161
+            self.assertIsNone(self.cache.get(self.model, {'a': 1}))
+            self.assertEqual(len(self.cache), 0)
+
+    def test_invalidate(self):
+        """Test the `invalidate()` method."""
+
+        other = mock.Mock()
+        self.cache.add(self.model, {'a': 1}, 5, 60)
+        self.cache.add(other, {'a': 1}, 6, 60)
+
+        self.cache.invalidate(self.model)
+
+        # The count should still be available until it's refreshed.
+        self.assertEqual(self.cache.peek(self.model, {'a': 1}), (5, True))
+
+        self.assertIsNone(self.cache.get(self.model, {'a': 1}))
+        self.assertEqual(self.cache.get(other, {'a': 1}), 6)
+
+    def test_peek(self):
+        """Test the `peek()` method."""
+
+        self.assertEqual(self.cache.peek(self.model, {'a': 1}), (None, True))
+
+        with mock.patch('time.time') as time:
+            time.return_value = 100
+            self.cache.add(self.model, {'a': 1}, 5, 60)
+
+            self.assertEqual(self.cache.peek(self.model, {'a': 1}),
+                             (5, False))
+
+            time.return_value = 161
+            self.assertEqual(self.cache.peek(self.model, {'a': 1}),
+                             (5, True))
+
+    def test_max_entries(self):
+        """Test that the least recently used counts are removed."""
+
+        self.cache.max_entries = 2
+
+        self.cache.add(self.model, {'a': 1}, 1, 60)
+        self.cache.add(self.model, {'a': 2}, 2, 60)
+        self.cache.get(self.model, {'a': 1})
+        self.cache.add(self.model, {'a': 3}, 3, 60)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get(self.model, {'a': 1}), 1)
+        self.assertIsNone(self.cache.get(self.model, {'a': 2}))
+
+        self.cache.peek(self.model, {'a': 3})
+        self.cache.add(self.model, {'a': 4}, 4, 60)
+
+        self.assertEqual(self.cache.peek(self.model, {'a': 3}), (3, False))
+        self.assertIsNone(self.cache.get(self.model, {'a': 1}))
+
+    def test_peek_stale(self):
+        """Test that `peek()` removes counts that are too old to use."""
+
+        with mock.patch('time.time') as time:
+            time.return_value = 100
+            self.cache.add(self.model, {'a': 1}, 5, 60)
+            self.cache.add(self.model, {'a': 2}, 6, 60)
+            self.cache.start_refresh(self.model, {'a': 2})
+
+            time.return_value = 220
+            self.assertEqual(self.cache.peek(self.model, {'a': 1}),
+                             (5, True))
+
+            time.return_value = 221
+            self.assertEqual(self.cache.peek(self.model, {'a': 1}),
+                             (None, True))
+
+            # Counts that are being refreshed are kept until they're
+            # added again.
+            self.assertEqual(self.cache.peek(self.model, {'a': 2}),
+                             (6, True))
+
+            self.assertEqual(len(self.cache), 1)
+
+    def test_start_refresh(self):
+        """Test the `start_refresh()` method."""
+
+        self.assertTrue(self.cache.start_refresh(self.model, {'a': 1}))
+        self.assertFalse(self.cache.start_refresh(self.model, {'a': 1}))
+        self.assertTrue(self.cache.start_refresh(self.model, {'a': 2}))
+
+        # Adding the count should finish the refresh.
+        self.cache.add(self.model, {'a': 1}, 5, 60)
+        self.assertTrue(self.cache.start_refresh(self.model, {'a': 1}))
+
+        self.cache.stop_refresh(self.model, {'a': 1})
+        self.assertTrue(self.cache.start_refresh(self.model, {'a': 1}))
+
+
+class TestDocumentCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = DocumentCache()
+
+        self.model = Document
+        self.id = ObjectId()
+        self.document = Document(_id=self.id, a=1)
+
+    def test_add(self):
+        """Test the `add()` method."""
+
+        self.cache.add(self.model, {'a': 1}, self.document, 60)
+
+        actual = self.cache.get(self.model, {'a': 1})
+        self.assertEqual(actual._document, self.document._document)
+        self.assertIsNot(actual, self.document)
+
+        actual = self.cache.get(self.model, {'_id': self.id})
+        self.assertEqual(actual._document, self.document._document)
+
+    def test_add_copy(self):
+        """Test that `add()` stores a copy of the document."""
+
+        self.cache.add(self.model, {'a': 1}, self.document, 60)
+        self.document._document['a'] = 2
+
+        actual = self.cache.get(self.model, {'a': 1})
+        self.assertEqual(actual._document['a'], 1)
+
+    def test_clear(self):
+        """Test the `clear()` method."""
+
+        self.cache.add(self.model, {'a': 1}, self.document, 60)
+        self.cache.clear()
+
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.size, 0)
+
+    def test_get(self):
+        """Test the `get()` method."""
+
+        self.assertIsNone(self.cache.get(self.model, {'a': 1}))
+        self.assertEqual(self.cache.misses, 1)
+
+        self.cache.add(self.model, {'a': 1}, self.document, 60)
+        self.cache.get(self.model, {'a': 1})
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_get_expired(self):
+        """Test that `get()` doesn't return expired documents."""
+
+        with mock.patch('time.time') as time:
+            time.return_value = 100
+            self.cache.add(self.model, {'a': 1}, self.document, 60)
+
+            time.return_value = 161
+            self.assertIsNone(self.cache.get(self.model, {'a': 1}))
+
+    def test_invalidate(self):
+        """Test the `invalidate()` method."""
+
+        other = Document(_id=ObjectId(), b=1)
+        self.cache.add(self.model, {'_id': self.id}, self.document, 60)
+        self.cache.add(self.model, {'b': 1}, other, 60)
+
+        self.cache.invalidate(self.model, self.id)
+
+        self.assertIsNone(self.cache.get(self.model, {'_id': self.id}))
+        self.assertIsNone(self.cache.get(self.model, {'b': 1}))
+        self.assertIsNotNone(
+            self.cache.get(self.model, {'_id': other._document['_id']}))
+
+        self.cache.invalidate(self.model)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_max_bytes(self):
+        """Test that `max_bytes` is enforced."""
+
+        self.cache.max_bytes = 100
+
+        for x in range(10):
+            document = Document(_id=ObjectId(), a=x)
+            self.cache.add(self.model, {'a': x}, document, 60)
+
+        self.assertTrue(self.cache.size <= 100)
+        self.assertIsNone(self.cache.get(self.model, {'a': 0}))
+        self.assertIsNotNone(self.cache.get(self.model, {'a': 9}))
+
+    def test_max_entries(self):
+        """Test that the least recently used entries are evicted."""
+
+        self.cache.max_entries = 4
+
+        first = Document(_id=ObjectId(), a=1)
+        second = Document(_id=ObjectId(), a=2)
+        third = Document(_id=ObjectId(), a=3)
+
+        self.cache.add(self.model, {'a': 1}, first, 60)
+        self.cache.add(self.model, {'a': 2}, second, 60)
+        self.cache.get(self.model, {'a': 1})
+        self.cache.add(self.model, {'a': 3}, third, 60)
+
+        self.assertEqual(len(self.cache), 4)
+        self.assertIsNotNone(self.cache.get(self.model, {'a': 1}))
+        self.assertIsNone(self.cache.get(self.model, {'a': 2}))
+
+    def test_size(self):
+        """Test that each document's size is only counted once."""
+
+        self.cache.add(self.model, {'a': 1}, self.document, 60)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.size,
+                         len(BSON.encode(self.document._document)))
+
+        self.cache.invalidate(self.model, self.id)
+        self.assertEqual(self.cache.size, 0)
+
+
+class TestIdentityMap(unittest.TestCase):
+    def setUp(self):
+        self.identity_map = IdentityMap()
+
+        self.model = mock.Mock()
+        self.document = mock.Mock()
+        self.document._document = {'_id': 1, 'a': 1}
+
+    def test_add(self):
+        """Test the `add()` method."""
+
+        self.identity_map.add(self.model, {'a': 1}, self.document)
+
+        self.assertIs(self.identity_map.get(self.model, {'a': 1}),
+                      self.document)
+        self.assertIs(self.identity_map.get(self.model, {'_id': 1}),
+                      self.document)
+
+    def test_clear(self):
+        """Test the `clear()` method."""
+
+        self.identity_map.add(self.model, {'a': 1}, self.document)
+        self.identity_map.clear()
+
+        self.assertEqual(len(self.identity_map), 0)
+
+    def test_get(self):
+        """Test the `get()` method."""
+
+        self.assertIsNone(self.identity_map.get(self.model, {'a': 1}))
+        self.assertEqual(self.identity_map.misses, 1)
+
+        self.identity_map.add(self.model, {'a': 1}, self.document)
+        self.identity_map.get(self.model, {'a': 1})
+        self.assertEqual(self.identity_map.hits, 1)
+
+    def test_invalidate(self):
+        """Test the `invalidate()` method."""
+
+        other = mock.Mock()
+        self.identity_map.add(self.model, {'a': 1}, self.document)
+        self.identity_map.add(other, {'a': 1}, self.document)
+
+        self.identity_map.invalidate(self.model)
+
+        self.assertIsNone(self.identity_map.get(self.model, {'a': 1}))
+        self.assertIs(self.identity_map.get(other, {'a': 1}), self.document)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache()
+
+    def test_add(self):
+        """Test the `add()` method."""
+
+        self.cache.add('/', ['entries'], 'a', 60)
+
+        self.assertEqual(self.cache.get('/'), 'a')
+        self.assertIsNone(self.cache.get('/other'))
+
+    def test_add_generation(self):
+        """Test that `add()` skips responses built during a change."""
+
+        generation = self.cache.generation
+        self.cache.invalidate('entries')
+        self.cache.add('/', ['entries'], 'a', 60, generation)
+
+        self.assertIsNone(self.cache.get('/'))
+
+        self.cache.add('/', ['entries'], 'a', 60, self.cache.generation)
+
+        self.assertEqual(self.cache.get('/'), 'a')
+
+    def test_add_max_entries(self):
+        """Test that the least recently used responses are removed."""
+
+        self.cache.max_entries = 2
+        self.cache.add('/a', ['entries'], 'a', 60)
+        self.cache.add('/b', ['entries'], 'b', 60)
+        self.cache.get('/a')
+        self.cache.add('/c', ['entries'], 'c', 60)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get('/b'))
+
+    def test_collections(self):
+        """Test the `collections()` method."""
+
+        self.cache.add('/a', ['entries'], 'a', 60)
+        self.cache.add('/b', ['entries', 'comments'], 'b', 60)
+
+        self.assertEqual(self.cache.collections(),
+                         set(['entries', 'comments']))
+
+    def test_get_expired(self):
+        """Test that `get()` doesn't return expired responses."""
+
+        with mock.patch('time.time') as time:
+            time.return_value = 100
+            self.cache.add('/', ['entries'], 'a', 60)
+
+            time.return_value = 161
+            self.assertIsNone(self.cache.get('/'))
+            self.assertEqual(len(self.cache), 0)
+
+    def test_invalidate(self):
+        """Test the `invalidate()` method."""
+
+        self.cache.add('/a', ['entries'], 'a', 60)
+        self.cache.add('/b', ['entries', 'comments'], 'b', 60)
+        self.cache.add('/c', ['users'], 'c', 60)
+
+        self.cache.invalidate('comments')
+
+        self.assertEqual(self.cache.get('/a'), 'a')
+        self.assertIsNone(self.cache.get('/b'))
+        self.assertEqual(self.cache.generation, 1)
+
+        self.cache.invalidate()
+
+        self.assertEqual(len(self.cache), 0)
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResultCache()
+        self.model = Document
+        self.results = [{'_id': 'a', 'total': 1}, {'_id': 'b', 'total': 2}]
+        self.size = len(BSON.encode({'results': self.results}))
+
+    def test_add(self):
+        """Test the `add()` method."""
+
+        self.cache.add(self.model, 'hash', self.results, 60)
+
+        self.assertIs(self.cache.get(self.model, 'hash'), self.results)
+        self.assertEqual(self.cache.size, self.size)
+
+        self.cache.add(self.model, 'hash', self.results, 60)
+        self.assertEqual(self.cache.size, self.size)
+
+        self.cache.clear()
+        self.assertEqual(self.cache.size, 0)
+
+    def test_get_expired(self):
+        """Test that expired results stop counting toward the size."""
+
+        with mock.patch('time.time') as time:
+            time.return_value = 100
+            self.cache.add(self.model, 'hash', self.results, 60)
+
+            time.return_value = 161
+            self.assertIsNone(self.cache.get(self.model, 'hash'))
+
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.size, 0)
+
+    def test_max_bytes(self):
+        """Test that the least recently used results are removed."""
+
+        self.cache.max_bytes = self.size * 2
+
+        self.cache.add(self.model, 'a', self.results, 60)
+        self.cache.add(self.model, 'b', self.results, 60)
+        self.cache.get(self.model, 'a')
+        self.cache.add(self.model, 'c', self.results, 60)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.size, self.size * 2)
+        self.assertIsNone(self.cache.get(self.model, 'b'))
+
+        # Results larger than the cache shouldn't be kept at all.
+        self.cache.add(self.model, 'd', self.results * 3, 60)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get(self.model, 'd'))
+
+    def test_max_entries(self):
+        """Test that `max_entries` is passed to the count cache."""
+
+        self.cache = ResultCache(max_entries=1)
+
+        self.cache.add(self.model, 'a', self.results, 60)
+        self.cache.add(self.model, 'b', self.results, 60)
+
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.size, self.size)
+        self.assertIsNone(self.cache.get(self.model, 'a'))
+
+
+class TestMiscellaneous(unittest.TestCase):
+    def test_freeze(self):
+        """Test the `freeze()` function."""
+
+        a = freeze({'a': 1, 'b': {'$in': [1, 2]}})
+        b = freeze({'b': {'$in': [1, 2]}, 'a': 1})
+
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
@@ -0,0 +1,123 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import threading
+
+from flask_simon.changes import ChangeWatcher
+import mock
+from pymongo.errors import OperationFailure
+
+
+class TestChangeWatcher(unittest.TestCase):
+    def setUp(self):
+        self.database = mock.MagicMock()
+        self.callback = mock.Mock()
+        self.collections = set(['entries'])
+
+        self.watcher = ChangeWatcher(lambda: self.database, self.callback,
+                                     lambda: self.collections)
+
+    def test_poll(self):
+        """Test the `poll()` method."""
+
+        self.database.command.return_value = {
+            'collections': {'entries': 'a', 'users': 'b'}}
+
+        self.watcher.poll()
+
+        self.database.command.assert_called_with('dbHash',
+                                                 collections=['entries'])
+        # Collections are reported the first time they're seen.
+        self.callback.assert_called_with('entries')
+
+        self.callback.reset_mock()
+        self.watcher.poll()
+
+        self.assertFalse(self.callback.called)
+
+        self.database.command.return_value = {
+            'collections': {'entries': 'c', 'users': 'b'}}
+        self.watcher.poll()
+
+        self.callback.assert_called_once_with('entries')
+
+    def test_poll_no_collections(self):
+        """Test that `poll()` doesn't hash the whole database."""
+
+        self.collections = set()
+
+        self.watcher.poll()
+
+        self.assertFalse(self.database.command.called)
+
+    def test_run_error(self):
+        """Test that errors are logged and the watcher keeps going."""
+
+        self.watcher.streaming = False
+        self.watcher.interval = 0
+        self.database.command.side_effect = [OperationFailure(''),
+                                             {'collections': {}}]
+
+        def stop(name):
+            self.watcher._stopped.set()
+        self.callback.side_effect = stop
+
+        with mock.patch('flask_simon.changes.logger') as logger:
+            self.watcher._run()
+
+        self.assertTrue(logger.exception.called)
+        self.callback.assert_called_with('entries')
+
+    def test_start(self):
+        """Test the `start()` and `stop()` methods."""
+
+        self.watcher.streaming = False
+        self.watcher.interval = 0.01
+
+        polled = threading.Event()
+
+        def command(*args, **kwargs):
+            polled.set()
+            return {'collections': {}}
+        self.database.command.side_effect = command
+
+        self.watcher.start()
+        self.assertTrue(polled.wait(5))
+        self.watcher.stop()
+
+        self.assertFalse(self.watcher._thread.is_alive())
+
+    def test_watch(self):
+        """Test the `watch()` method."""
+
+        stream = self.database.watch.return_value
+        stream.__enter__.return_value = stream
+        stream.alive = True
+        changes = [{'ns': {'db': 'test', 'coll': 'entries'}}, None,
+                   {'operationType': 'dropDatabase'}]
+
+        def try_next():
+            change = changes.pop(0)
+            if not changes:
+                stream.alive = False
+            return change
+        stream.try_next.side_effect = try_next
+
+        self.watcher.watch()
+
+        self.assertEqual(self.callback.call_args_list,
+                         [mock.call(None), mock.call('entries'),
+                          mock.call(None)])
+        self.assertTrue(stream.__exit__.called)
+
+    def test_watch_unsupported(self):
+        """Test that standalone servers fall back to polling."""
+
+        self.database.watch.side_effect = OperationFailure('')
+
+        self.watcher.watch()
+
+        self.assertFalse(self.watcher.streaming)
+        self.assertFalse(self.callback.called)
@@ -0,0 +1,93 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import threading
+import time
+
+from flask import Flask, g, request
+from flask_simon import read_preference, run_concurrently
+from flask_simon.read_preferences import Primary, get_read_preference
+
+
+class TestMiscellaneous(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask('test')
+        self.context = self.app.test_request_context('/?a=1')
+        self.context.push()
+
+    def tearDown(self):
+        self.context.pop()
+
+    def test_run_concurrently(self):
+        """Test the `run_concurrently()` function."""
+
+        def query(value):
+            def run():
+                time.sleep(0.05)
+                return value
+            return run
+
+        start = time.time()
+        results = run_concurrently(dict(
+            (str(i), query(i)) for i in range(4)))
+
+        self.assertEqual(results, {'0': 0, '1': 1, '2': 2, '3': 3})
+        self.assertLess(time.time() - start, 0.15)
+
+    def test_run_concurrently_context(self):
+        """Test that `run_concurrently()` makes the contexts available."""
+
+        g.value = 'g'
+        threads = set()
+
+        def query():
+            threads.add(threading.current_thread())
+            return g.value, request.args['a']
+
+        results = run_concurrently({'a': query, 'b': query})
+
+        self.assertEqual(results, {'a': ('g', '1'), 'b': ('g', '1')})
+        self.assertNotIn(threading.current_thread(), threads)
+
+        # The contexts should still be usable.
+        self.assertEqual(g.value, 'g')
+        self.assertEqual(request.args['a'], '1')
+
+    def test_run_concurrently_exception(self):
+        """Test that `run_concurrently()` raises exceptions."""
+
+        def query():
+            raise KeyError('a')
+
+        with self.assertRaises(KeyError):
+            run_concurrently({'a': query, 'b': lambda: 1})
+
+    def test_run_concurrently_max_workers(self):
+        """Test `run_concurrently()` with `max_workers`."""
+
+        threads = set()
+
+        def query():
+            threads.add(threading.current_thread())
+            time.sleep(0.01)
+
+        run_concurrently(dict((str(i), query) for i in range(6)),
+                         max_workers=2)
+
+        self.assertLessEqual(len(threads), 2)
+
+        with self.assertRaises(ValueError):
+            run_concurrently({'a': query}, max_workers=0)
+
+    @unittest.skipIf(Primary is None, 'requires PyMongo 3.0')
+    def test_run_concurrently_read_preference(self):
+        """Test that `run_concurrently()` uses the read preference."""
+
+        with read_preference('secondary') as preference:
+            results = run_concurrently({'a': get_read_preference,
+                                        'b': get_read_preference})
+
+        self.assertIs(results['a'], preference)
+        self.assertIs(results['b'], preference)
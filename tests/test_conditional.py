@@ -0,0 +1,103 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import datetime
+
+from flask import Flask, Response
+from flask_simon.conditional import (is_not_modified, make_etag,
+                                     not_modified_response, set_validators)
+
+A_DATETIME = datetime.datetime(2013, 7, 31, 12, 30, 15, 500)
+
+
+class TestMiscellaneous(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask('test')
+
+    def test_is_not_modified_etag(self):
+        """Test the `is_not_modified()` method with `If-None-Match`."""
+
+        headers = {'If-None-Match': 'W/"abc"'}
+        with self.app.test_request_context('/', headers=headers):
+            self.assertTrue(is_not_modified('abc'))
+            self.assertFalse(is_not_modified('def'))
+            self.assertFalse(is_not_modified())
+
+        headers = {'If-None-Match': '"abc", "def"'}
+        with self.app.test_request_context('/', headers=headers):
+            self.assertTrue(is_not_modified('def'))
+
+        headers = {'If-None-Match': '*'}
+        with self.app.test_request_context('/', headers=headers):
+            self.assertTrue(is_not_modified('abc'))
+
+    def test_is_not_modified_etag_precedence(self):
+        """Test that `If-None-Match` takes precedence."""
+
+        headers = {
+            'If-None-Match': '"def"',
+            'If-Modified-Since': 'Wed, 31 Jul 2013 12:30:15 GMT',
+        }
+        with self.app.test_request_context('/', headers=headers):
+            self.assertFalse(is_not_modified('abc', A_DATETIME))
+
+    def test_is_not_modified_method(self):
+        """Test that only `GET` and `HEAD` requests can be answered."""
+
+        headers = {'If-None-Match': '"abc"'}
+        for method in ('GET', 'HEAD'):
+            with self.app.test_request_context('/', method=method,
+                                               headers=headers):
+                self.assertTrue(is_not_modified('abc'))
+
+        with self.app.test_request_context('/', method='POST',
+                                           headers=headers):
+            self.assertFalse(is_not_modified('abc'))
+
+    def test_is_not_modified_since(self):
+        """Test the `is_not_modified()` method with
+        `If-Modified-Since`.
+        """
+
+        headers = {'If-Modified-Since': 'Wed, 31 Jul 2013 12:30:15 GMT'}
+        with self.app.test_request_context('/', headers=headers):
+            self.assertTrue(is_not_modified(last_modified=A_DATETIME))
+            self.assertTrue(is_not_modified(
+                last_modified=A_DATETIME - datetime.timedelta(days=1)))
+            self.assertFalse(is_not_modified(
+                last_modified=A_DATETIME + datetime.timedelta(seconds=1)))
+            self.assertFalse(is_not_modified('abc'))
+
+        with self.app.test_request_context('/'):
+            self.assertFalse(is_not_modified(last_modified=A_DATETIME))
+
+    def test_make_etag(self):
+        """Test the `make_etag()` method."""
+
+        etag = make_etag(1, A_DATETIME)
+
+        self.assertEqual(etag, make_etag(1, A_DATETIME))
+        self.assertNotEqual(etag, make_etag(2, A_DATETIME))
+        self.assertNotEqual(etag, make_etag(
+            1, A_DATETIME + datetime.timedelta(microseconds=1)))
+        self.assertNotEqual(make_etag(1, 1), make_etag(1, 2))
+
+    def test_not_modified_response(self):
+        """Test the `not_modified_response()` method."""
+
+        response = not_modified_response('abc', A_DATETIME)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], 'W/"abc"')
+        self.assertEqual(response.headers['Last-Modified'],
+                         'Wed, 31 Jul 2013 12:30:15 GMT')
+
+    def test_set_validators(self):
+        """Test the `set_validators()` method."""
+
+        response = set_validators(Response(), 'abc')
+
+        self.assertEqual(response.headers['ETag'], 'W/"abc"')
+        self.assertNotIn('Last-Modified', response.headers)
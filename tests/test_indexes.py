@@ -0,0 +1,137 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from flask_simon.indexes import compare_indexes, create_indexes, get_indexes
+import mock
+from pymongo import ASCENDING, DESCENDING
+from simon import Model
+
+
+class TestModel(Model):
+    class Meta:
+        collection = 'test'
+        field_map = {'id': '_id', 'name': 'n'}
+        indexes = [
+            'name',
+            ('-created', 'status'),
+            {'fields': 'email', 'unique': True},
+            ('location', '2dsphere'),
+        ]
+
+
+class TestMiscellaneous(unittest.TestCase):
+    def setUp(self):
+        self.db = TestModel._meta._db = mock.Mock()
+
+    def tearDown(self):
+        TestModel._meta._db = None
+
+    def test_compare_indexes(self):
+        """Test the `compare_indexes()` method."""
+
+        self.db.index_information.return_value = {
+            '_id_': {'key': [('_id', 1)]},
+            'n_1': {'key': [('n', 1.0)]},
+            'email_1': {'key': [('email', 1)], 'unique': True},
+            'old_1': {'key': [('old', 1)]},
+        }
+
+        actual = compare_indexes(TestModel)
+
+        self.assertEqual(actual, {
+            'missing': [[('created', DESCENDING), ('status', ASCENDING)],
+                        [('location', '2dsphere')]],
+            'extra': ['old_1'],
+        })
+
+    def test_compare_indexes_text(self):
+        """Test the `compare_indexes()` method with text indexes."""
+
+        class OtherModel(Model):
+            class Meta:
+                collection = 'other'
+                indexes = [[('title', 'text'), ('body', 'text')],
+                           ['status', ('name', 'text')]]
+
+        OtherModel._meta._db = self.db
+        self.db.index_information.return_value = {
+            '_id_': {'key': [('_id', 1)]},
+            'title_text_body_text': {
+                'key': [('_fts', 'text'), ('_ftsx', 1)],
+                'weights': {'body': 1, 'title': 1},
+            },
+            'status_1_name_text': {
+                'key': [('status', 1), ('_fts', 'text'), ('_ftsx', 1)],
+                'weights': {'summary': 1},
+            },
+        }
+
+        actual = compare_indexes(OtherModel)
+
+        self.assertEqual(actual, {
+            'missing': [[('status', ASCENDING), ('name', 'text')]],
+            'extra': ['status_1_name_text'],
+        })
+
+    def test_create_indexes(self):
+        """Test the `create_indexes()` method."""
+
+        self.db.create_index.side_effect = ['n_1', 'created_-1_status_1',
+                                            'email_1', 'location_2dsphere']
+
+        actual = create_indexes(TestModel)
+
+        self.assertEqual(actual, ['n_1', 'created_-1_status_1', 'email_1',
+                                  'location_2dsphere'])
+        self.assertEqual(self.db.create_index.call_args_list, [
+            mock.call([('n', ASCENDING)], background=True),
+            mock.call([('created', DESCENDING), ('status', ASCENDING)],
+                      background=True),
+            mock.call([('email', ASCENDING)], unique=True, background=True),
+            mock.call([('location', '2dsphere')], background=True),
+        ])
+
+    def test_create_indexes_foreground(self):
+        """Test the `create_indexes()` method with `background`."""
+
+        create_indexes(TestModel, background=False)
+
+        self.db.create_index.assert_any_call([('n', ASCENDING)],
+                                             background=False)
+
+    def test_get_indexes(self):
+        """Test the `get_indexes()` method."""
+
+        actual = get_indexes(TestModel)
+
+        self.assertEqual(actual, [
+            ([('n', ASCENDING)], {}),
+            ([('created', DESCENDING), ('status', ASCENDING)], {}),
+            ([('email', ASCENDING)], {'unique': True}),
+            ([('location', '2dsphere')], {}),
+        ])
+
+    def test_get_indexes_compound_typed(self):
+        """Test the `get_indexes()` method with compound typed indexes."""
+
+        class OtherModel(Model):
+            class Meta:
+                collection = 'other'
+                indexes = [[('location', '2d'), '-name']]
+
+        actual = get_indexes(OtherModel)
+
+        self.assertEqual(actual, [
+            ([('location', '2d'), ('name', DESCENDING)], {}),
+        ])
+
+    def test_get_indexes_none(self):
+        """Test the `get_indexes()` method without any indexes."""
+
+        class OtherModel(Model):
+            class Meta:
+                collection = 'other'
+
+        self.assertEqual(get_indexes(OtherModel), [])
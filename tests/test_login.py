@@ -0,0 +1,117 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from bson.objectid import ObjectId
+from flask import Flask
+from flask_simon import Model, Simon
+from flask_simon.login import UserLoader
+import mock
+
+AN_OBJECT_ID_STR = '50d4dce70ea5fae6fb84e44b'
+AN_OBJECT_ID = ObjectId(AN_OBJECT_ID_STR)
+
+
+class User(Model):
+    class Meta:
+        collection = 'users'
+        database = 'login'
+
+
+class TestUserLoader(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask('test')
+        with mock.patch('simon.connection.connect'):
+            Simon(self.app, alias='login')
+
+        self.context = self.app.test_request_context('/')
+        self.context.push()
+
+        self.cursor = mock.MagicMock()
+        self.cursor.limit.return_value = self.cursor
+        self.cursor.__iter__.side_effect = lambda: iter(
+            [{'_id': AN_OBJECT_ID, 'username': 'a'}])
+
+        self.db = User._meta._db = mock.Mock()
+        self.db.find.return_value = self.cursor
+
+    def tearDown(self):
+        User._meta._db = None
+        self.context.pop()
+
+    def test_call(self):
+        """Test calling the loader."""
+
+        loader = UserLoader(User, self.app, fields=('username',))
+
+        user = loader(AN_OBJECT_ID_STR)
+
+        self.assertEqual(user.id, AN_OBJECT_ID)
+        self.assertEqual(user.username, 'a')
+        self.db.find.assert_called_with({'_id': AN_OBJECT_ID},
+                                        {'username': 1})
+
+        # The user should be kept in memory.
+        loader(AN_OBJECT_ID_STR)
+        self.assertEqual(self.db.find.call_count, 1)
+
+    def test_call_invalid(self):
+        """Test that invalid IDs aren't looked up."""
+
+        loader = UserLoader(User, self.app)
+
+        self.assertIsNone(loader('abc'))
+        self.assertIsNone(loader(None))
+        self.assertFalse(self.db.find.called)
+
+    def test_call_missing(self):
+        """Test that missing users return `None`."""
+
+        self.cursor.__iter__.side_effect = lambda: iter([])
+        loader = UserLoader(User, self.app)
+
+        self.assertIsNone(loader(AN_OBJECT_ID_STR))
+        self.assertEqual(len(loader.cache._documents), 0)
+
+    def test_call_no_ttl(self):
+        """Test that users aren't kept without `ttl`."""
+
+        loader = UserLoader(User, self.app, ttl=0)
+
+        loader(AN_OBJECT_ID_STR)
+        loader(AN_OBJECT_ID_STR)
+
+        self.assertEqual(self.db.find.call_count, 2)
+
+    def test_call_tenants(self):
+        """Test that users aren't kept for databases with tenants."""
+
+        tenants = mock.Mock()
+        tenants.get_tenant.return_value = None
+        self.app.extensions['simon']['login'].tenants = tenants
+
+        loader = UserLoader(User, self.app)
+
+        loader(AN_OBJECT_ID_STR)
+        loader(AN_OBJECT_ID_STR)
+
+        self.assertEqual(self.db.find.call_count, 2)
+        self.assertEqual(len(loader.cache), 0)
+
+    def test_init_app_runtimeerror(self):
+        """Test that `init_app()` raises `RuntimeError`."""
+
+        with self.assertRaises(RuntimeError):
+            UserLoader(User, Flask('test'))
+
+    def test_save(self):
+        """Test that saving a user removes it from memory."""
+
+        loader = UserLoader(User, self.app)
+
+        user = loader(AN_OBJECT_ID_STR)
+        user.save()
+        loader(AN_OBJECT_ID_STR)
+
+        self.assertEqual(self.db.find.call_count, 2)
@@ -0,0 +1,256 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from flask import Flask
+from flask_simon import Simon
+from flask_simon import monitoring as simon_monitoring
+from flask_simon.monitoring import (CommandListener, PoolStats, QueryMetrics,
+                                    get_query_metrics, query_executed,
+                                    register_command_listener,
+                                    repeated_queries, request_queries,
+                                    slow_query)
+import mock
+
+requires_pymongo31 = unittest.skipIf(simon_monitoring.monitoring is None,
+                                     'requires PyMongo 3.1+')
+
+
+def make_event(request_id, command_name='find', collection='entries',
+               duration_micros=1000):
+    command = {command_name: collection}
+    return mock.Mock(request_id=request_id, command_name=command_name,
+                     command=command, database_name='test',
+                     duration_micros=duration_micros)
+
+
+@requires_pymongo31
+class TestCommandListener(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask('test')
+        self.app.config['MONGO_SLOW_QUERY_MS'] = 50
+        self.app.config['MONGO_REPEATED_QUERY_THRESHOLD'] = 2
+        with mock.patch('simon.connection.connect'):
+            with mock.patch('flask_simon.monitoring.'
+                            'register_command_listener'):
+                Simon(self.app)
+
+        self.context = self.app.test_request_context('/')
+        self.context.push()
+
+        self.listener = CommandListener()
+
+    def tearDown(self):
+        self.context.pop()
+
+    def execute(self, request_id, **kwargs):
+        event = make_event(request_id, **kwargs)
+        self.listener.started(event)
+        self.listener.succeeded(event)
+
+    def test_ignored(self):
+        """Test that connection commands aren't recorded."""
+
+        self.execute(1, command_name='ismaster', collection=1)
+
+        self.assertIsNone(get_query_metrics())
+
+    def test_no_context(self):
+        """Test that commands outside of a context aren't recorded."""
+
+        self.context.pop()
+        try:
+            self.execute(1)
+        finally:
+            self.context.push()
+
+        self.assertIsNone(get_query_metrics())
+
+    def test_query_executed(self):
+        """Test that commands are recorded."""
+
+        sent = []
+
+        def receiver(sender, query):
+            sent.append(query)
+
+        with query_executed.connected_to(receiver, self.app):
+            self.execute(1)
+            self.execute(2, command_name='insert', duration_micros=3000)
+
+        metrics = get_query_metrics()
+        self.assertEqual(metrics.count, 2)
+        self.assertEqual(metrics.total_time, 4.0)
+        self.assertEqual(metrics.slowest['command'], 'insert')
+        self.assertEqual(metrics.collections, {'entries': 1})
+
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(sent[0]['collection'], 'entries')
+
+    def test_repeated_queries(self):
+        """Test that repeated queries are detected."""
+
+        sent = []
+
+        def receiver(sender, collection, count):
+            sent.append((collection, count))
+
+        with repeated_queries.connected_to(receiver, self.app):
+            with mock.patch.object(simon_monitoring.logger,
+                                   'warning') as warning:
+                for x in range(5):
+                    self.execute(x)
+
+                self.assertEqual(warning.call_count, 1)
+
+        self.assertEqual(sent, [('entries', 3)])
+
+    def test_request_queries(self):
+        """Test that `request_queries` is sent after the request."""
+
+        sent = []
+
+        def receiver(sender, metrics):
+            sent.append(metrics)
+
+        with request_queries.connected_to(receiver, self.app):
+            with self.app.test_request_context('/'):
+                self.execute(1)
+                metrics = get_query_metrics()
+
+        self.assertEqual(sent, [metrics])
+
+    def test_slow_query(self):
+        """Test that slow queries are logged."""
+
+        sent = []
+
+        def receiver(sender, query):
+            sent.append(query)
+
+        with slow_query.connected_to(receiver, self.app):
+            with mock.patch.object(simon_monitoring.logger,
+                                   'warning') as warning:
+                self.execute(1, duration_micros=10000)
+                self.assertFalse(warning.called)
+
+                self.execute(2, duration_micros=60000)
+                self.assertTrue(warning.called)
+
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0]['duration'], 60.0)
+
+    def test_tenant_database(self):
+        """Test that commands for the tenants' databases are recorded."""
+
+        tenants = mock.Mock()
+        tenants.has_database.side_effect = lambda name: name == 'tenant_a'
+        self.app.extensions['simon']['default'].tenants = tenants
+
+        self.execute(1)
+        for request_id, database in ((2, 'tenant_a'), (3, 'tenant_b')):
+            event = make_event(request_id)
+            event.database_name = database
+            self.listener.started(event)
+            self.listener.succeeded(event)
+
+        self.assertEqual(get_query_metrics().count, 2)
+
+    def test_unmonitored_database(self):
+        """Test that commands for other databases aren't recorded."""
+
+        event = make_event(1)
+        event.database_name = 'other'
+        self.listener.started(event)
+        self.listener.succeeded(event)
+
+        self.assertIsNone(get_query_metrics())
+
+
+class TestPoolStats(unittest.TestCase):
+    def setUp(self):
+        self.stats = PoolStats({'maxPoolSize': 10})
+
+    def test_as_dict(self):
+        """Test the `as_dict()` method."""
+
+        self.stats.connection_created(mock.Mock())
+        self.stats.connection_created(mock.Mock())
+        self.stats.connection_checked_out(mock.Mock())
+
+        stats = self.stats.as_dict()
+
+        self.assertEqual(stats['maxPoolSize'], 10)
+        self.assertEqual(stats['open'], 2)
+        self.assertEqual(stats['in_use'], 1)
+        self.assertEqual(stats['available'], 1)
+
+    def test_checked_out(self):
+        """Test that connections are counted as they are checked out."""
+
+        self.stats.connection_checked_out(mock.Mock())
+        self.stats.connection_checked_out(mock.Mock())
+        self.stats.connection_checked_in(mock.Mock())
+
+        self.assertEqual(self.stats.checked_out, 1)
+        self.assertEqual(self.stats.max_checked_out, 2)
+
+    def test_check_out_failed(self):
+        """Test that failed check outs are counted."""
+
+        self.stats.connection_check_out_failed(mock.Mock(reason='timeout'))
+        self.stats.connection_check_out_failed(mock.Mock(reason='poolClosed'))
+
+        self.assertEqual(self.stats.check_out_failures, 2)
+        self.assertEqual(self.stats.wait_queue_timeouts, 1)
+
+    def test_closed(self):
+        """Test that closed connections are counted."""
+
+        self.stats.connection_created(mock.Mock())
+        self.stats.connection_closed(mock.Mock())
+
+        self.assertEqual(self.stats.as_dict()['open'], 0)
+
+
+class TestQueryMetrics(unittest.TestCase):
+    def test_add(self):
+        """Test the `add()` method."""
+
+        metrics = QueryMetrics()
+
+        query = {'command': 'find', 'collection': 'a', 'duration': 2.0}
+        self.assertEqual(metrics.add(query), 1)
+
+        query = {'command': 'insert', 'collection': 'a', 'duration': 1.0}
+        self.assertEqual(metrics.add(query), 1)
+
+        self.assertEqual(metrics.as_dict(), {
+            'count': 2,
+            'total_time': 3.0,
+            'slowest': {'command': 'find', 'collection': 'a',
+                        'duration': 2.0},
+            'collections': {'a': 1},
+        })
+
+
+class TestMiscellaneous(unittest.TestCase):
+    @requires_pymongo31
+    def test_register_command_listener(self):
+        """Test the `register_command_listener()` function."""
+
+        with mock.patch.object(simon_monitoring, '_command_listener', None):
+            with mock.patch('pymongo.monitoring.register') as register:
+                register_command_listener()
+                register_command_listener()
+
+                self.assertEqual(register.call_count, 1)
+
+    def test_register_command_listener_runtimeerror(self):
+        ("Test that `register_command_listener()` raises "
+         "`RuntimeError`.")
+
+        with mock.patch.object(simon_monitoring, 'monitoring', None):
+            with self.assertRaises(RuntimeError):
+                register_command_listener()
@@ -0,0 +1,142 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from flask_simon.query_plans import check_query_plan, query_shape
+import mock
+from simon import Model
+
+
+class TestModel(Model):
+    class Meta:
+        collection = 'test'
+
+
+def explanation(plan, examined=0, returned=0):
+    """Builds the output of `explain()` for MongoDB 3.0 or newer."""
+
+    return {
+        'queryPlanner': {'winningPlan': plan},
+        'executionStats': {
+            'totalDocsExamined': examined,
+            'nReturned': returned,
+        },
+    }
+
+
+class TestMiscellaneous(unittest.TestCase):
+    def test_check_query_plan(self):
+        """Test the `check_query_plan()` method."""
+
+        cursor = mock.Mock()
+        cursor.explain.return_value = explanation(
+            {'stage': 'COLLSCAN'}, examined=100, returned=1)
+
+        actual = check_query_plan(TestModel, {'a': 1}, cursor)
+
+        self.assertEqual(actual['model'], 'TestModel')
+        self.assertEqual(actual['collection'], 'test')
+        self.assertEqual(actual['shape'], {'a': '?'})
+        self.assertEqual(actual['reason'], 'collection scan')
+        self.assertEqual(actual['stage'], 'COLLSCAN')
+        self.assertEqual(actual['examined'], 100)
+        self.assertEqual(actual['returned'], 1)
+        self.assertIn('test_query_plans.py', actual['call_site'])
+        self.assertIn('test_check_query_plan', actual['call_site'])
+
+    def test_check_query_plan_index(self):
+        """Test the `check_query_plan()` method with an index."""
+
+        cursor = mock.Mock()
+        cursor.explain.return_value = explanation(
+            {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}},
+            examined=1, returned=1)
+
+        self.assertIsNone(check_query_plan(TestModel, {'a': 1}, cursor,
+                                           max_ratio=10))
+
+    def test_check_query_plan_inputstages(self):
+        """Test the `check_query_plan()` method with several inputs."""
+
+        cursor = mock.Mock()
+        cursor.explain.return_value = explanation({
+            'stage': 'SUBPLAN',
+            'inputStage': {
+                'stage': 'OR',
+                'inputStages': [{'stage': 'IXSCAN'}, {'stage': 'COLLSCAN'}],
+            },
+        })
+
+        actual = check_query_plan(TestModel, {'$or': [{'a': 1}, {'b': 2}]},
+                                  cursor)
+
+        self.assertEqual(actual['reason'], 'collection scan')
+        self.assertEqual(actual['stage'], 'SUBPLAN')
+
+    def test_check_query_plan_legacy(self):
+        """Test the `check_query_plan()` method with MongoDB 2.x."""
+
+        cursor = mock.Mock()
+        cursor.explain.return_value = {'cursor': 'BasicCursor',
+                                       'nscannedObjects': 5, 'n': 1}
+
+        actual = check_query_plan(TestModel, {'a': 1}, cursor)
+
+        self.assertEqual(actual['reason'], 'collection scan')
+        self.assertEqual(actual['examined'], 5)
+
+        cursor.explain.return_value = {'cursor': 'BtreeCursor a_1',
+                                       'nscannedObjects': 1, 'n': 1}
+
+        self.assertIsNone(check_query_plan(TestModel, {'a': 1}, cursor))
+
+    def test_check_query_plan_ratio(self):
+        """Test the `check_query_plan()` method with `max_ratio`."""
+
+        cursor = mock.Mock()
+        cursor.explain.return_value = explanation(
+            {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}},
+            examined=50, returned=2)
+
+        self.assertIsNone(check_query_plan(TestModel, {'a': 1}, cursor))
+        self.assertIsNone(check_query_plan(TestModel, {'a': 1}, cursor,
+                                           max_ratio=25))
+
+        actual = check_query_plan(TestModel, {'a': 1}, cursor, max_ratio=10)
+
+        self.assertEqual(actual['reason'],
+                         'examined 50 documents to return 2')
+        self.assertEqual(actual['stage'], 'FETCH')
+
+    def test_check_query_plan_ratio_none_returned(self):
+        """Test `max_ratio` with a query that returns nothing."""
+
+        cursor = mock.Mock()
+        cursor.explain.return_value = explanation(
+            {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}},
+            examined=11, returned=0)
+
+        actual = check_query_plan(TestModel, {'a': 1}, cursor, max_ratio=10)
+
+        self.assertEqual(actual['reason'],
+                         'examined 11 documents to return 0')
+
+    def test_query_shape(self):
+        """Test the `query_shape()` method."""
+
+        spec = {
+            'a': 1,
+            'b': {'$gt': 2, '$lt': 5},
+            'c.d': [1, 2],
+            '$or': [{'e': 'f'}, {'g': {'$in': [1, 2]}}],
+        }
+
+        actual = query_shape(spec)
+
+        self.assertEqual(actual, {
+            'a': '?',
+            'b': {'$gt': '?', '$lt': '?'},
+            'c.d': '?',
+            '$or': [{'e': '?'}, {'g': {'$in': '?'}}],
+        })
@@ -0,0 +1,85 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from flask_simon import read_preferences
+from flask_simon.read_preferences import (get_read_preference,
+                                          make_read_preference,
+                                          read_preference)
+import mock
+import pymongo
+
+requires_pymongo3 = unittest.skipIf(read_preferences.Primary is None,
+                                    'requires PyMongo 3.0+')
+requires_pymongo34 = unittest.skipIf(pymongo.version_tuple < (3, 4),
+                                     'requires PyMongo 3.4+')
+
+
+@requires_pymongo3
+class TestReadPreference(unittest.TestCase):
+    def test_context_manager(self):
+        """Test `read_preference` as a context manager."""
+
+        self.assertIsNone(get_read_preference())
+
+        with read_preference('secondary') as preference:
+            self.assertIs(get_read_preference(), preference)
+
+            with read_preference('nearest') as nested:
+                self.assertIs(get_read_preference(), nested)
+
+            self.assertIs(get_read_preference(), preference)
+
+        self.assertIsNone(get_read_preference())
+
+    def test_decorator(self):
+        """Test `read_preference` as a decorator."""
+
+        @read_preference('secondaryPreferred')
+        def view():
+            return get_read_preference()
+
+        self.assertIsInstance(view(), read_preferences.SecondaryPreferred)
+        self.assertIsNone(get_read_preference())
+
+
+class TestMiscellaneous(unittest.TestCase):
+    @requires_pymongo3
+    def test_make_read_preference(self):
+        """Test the `make_read_preference()` function."""
+
+        preference = make_read_preference('secondary_preferred',
+                                          tag_sets=[{'dc': 'ny'}])
+        self.assertIsInstance(preference, read_preferences.SecondaryPreferred)
+        self.assertEqual(preference.tag_sets, [{'dc': 'ny'}])
+
+        preference = make_read_preference('primary')
+        self.assertIsInstance(preference, read_preferences.Primary)
+
+        preference = make_read_preference(2)
+        self.assertIsInstance(preference, read_preferences.Secondary)
+
+    @requires_pymongo34
+    def test_make_read_preference_max_staleness(self):
+        """Test the `make_read_preference()` function with max staleness."""
+
+        preference = make_read_preference('nearest', max_staleness=120)
+        self.assertEqual(preference.max_staleness, 120)
+
+    @requires_pymongo3
+    def test_make_read_preference_valueerror(self):
+        """Test that `make_read_preference()` raises `ValueError`."""
+
+        with self.assertRaises(ValueError):
+            make_read_preference('tertiary')
+
+        with self.assertRaises(ValueError):
+            make_read_preference('primary', max_staleness=120)
+
+    def test_make_read_preference_runtimeerror(self):
+        """Test that `make_read_preference()` raises `RuntimeError`."""
+
+        with mock.patch.object(read_preferences, 'Primary', None):
+            with self.assertRaises(RuntimeError):
+                make_read_preference('secondary')
@@ -0,0 +1,224 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import datetime
+
+from flask import Flask, session
+from flask_simon import Simon
+from flask_simon.sessions import (MongoSessionInterface, _dumps,
+                                  _supports_crud_api)
+import mock
+
+A_SID = 'a' * 40
+
+
+class TestMongoSessionInterface(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask('test')
+        self.app.config['MONGO_DBNAME'] = 'sessions'
+        with mock.patch('simon.connection.connect'):
+            Simon(self.app)
+
+        self.collection = mock.MagicMock()
+        self.collection.find_one.return_value = None
+
+        patcher = mock.patch('flask_simon.sessions.connection.get_database')
+        get_database = patcher.start()
+        get_database.return_value = {'sessions': self.collection}
+        self.addCleanup(patcher.stop)
+
+        self.app.session_interface = MongoSessionInterface()
+        self.client = self.app.test_client()
+
+        @self.app.route('/')
+        def show():
+            return str(session.get('a'))
+
+        @self.app.route('/set')
+        def set():
+            session['a'] = 1
+            return ''
+
+        @self.app.route('/clear')
+        def clear():
+            session.clear()
+            return ''
+
+    def assertNotWritten(self):
+        for name in ('replace_one', 'update_one', 'update', 'delete_one',
+                     'remove'):
+            self.assertFalse(getattr(self.collection, name).called)
+
+    def replaced(self):
+        """Returns the document that was stored."""
+
+        if _supports_crud_api:
+            args, kwargs = self.collection.replace_one.call_args
+        else:
+            args, kwargs = self.collection.update.call_args
+
+        self.assertEqual(args[0], {'_id': args[1]['_id']})
+        self.assertEqual(kwargs, {'upsert': True})
+        return args[1]
+
+    def store(self, data, expiration=None):
+        if expiration is None:
+            expiration = (datetime.datetime.utcnow() +
+                          self.app.permanent_session_lifetime)
+
+        self.collection.find_one.return_value = {
+            '_id': A_SID,
+            'data': _dumps(data),
+            'expiration': expiration,
+        }
+        self.client.set_cookie('localhost', 'session', A_SID)
+
+    def test_cache(self):
+        """Test that sessions are kept in memory with `cache_ttl`."""
+
+        self.app.session_interface = MongoSessionInterface(cache_ttl=60)
+        self.store({'a': 1})
+
+        self.client.get('/')
+        response = self.client.get('/')
+
+        self.assertEqual(response.data.decode('utf-8'), '1')
+        self.assertEqual(self.collection.find_one.call_count, 1)
+
+        # Saving the session should update the memory.
+        self.client.get('/clear')
+        response = self.client.get('/')
+
+        self.assertEqual(response.data.decode('utf-8'), 'None')
+
+    def test_clear(self):
+        """Test that empty sessions are deleted."""
+
+        self.store({'a': 1})
+
+        response = self.client.get('/clear')
+
+        if _supports_crud_api:
+            self.collection.delete_one.assert_called_with({'_id': A_SID})
+        else:
+            self.collection.remove.assert_called_with({'_id': A_SID})
+        self.assertIn('session=;', response.headers['Set-Cookie'])
+        self.assertEqual(response.headers['Vary'], 'Cookie')
+
+    def test_clear_secure(self):
+        """Test that deleting the cookie keeps its attributes."""
+
+        self.app.config['SESSION_COOKIE_SECURE'] = True
+        self.store({'a': 1})
+
+        response = self.client.get('/clear')
+
+        self.assertIn('Secure', response.headers['Set-Cookie'])
+        self.assertIn('HttpOnly', response.headers['Set-Cookie'])
+
+    def test_create_index(self):
+        """Test that the TTL index is created."""
+
+        self.client.get('/set')
+        self.client.get('/set')
+
+        self.collection.create_index.assert_called_once_with(
+            'expiration', expireAfterSeconds=0)
+
+    def test_open_session(self):
+        """Test the `open_session()` method."""
+
+        self.store({'a': 1})
+
+        response = self.client.get('/')
+
+        self.assertEqual(response.data.decode('utf-8'), '1')
+        self.assertEqual(self.collection.find_one.call_args[0][0]['_id'],
+                         A_SID)
+
+        # Unmodified sessions shouldn't be written.
+        self.assertNotWritten()
+        self.assertNotIn('Set-Cookie', response.headers)
+
+    def test_open_session_invalid(self):
+        """Test that invalid session IDs aren't looked up."""
+
+        self.client.set_cookie('localhost', 'session', 'abc')
+
+        response = self.client.get('/')
+
+        self.assertEqual(response.data.decode('utf-8'), 'None')
+        self.assertFalse(self.collection.find_one.called)
+
+    def test_open_session_unknown(self):
+        """Test that unknown session IDs aren't reused."""
+
+        self.client.set_cookie('localhost', 'session', A_SID)
+
+        response = self.client.get('/set')
+
+        document = self.replaced()
+        self.assertNotEqual(document['_id'], A_SID)
+        self.assertIn('session={0}'.format(document['_id']),
+                      response.headers['Set-Cookie'])
+
+    def test_refresh(self):
+        """Test that sessions halfway to expiring are extended."""
+
+        self.store({'a': 1}, datetime.datetime.utcnow() +
+                   datetime.timedelta(days=1))
+
+        response = self.client.get('/')
+
+        if _supports_crud_api:
+            update = self.collection.update_one.call_args[0]
+        else:
+            update = self.collection.update.call_args[0]
+        self.assertEqual(update[0], {'_id': A_SID})
+        self.assertIn('expiration', update[1]['$set'])
+        self.assertIn('session={0}'.format(A_SID),
+                      response.headers['Set-Cookie'])
+
+    def test_runtimeerror(self):
+        """Test that `RuntimeError` is raised without Simon."""
+
+        app = Flask('test')
+
+        with self.assertRaises(RuntimeError):
+            MongoSessionInterface(database='other').get_collection(app)
+
+    def test_save_session(self):
+        """Test the `save_session()` method."""
+
+        response = self.client.get('/set')
+
+        cookie = response.headers['Set-Cookie']
+        sid = cookie.split(';')[0].split('=')[1]
+        self.assertEqual(len(sid), 40)
+
+        document = self.replaced()
+        self.assertEqual(document['_id'], sid)
+        self.assertIsInstance(document['expiration'], datetime.datetime)
+
+    def test_save_session_empty(self):
+        """Test that empty sessions aren't stored."""
+
+        response = self.client.get('/')
+
+        self.assertNotWritten()
+        self.assertNotIn('Set-Cookie', response.headers)
+        self.assertEqual(response.headers['Vary'], 'Cookie')
+
+    @unittest.skipUnless(hasattr(MongoSessionInterface, 'get_cookie_samesite'),
+                         'requires Flask 1.0')
+    def test_save_session_samesite(self):
+        """Test that `SESSION_COOKIE_SAMESITE` is used."""
+
+        self.app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+
+        response = self.client.get('/set')
+
+        self.assertIn('SameSite=Lax', response.headers['Set-Cookie'])
+        self.assertEqual(response.headers['Vary'], 'Cookie')
@@ -0,0 +1,75 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import datetime
+import json
+
+from bson.objectid import ObjectId
+from flask_simon.streaming import JSONEncoder, iter_json, iter_ndjson
+
+AN_OBJECT_ID_STR = '50d4dce70ea5fae6fb84e44b'
+AN_OBJECT_ID = ObjectId(AN_OBJECT_ID_STR)
+
+
+class TestJSONEncoder(unittest.TestCase):
+    def test_encode(self):
+        """Test the `encode()` method."""
+
+        document = {
+            '_id': AN_OBJECT_ID,
+            'created': datetime.datetime(2013, 7, 31, 12, 30),
+            'date': datetime.date(2013, 7, 31),
+        }
+
+        actual = json.loads(JSONEncoder().encode(document))
+
+        self.assertEqual(actual, {
+            '_id': AN_OBJECT_ID_STR,
+            'created': '2013-07-31T12:30:00',
+            'date': '2013-07-31',
+        })
+
+    def test_encode_compact(self):
+        """Test that `encode()` leaves out extra whitespace."""
+
+        self.assertEqual(JSONEncoder().encode({'a': [1, 2]}), '{"a":[1,2]}')
+
+    def test_encode_typeerror(self):
+        """Test that `encode()` raises `TypeError`."""
+
+        with self.assertRaises(TypeError):
+            JSONEncoder().encode({'a': object()})
+
+
+class TestMiscellaneous(unittest.TestCase):
+    def test_iter_json(self):
+        """Test the `iter_json()` function."""
+
+        documents = ({'a': i} for i in range(5))
+
+        chunks = list(iter_json(documents, batch_size=2))
+
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(json.loads(''.join(chunks)),
+                         [{'a': i} for i in range(5)])
+
+    def test_iter_json_empty(self):
+        """Test `iter_json()` without any documents."""
+
+        self.assertEqual(''.join(iter_json([])), '[]')
+
+    def test_iter_ndjson(self):
+        """Test the `iter_ndjson()` function."""
+
+        documents = ({'a': i} for i in range(3))
+
+        chunks = list(iter_ndjson(documents, batch_size=2))
+
+        self.assertEqual(chunks, ['{"a":0}\n{"a":1}\n', '{"a":2}\n'])
+
+    def test_iter_ndjson_empty(self):
+        """Test `iter_ndjson()` without any documents."""
+
+        self.assertEqual(list(iter_ndjson([])), [])
@@ -0,0 +1,347 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from flask import Flask
+from flask_simon import Model, Simon
+from flask_simon.tenants import (TenantRegistry, from_header, from_subdomain,
+                                 from_view_arg)
+import mock
+from werkzeug.exceptions import NotFound
+
+
+class Client(object):
+    """Creates a mock database for each name."""
+
+    def __init__(self):
+        self.databases = {}
+
+    def __getitem__(self, name):
+        if name not in self.databases:
+            self.databases[name] = mock.MagicMock(name=name)
+        return self.databases[name]
+
+
+class Database(object):
+    """Stands in for the database Simon connected to."""
+
+    def __init__(self, client):
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client
+
+
+class TestModel(Model):
+    class Meta:
+        collection = 'entries'
+        database = 'tenants'
+
+
+class TestTenantRegistry(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask('test')
+        self.app.config['MONGO_DBNAME'] = 'tenants'
+        with mock.patch('simon.connection.connect'):
+            Simon(self.app)
+
+        self.client = Client()
+        patcher = mock.patch('flask_simon.tenants.connection.get_database')
+        get_database = patcher.start()
+        get_database.return_value = Database(self.client)
+        self.addCleanup(patcher.stop)
+
+        self.default = TestModel._meta._db = mock.Mock()
+
+    def tearDown(self):
+        TestModel._meta._db = None
+
+    def test_get_database(self):
+        """Test the `get_database()` method."""
+
+        tenants = TenantRegistry(self.app, database_name='tenant_{0}')
+
+        database = tenants.get_database('acme')
+
+        self.assertIs(database, self.client['tenant_acme'])
+        self.assertIs(tenants.get_database('acme'), database)
+        self.assertEqual(len(tenants), 1)
+
+    def test_get_database_databases(self):
+        """Test the `get_database()` method with `databases`."""
+
+        tenants = TenantRegistry(self.app, databases={'acme': 'acme_prod'})
+
+        with self.app.test_request_context('/'):
+            self.assertIs(tenants.get_database('acme'),
+                          self.client['acme_prod'])
+
+            with self.assertRaises(NotFound):
+                tenants.get_database('other')
+
+    def test_get_database_invalid_key(self):
+        """Test that keys that don't match `key_pattern` are aborted."""
+
+        tenants = TenantRegistry(self.app, database_name='tenant_{0}')
+
+        for key in ('', 'Acme', 'a.b', 'a b', 'acme\n', '../admin', 'a' * 33):
+            with self.assertRaises(NotFound):
+                tenants.get_database(key)
+
+        self.assertEqual(self.client.databases, {})
+
+        tenants = TenantRegistry(self.app, database_name='tenant_{0}',
+                                 key_pattern='[A-Z]+')
+
+        self.assertIs(tenants.get_database('ACME'),
+                      self.client['tenant_ACME'])
+        with self.assertRaises(NotFound):
+            tenants.get_database('ACME1')
+
+    def test_get_database_idle_timeout(self):
+        """Test that idle databases are thrown away."""
+
+        tenants = TenantRegistry(self.app, database_name='tenant_{0}',
+                                 idle_timeout=60)
+
+        with mock.patch('time.time') as time:
+            time.return_value = 100
+            tenants.get_database('a')
+            time.return_value = 130
+            tenants.get_database('b')
+
+            self.assertEqual(len(tenants), 2)
+
+            time.return_value = 170
+            tenants.get_database('c')
+
+            self.assertEqual(list(tenants._handles), ['b', 'c'])
+            self.assertFalse(tenants.has_database('tenant_a'))
+
+    def test_get_database_max_databases(self):
+        """Test that the least recently used databases are thrown away."""
+
+        tenants = TenantRegistry(self.app, database_name='tenant_{0}',
+                                 max_databases=2)
+
+        tenants.get_database('a')
+        tenants.get_database('b')
+        tenants.get_database('a')
+        tenants.get_database('c')
+
+        self.assertEqual(list(tenants._handles), ['a', 'c'])
+        self.assertFalse(tenants.has_database('tenant_b'))
+        self.assertTrue(tenants.has_database('tenant_c'))
+
+    def test_get_tenant(self):
+        """Test the `get_tenant()` method."""
+
+        resolver = mock.Mock(return_value='acme')
+        tenants = TenantRegistry(self.app, resolver=resolver,
+                                 database_name='tenant_{0}')
+
+        self.assertIsNone(tenants.get_tenant())
+
+        with self.app.test_request_context('/'):
+            self.assertEqual(tenants.get_tenant(), 'acme')
+            self.assertEqual(tenants.get_tenant(), 'acme')
+
+        # The resolver should only be called once for each request.
+        self.assertEqual(resolver.call_count, 1)
+
+    def test_has_database(self):
+        """Test the `has_database()` method."""
+
+        tenants = TenantRegistry(self.app, databases={
+            'a': 'shared', 'b': 'shared', 'c': 'other'}, max_databases=2)
+
+        tenants.get_database('a')
+        tenants.get_database('b')
+
+        self.assertTrue(tenants.has_database('shared'))
+        self.assertFalse(tenants.has_database('other'))
+        self.assertFalse(tenants.has_database('tenants'))
+
+        # Names are forgotten along with the last handle using them.
+        tenants.get_database('c')
+
+        self.assertTrue(tenants.has_database('shared'))
+        self.assertTrue(tenants.has_database('other'))
+
+        tenants.clear()
+
+        self.assertFalse(tenants.has_database('shared'))
+        self.assertFalse(tenants.has_database('other'))
+
+    def test_init_valueerror(self):
+        """Test that `__init__()` raises `ValueError`."""
+
+        with self.assertRaises(ValueError):
+            TenantRegistry(self.app)
+
+        with self.assertRaises(ValueError):
+            TenantRegistry(self.app, database_name='{0}')
+
+    def test_init_app_runtimeerror(self):
+        """Test that `init_app()` raises `RuntimeError`."""
+
+        with self.assertRaises(RuntimeError):
+            TenantRegistry(Flask('test'), database_name='tenant_{0}')
+
+    def test_model(self):
+        """Test that models use the tenant's database."""
+
+        tenants = TenantRegistry(self.app, resolver=from_view_arg(),
+                                 database_name='tenant_{0}')
+
+        @self.app.route('/<tenant>/<int:a>')
+        def show(tenant, a):
+            TestModel.get(a=a)
+            return ''
+
+        collection = self.client['tenant_acme']['entries']
+        cursor = collection.find.return_value.limit.return_value
+        cursor.__iter__.side_effect = lambda: iter([{'a': 1}])
+
+        self.app.test_client().get('/acme/1')
+
+        collection.find.assert_called_with({'a': 1})
+        self.assertFalse(self.default.find.called)
+
+        # Without a tenant, the model's own database should be used.
+        with self.app.test_request_context('/'):
+            self.assertIs(TestModel._meta.db, self.default)
+
+        self.assertEqual(len(tenants), 1)
+
+    def test_model_hostile_header(self):
+        """Test that keys from a header can't reach other databases."""
+
+        TenantRegistry(self.app, resolver=from_header('X-Tenant'),
+                       database_name='tenant_{0}')
+
+        @self.app.route('/<int:a>')
+        def show(a):
+            TestModel.get(a=a)
+            return ''
+
+        client = self.app.test_client()
+        for key in ('../admin', 'admin.system', 'acme$cmd', 'acme\x00'):
+            response = client.get('/1', headers={'X-Tenant': key})
+            self.assertEqual(response.status_code, 404)
+
+        self.assertEqual(self.client.databases, {})
+        self.assertFalse(self.default.find.called)
+
+        # A key that matches only ever gets the prefix.
+        collection = self.client['tenant_admin']['entries']
+        cursor = collection.find.return_value.limit.return_value
+        cursor.__iter__.side_effect = lambda: iter([{'a': 1}])
+
+        response = client.get('/1', headers={'X-Tenant': 'admin'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.client.databases), ['tenant_admin'])
+
+    def test_model_document_cache(self):
+        """Test that the document cache isn't used with tenants."""
+
+        self.app.config['MONGO_CACHE_ENABLED'] = True
+        self.app.config['MONGO_CACHE_TTL'] = 60
+        with mock.patch('simon.connection.connect'):
+            Simon(self.app)
+        TenantRegistry(self.app, resolver=lambda: 'acme',
+                       database_name='tenant_{0}')
+
+        collection = self.client['tenant_acme']['entries']
+        cursor = collection.find.return_value.limit.return_value
+        cursor.__iter__.side_effect = lambda: iter([{'a': 1}])
+
+        with self.app.test_request_context('/'):
+            TestModel.get(a=1)
+        with self.app.test_request_context('/'):
+            TestModel.get(a=1)
+
+        self.assertEqual(collection.find.call_count, 2)
+
+    def test_use(self):
+        """Test the `use()` method."""
+
+        tenants = TenantRegistry(self.app, resolver=lambda: 'acme',
+                                 database_name='tenant_{0}')
+
+        with tenants.use('other'):
+            self.assertEqual(tenants.get_tenant(), 'other')
+
+            with tenants.use('third'):
+                self.assertEqual(tenants.get_tenant(), 'third')
+
+            with self.app.test_request_context('/'):
+                self.assertIs(TestModel._meta.db,
+                              self.client['tenant_other']['entries'])
+
+        self.assertIsNone(tenants.get_tenant())
+
+
+class TestMiscellaneous(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask('test')
+
+    def test_from_header(self):
+        """Test the `from_header()` method."""
+
+        resolver = from_header('X-Tenant')
+
+        with self.app.test_request_context('/',
+                                           headers={'X-Tenant': 'acme'}):
+            self.assertEqual(resolver(), 'acme')
+
+        with self.app.test_request_context('/'):
+            self.assertIsNone(resolver())
+
+    def test_from_subdomain(self):
+        """Test the `from_subdomain()` method."""
+
+        resolver = from_subdomain()
+
+        with self.app.test_request_context(
+                '/', base_url='http://acme.example.com:5000'):
+            self.assertEqual(resolver(), 'acme')
+
+        with self.app.test_request_context(
+                '/', base_url='http://example.com'):
+            self.assertIsNone(resolver())
+
+    def test_from_subdomain_domain(self):
+        """Test the `from_subdomain()` method with `domain`."""
+
+        resolver = from_subdomain('app.example.com')
+
+        with self.app.test_request_context(
+                '/', base_url='http://acme.app.example.com'):
+            self.assertEqual(resolver(), 'acme')
+
+        with self.app.test_request_context(
+                '/', base_url='http://app.example.com'):
+            self.assertIsNone(resolver())
+
+        with self.app.test_request_context(
+                '/', base_url='http://acme.example.org'):
+            self.assertIsNone(resolver())
+
+    def test_from_view_arg(self):
+        """Test the `from_view_arg()` method."""
+
+        @self.app.route('/<org>/')
+        def show(org):
+            return ''
+
+        resolver = from_view_arg('org')
+
+        with self.app.test_request_context('/acme/'):
+            self.assertEqual(resolver(), 'acme')
+
+        with self.app.test_request_context('/'):
+            self.assertIsNone(resolver())
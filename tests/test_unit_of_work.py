@@ -0,0 +1,239 @@
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from bson.objectid import ObjectId
+from flask_simon.unit_of_work import (FlushError, UnitOfWork,
+                                      supports_bulk_write)
+import mock
+
+if supports_bulk_write:
+    from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateOne
+    from pymongo.errors import BulkWriteError
+
+AN_OBJECT_ID = ObjectId('50d4dce70ea5fae6fb84e44b')
+
+skip_without_bulk_write = unittest.skipUnless(supports_bulk_write,
+                                              'requires PyMongo 2.9')
+
+
+def operations(collection):
+    """Returns the operations sent to each call of `bulk_write()`."""
+
+    # The operations in older versions of PyMongo don't define __ne__.
+    return [[repr(o) for o in call[0][0]]
+            for call in collection.bulk_write.call_args_list]
+
+
+class Collection(object):
+    """Stands in for a collection that can delete documents by `_id`."""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            matched = [d for d in self.documents
+                       if self._matches(d, request._filter)]
+            if isinstance(request, DeleteOne):
+                matched = matched[:1]
+            for document in matched:
+                self.documents.remove(document)
+
+    def _matches(self, document, spec):
+        value = spec['_id']
+        if isinstance(value, dict):
+            return document['_id'] in value['$in']
+        return document['_id'] == value
+
+
+@skip_without_bulk_write
+class TestUnitOfWork(unittest.TestCase):
+    def setUp(self):
+        self.work = UnitOfWork()
+        self.collection = mock.Mock()
+        self.wrapped = self.work.wrap(self.collection)
+
+    def test_changed(self):
+        """Test the `changed()` method."""
+
+        self.work.on_change = mock.Mock()
+        document = mock.Mock()
+
+        # Without any writes being held, there's nothing to wait for.
+        self.work.changed(document, 1)
+        self.work.on_change.assert_called_once_with(document, 1)
+        self.work.on_change.reset_mock()
+
+        with self.work.writing(document):
+            self.wrapped.insert({'_id': 1})
+        self.work.changed(document, 1)
+
+        self.assertTrue(self.work.holds(document.__class__))
+        self.assertFalse(self.work.on_change.called)
+
+        self.work.flush()
+
+        self.work.on_change.assert_called_once_with(document, 1)
+        self.assertFalse(self.work.holds(document.__class__))
+
+    def test_changed_flusherror(self):
+        """Test that `on_change` skips writes that weren't made."""
+
+        self.work.on_change = mock.Mock()
+        documents = [mock.Mock(), mock.Mock(), mock.Mock()]
+        for id, document in enumerate(documents):
+            with self.work.writing(document):
+                self.wrapped.insert({'_id': id})
+            self.work.changed(document, id)
+
+        error = {'index': 1, 'code': 11000, 'errmsg': 'duplicate key'}
+        self.collection.bulk_write.side_effect = BulkWriteError(
+            {'writeErrors': [error]})
+
+        with self.assertRaises(FlushError):
+            self.work.flush()
+
+        self.work.on_change.assert_called_once_with(documents[0], 0)
+
+    def test_flush(self):
+        """Test the `flush()` method."""
+
+        other = mock.Mock()
+
+        self.wrapped.insert({'_id': 1})
+        self.wrapped.update({'_id': 1}, {'$set': {'a': 1}})
+        self.work.wrap(other).remove({'_id': 1})
+        self.wrapped.update({'_id': 1}, {'a': 2}, upsert=True)
+
+        self.assertEqual(len(self.work), 4)
+        self.assertFalse(self.collection.bulk_write.called)
+
+        self.work.flush()
+
+        self.assertEqual(operations(self.collection), [
+            [repr(InsertOne({'_id': 1})),
+             repr(UpdateOne({'_id': 1}, {'$set': {'a': 1}}))],
+            [repr(ReplaceOne({'_id': 1}, {'a': 2}, upsert=True))],
+        ])
+        self.assertEqual(operations(other), [[repr(DeleteOne({'_id': 1}))]])
+        self.collection.bulk_write.assert_called_with(mock.ANY, ordered=True)
+        self.assertEqual(len(self.work), 0)
+
+    def test_flush_flusherror(self):
+        """Test that `flush()` raises `FlushError`."""
+
+        documents = [mock.Mock(), mock.Mock()]
+        for document in documents:
+            with self.work.writing(document):
+                self.wrapped.insert({})
+
+        error = {'index': 1, 'code': 11000, 'errmsg': 'duplicate key'}
+        details = {'writeErrors': [error]}
+        self.collection.bulk_write.side_effect = BulkWriteError(details)
+
+        with self.assertRaises(FlushError) as e:
+            self.work.flush()
+
+        self.assertEqual(e.exception.errors, [(documents[1], error)])
+        self.assertEqual(e.exception.details, [details])
+
+    def test_flush_ordered(self):
+        """Test that `flush()` stops after a failed batch when ordered."""
+
+        other = mock.Mock()
+
+        self.wrapped.insert({})
+        self.work.wrap(other).insert({})
+
+        self.collection.bulk_write.side_effect = BulkWriteError({})
+
+        with self.assertRaises(FlushError):
+            self.work.flush()
+
+        self.assertFalse(other.bulk_write.called)
+
+        # Unordered writes should keep going.
+        self.work.ordered = False
+        self.wrapped.insert({})
+        self.work.wrap(other).insert({})
+
+        with self.assertRaises(FlushError):
+            self.work.flush()
+
+        self.assertTrue(other.bulk_write.called)
+
+    def test_insert(self):
+        """Test that `insert()` returns the `_id`."""
+
+        self.assertEqual(self.wrapped.insert({'_id': AN_OBJECT_ID}),
+                         AN_OBJECT_ID)
+
+        document = {}
+        id = self.wrapped.insert(document)
+
+        self.assertIsInstance(id, ObjectId)
+        self.assertEqual(document['_id'], id)
+
+    def test_read(self):
+        """Test that reading from the collection flushes the writes."""
+
+        self.wrapped.insert({})
+        self.wrapped.find_one({'_id': 1})
+
+        self.assertTrue(self.collection.bulk_write.called)
+        self.collection.find_one.assert_called_with({'_id': 1})
+
+    def test_remove(self):
+        """Test the `remove()` method."""
+
+        self.wrapped.remove({'a': 1})
+        self.wrapped.remove(AN_OBJECT_ID)
+        self.work.flush()
+
+        self.assertEqual(operations(self.collection), [
+            [repr(DeleteMany({'a': 1})),
+             repr(DeleteOne({'_id': AN_OBJECT_ID}))],
+        ])
+
+    def test_remove_many_ids(self):
+        """Test that removing by more than one `_id` removes them all."""
+
+        ids = [ObjectId() for _ in range(3)]
+        collection = Collection([{'_id': id} for id in ids])
+        wrapped = self.work.wrap(collection)
+
+        wrapped.remove({'_id': {'$in': ids[:2]}})
+        self.work.flush()
+
+        self.assertEqual(collection.documents, [{'_id': ids[2]}])
+
+        wrapped.remove({'_id': {'$in': ids}}, multi=False)
+        self.work.flush()
+
+        self.assertEqual(collection.documents, [])
+
+    def test_write_concern(self):
+        """Test that writes with other write concerns aren't held."""
+
+        self.wrapped.insert({'_id': 1}, w=1)
+        self.wrapped.update({'_id': 1}, {'$set': {'a': 1}}, safe=True)
+
+        self.assertEqual(len(self.work), 2)
+
+        self.wrapped.remove({'_id': 1}, w=0)
+
+        self.assertEqual(len(self.work), 0)
+        self.assertTrue(self.collection.bulk_write.called)
+        self.collection.remove.assert_called_with({'_id': 1}, multi=True,
+                                                  w=0)
+
+        self.wrapped.insert({'_id': 2}, safe=False)
+        self.wrapped.update({'_id': 2}, {'a': 2}, w='majority')
+
+        self.assertEqual(len(self.work), 0)
+        self.collection.insert.assert_called_with({'_id': 2}, safe=False)
+        self.collection.update.assert_called_with({'_id': 2}, {'a': 2},
+                                                  upsert=False, multi=False,
+                                                  w='majority')